@@ -11,8 +11,11 @@ from dotenv import load_dotenv
 # Load environment variables
 load_dotenv()
 
-# Configure logging
-logging.basicConfig(level=logging.DEBUG)
+# Configure logging: JSON lines written off the request path
+from utils.logging_config import configure_logging
+configure_logging()
+
+logger = logging.getLogger(__name__)
 
 def create_app():
     """Application factory pattern for creating Flask app"""
@@ -27,9 +30,57 @@ def create_app():
         init_db()
     
     # Register blueprints
-    from routes.user_routes import user_bp
+    from routes.user_routes import user_bp, user_service
     app.register_blueprint(user_bp)
     
+    # Optionally start from a snapshot written by `init_db.py seed --snapshot`,
+    # loaded into the store that serves requests (rows already present are skipped)
+    snapshot_path = os.environ.get('DATABASE_SNAPSHOT')
+    if snapshot_path and not app.config.get('TESTING', False):
+        from models.seed import load_chunks, read_snapshot
+        count = load_chunks(user_service.db, read_snapshot(snapshot_path))
+        logger.info("Loaded %s users from snapshot %s", count, snapshot_path)
+    
+    # Request ids for log correlation, bound before any other hook logs
+    from utils.logging_config import init_logging
+    init_logging(app)
+    
+    # Request metrics and the /metrics endpoint
+    from utils.metrics import init_metrics
+    init_metrics(app, db=user_service.db)
+    
+    # Per-layer timing spans (no-op unless TRACING_ENABLED is set)
+    from utils.tracing import init_tracing
+    init_tracing(app)
+    
+    # Slow user API requests with a mid-flight stack sample (no-op unless SLOW_REQUEST_LOG is set)
+    from utils.slow_requests import init_slow_request_log
+    init_slow_request_log(app)
+    
+    # Over-budget logins are refused before they can queue for a hashing slot
+    from routes.user_routes import limit_logins
+    app.before_request(limit_logins)
+    
+    # Concurrency limits and bounded queues for hashing, import and export routes
+    from utils.admission import init_admission
+    init_admission(app)
+    
+    # Interactive requests ahead of bulk ones (exports, imports, X-Priority: bulk)
+    from utils.scheduling import init_scheduling
+    init_scheduling(app)
+    
+    # gzip/deflate for clients that accept it; listings cached per store version
+    from utils.compression import init_compression
+    init_compression(app, user_service.db)
+    
+    # On-demand per-request cProfile (no-op unless PROFILING_DIR/TOKEN are set)
+    from utils.profiling import init_profiling
+    init_profiling(app)
+    
+    # Continuous stack sampling to folded-stack files (no-op unless SAMPLER_DIR is set)
+    from utils.sampler import init_sampler
+    init_sampler(app)
+    
     return app
 
 if __name__ == '__main__':
@@ -0,0 +1,78 @@
+"""
+Sparse Fieldset Benchmark
+Compares response size and time of GET /users with and without fields=
+over a seeded in-memory store. Runs in-process through the Flask test
+client, so the numbers cover projection plus JSON serialization only.
+
+    python -m benchmarks.bench_fieldsets --users 100000
+"""
+
+import argparse
+import os
+import sys
+import time
+
+DEFAULT_FIELD_SETS = ['', 'id,name', 'id', 'id,name,email']
+REPEATS = 3
+
+def make_client(users):
+    """Test client over an in-memory store holding users seeded rows"""
+    os.environ.pop('DATABASE_URL', None)
+    os.environ.pop('SHADOW_DATABASE_URL', None)
+    from app import create_app
+    from models.db import DatabaseManager
+    from models.seed import generate_users, load_chunks
+
+    app = create_app()
+    load_chunks(DatabaseManager(), generate_users(users, seed=users, password_hash='benchmark-hash'))
+    return app.test_client()
+
+def measure_fieldsets(client, field_sets=DEFAULT_FIELD_SETS, path='/users'):
+    """
+    Best-of-REPEATS seconds and body bytes per field set.
+
+    Returns:
+        list: dicts with fields, bytes and seconds, in field_sets order
+    """
+    results = []
+    for fields in field_sets:
+        url = f"{path}?fields={fields}" if fields else path
+        best = None
+        for _ in range(REPEATS):
+            start = time.perf_counter()
+            response = client.get(url)
+            body = response.get_data()
+            elapsed = time.perf_counter() - start
+            if response.status_code != 200:
+                raise RuntimeError(f"GET {url} returned {response.status_code}")
+            best = elapsed if best is None else min(best, elapsed)
+        results.append({'fields': fields or '(all)', 'bytes': len(body), 'seconds': best})
+    return results
+
+def format_results(results):
+    """Table of each field set against the full response"""
+    full = results[0]
+    lines = [f"{'fields':<18} {'bytes':>12} {'saved':>7} {'ms':>10} {'saved':>7}"]
+    for result in results:
+        byte_saving = 1 - result['bytes'] / full['bytes']
+        time_saving = 1 - result['seconds'] / full['seconds']
+        lines.append(f"{result['fields']:<18} {result['bytes']:>12,} {byte_saving:>6.0%} "
+                     f"{result['seconds'] * 1000:>10.1f} {time_saving:>6.0%}")
+    return '\n'.join(lines)
+
+def main(argv=None):
+    """Seed the store and print the comparison"""
+    parser = argparse.ArgumentParser(description="Measure GET /users payload savings from fields=")
+    parser.add_argument('--users', type=int, default=100000, help="Rows to seed")
+    parser.add_argument('--fields', action='append',
+                        help="Field set to compare (repeatable); the full response is always first")
+    args = parser.parse_args(sys.argv[1:] if argv is None else argv)
+
+    client = make_client(args.users)
+    field_sets = [''] + (args.fields or DEFAULT_FIELD_SETS[1:])
+    print(f"GET /users over {args.users:,} users")
+    print(format_results(measure_fieldsets(client, field_sets)))
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
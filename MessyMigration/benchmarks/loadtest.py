@@ -0,0 +1,321 @@
+"""
+HTTP Load Test
+Boots main:app under gunicorn (or targets a running server) and drives a
+weighted mix of the user endpoints at an open-loop arrival rate, reporting
+throughput and latency percentiles per endpoint as JSON.
+
+    python -m benchmarks.loadtest --mix login-heavy --rate 50 --duration 30
+    python -m benchmarks.loadtest --mix search-heavy --workers 4 --worker-class gthread --threads 8
+"""
+
+import argparse
+import http.client
+import json
+import math
+import os
+import queue
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from urllib.parse import quote, urlsplit
+
+from models.seed import SEED_PASSWORD, generate_users, write_snapshot
+
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Relative weights of each endpoint per traffic profile
+MIXES = {
+    'login-heavy': {'login': 70, 'search': 18, 'create': 4, 'update': 4, 'delete': 2, 'list': 2},
+    'search-heavy': {'search': 75, 'login': 10, 'create': 4, 'update': 4, 'delete': 2, 'list': 5},
+    'write-heavy': {'create': 35, 'update': 35, 'delete': 10, 'login': 10, 'search': 8, 'list': 2}
+}
+
+SEARCH_TERMS = ['smith', 'john', 'mar', 'lee', 'patel', 'an', 'zzz']
+UPDATE_NAMES = ['Load Test Alpha', 'Load Test Beta', 'Load Test Gamma']
+PERCENTILES = {'p50': 0.50, 'p95': 0.95, 'p99': 0.99, 'p99.9': 0.999}
+
+class Workload:
+    """
+    Builds requests for each endpoint against the seeded user population.
+
+    Deletes only target users the load test created itself, so the seeded
+    users that logins, updates and searches rely on are never removed. With
+    several workers (each with its own store) a delete can still reach a
+    worker that did not make that user and get a 404.
+    """
+
+    def __init__(self, users, seed):
+        self.users = users
+        self.rng = random.Random(seed)
+        self.lock = threading.Lock()
+        self.next_new_user = 0
+        self.created = []
+
+    def record_created(self, user_id):
+        """Remember a user a create request made, for a later delete"""
+        with self.lock:
+            self.created.append(user_id)
+
+    def can_delete(self):
+        """True once a created user is waiting to be deleted"""
+        with self.lock:
+            return bool(self.created)
+
+    def request(self, endpoint):
+        """Return (method, path, json body or None) for one call of endpoint"""
+        with self.lock:
+            user = self.rng.choice(self.users)
+            term = self.rng.choice(SEARCH_TERMS)
+            new_name = self.rng.choice(UPDATE_NAMES)
+            self.next_new_user += 1
+            serial = self.next_new_user
+        if endpoint == 'list':
+            return 'GET', '/users', None
+        if endpoint == 'search':
+            return 'GET', f"/search?name={quote(term)}", None
+        if endpoint == 'login':
+            return 'POST', '/login', {'email': user['email'], 'password': SEED_PASSWORD}
+        if endpoint == 'create':
+            return 'POST', '/users', {'name': 'Load Test',
+                                      'email': f"loadtest{serial}.{os.getpid()}@example.com",
+                                      'password': SEED_PASSWORD}
+        if endpoint == 'update':
+            return 'PUT', f"/user/{user['id']}", {'name': new_name}
+        if endpoint == 'delete':
+            with self.lock:
+                user_id = self.created.pop(self.rng.randrange(len(self.created)))
+            return 'DELETE', f"/user/{user_id}", None
+        raise ValueError(f"Unknown endpoint {endpoint}")
+
+def free_port():
+    """Ask the OS for an unused local port"""
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+def start_gunicorn(args, snapshot_path):
+    """Boot main:app under gunicorn and wait until it answers"""
+    port = free_port()
+    env = dict(os.environ, DATABASE_SNAPSHOT=snapshot_path)
+    command = [
+        sys.executable, '-m', 'gunicorn', 'main:app',
+        '--chdir', PROJECT_DIR,
+        '--bind', f"127.0.0.1:{port}",
+        '--workers', str(args.workers),
+        '--worker-class', args.worker_class,
+        '--threads', str(args.threads),
+        '--keep-alive', '30',
+        '--log-level', 'warning'
+    ]
+    server = subprocess.Popen(command, env=env)
+    deadline = time.monotonic() + 60
+    while time.monotonic() < deadline:
+        try:
+            conn = http.client.HTTPConnection('127.0.0.1', port, timeout=1)
+            conn.request('GET', '/')
+            conn.getresponse().read()
+            conn.close()
+            return server, f"http://127.0.0.1:{port}"
+        except OSError:
+            if server.poll() is not None:
+                raise RuntimeError("gunicorn exited during startup")
+            time.sleep(0.2)
+    server.terminate()
+    raise RuntimeError("gunicorn did not become ready within 60s")
+
+def check_seeded(base_url, users, timeout):
+    """
+    Fail fast unless the server holds the seeded users.
+
+    Logins, updates and searches target seeded rows; against an empty or
+    differently seeded store they would measure 401s and 404s instead.
+    """
+    sample = [users[0], users[len(users) // 2], users[-1]]
+    parts = urlsplit(base_url)
+    conn = http.client.HTTPConnection(parts.hostname, parts.port, timeout=timeout)
+    try:
+        conn.request('POST', '/users/lookup', body=json.dumps({'ids': [u['id'] for u in sample]}),
+                     headers={'Content-Type': 'application/json'})
+        response = conn.getresponse()
+        data = response.read()
+        found = json.loads(data) if response.status == 200 else []
+        conn.request('POST', '/login', body=json.dumps({'email': sample[0]['email'],
+                                                        'password': SEED_PASSWORD}),
+                     headers={'Content-Type': 'application/json'})
+        login = conn.getresponse()
+        login.read()
+    finally:
+        conn.close()
+    if [(u or {}).get('email') for u in found] != [u['email'] for u in sample] or login.status != 200:
+        raise RuntimeError(f"{base_url} does not hold the seeded users "
+                           f"(lookup {response.status}, login {login.status}); "
+                           "seed it with the same --users and --seed")
+
+def client_loop(base_url, work, results, timeout, workload):
+    """Send queued requests over one keep-alive connection"""
+    parts = urlsplit(base_url)
+    conn = None
+    while True:
+        item = work.get()
+        if item is None:
+            break
+        scheduled, endpoint, (method, path, body) = item
+        status = None
+        try:
+            if conn is None:
+                conn = http.client.HTTPConnection(parts.hostname, parts.port, timeout=timeout)
+            headers = {'Connection': 'keep-alive'}
+            payload = None
+            if body is not None:
+                payload = json.dumps(body)
+                headers['Content-Type'] = 'application/json'
+            conn.request(method, path, body=payload, headers=headers)
+            response = conn.getresponse()
+            data = response.read()
+            status = response.status
+            if endpoint == 'create' and status == 201:
+                workload.record_created(json.loads(data)['id'])
+        except (OSError, http.client.HTTPException):
+            if conn is not None:
+                conn.close()
+            conn = None
+        # Latency counts from the scheduled arrival, so queueing delay caused
+        # by a slow server is included (no coordinated omission)
+        results.append((endpoint, status, time.perf_counter() - scheduled))
+    if conn is not None:
+        conn.close()
+
+def run_load(base_url, mix, rate, duration, connections, timeout, workload, seed):
+    """Issue Poisson arrivals at rate/sec for duration seconds; returns raw samples"""
+    rng = random.Random(seed)
+    endpoints = list(mix)
+    weights = [mix[endpoint] for endpoint in endpoints]
+    work = queue.Queue()
+    results = []
+    clients = [
+        threading.Thread(target=client_loop, args=(base_url, work, results, timeout, workload),
+                         daemon=True)
+        for _ in range(connections)
+    ]
+    for client in clients:
+        client.start()
+
+    start = time.perf_counter()
+    scheduled = start
+    while True:
+        scheduled += rng.expovariate(rate)
+        if scheduled - start >= duration:
+            break
+        delay = scheduled - time.perf_counter()
+        if delay > 0:
+            time.sleep(delay)
+        endpoint = rng.choices(endpoints, weights)[0]
+        if endpoint == 'delete' and not workload.can_delete():
+            # Nothing of ours to delete yet; seeded users are left alone
+            endpoint = 'create'
+        work.put((scheduled, endpoint, workload.request(endpoint)))
+
+    for _ in clients:
+        work.put(None)
+    for client in clients:
+        client.join()
+    return results, time.perf_counter() - start
+
+def percentile(sorted_values, q):
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, max(0, math.ceil(q * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+def summarize(samples, elapsed):
+    """Aggregate raw samples into per-endpoint throughput and latency percentiles"""
+    by_endpoint = {}
+    for endpoint, status, latency in samples:
+        by_endpoint.setdefault(endpoint, []).append((status, latency))
+    by_endpoint['all'] = [(status, latency) for _, status, latency in samples]
+
+    report = {}
+    for endpoint, rows in sorted(by_endpoint.items()):
+        latencies = sorted(latency for _, latency in rows)
+        statuses = {}
+        for status, _ in rows:
+            key = str(status) if status is not None else 'error'
+            statuses[key] = statuses.get(key, 0) + 1
+        report[endpoint] = {
+            'count': len(rows),
+            'throughput_rps': round(len(rows) / elapsed, 2),
+            'status_codes': statuses,
+            'mean_ms': round(1000 * sum(latencies) / len(latencies), 3) if latencies else None,
+            **{name: round(1000 * percentile(latencies, q), 3) if latencies else None
+               for name, q in PERCENTILES.items()}
+        }
+    return report
+
+def parse_args(argv):
+    """Parse command line arguments"""
+    parser = argparse.ArgumentParser(description="Load test the user API under gunicorn")
+    parser.add_argument('--mix', choices=sorted(MIXES), default='login-heavy')
+    parser.add_argument('--rate', type=float, default=20.0, help="Mean arrivals per second")
+    parser.add_argument('--duration', type=float, default=30.0, help="Seconds of load")
+    parser.add_argument('--connections', type=int, default=32,
+                        help="Keep-alive client connections")
+    parser.add_argument('--timeout', type=float, default=30.0, help="Per-request timeout")
+    parser.add_argument('--users', type=int, default=10000, help="Seeded users")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--workers', type=int, default=2, help="gunicorn workers")
+    parser.add_argument('--worker-class', default='sync', help="gunicorn worker class")
+    parser.add_argument('--threads', type=int, default=1, help="gunicorn threads per worker")
+    parser.add_argument('--url', default=None,
+                        help="Target an already running server (seeded with the same --users/--seed)")
+    parser.add_argument('--output', default=None, help="Write the JSON report here as well")
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    """Run one load test and print the JSON report"""
+    args = parse_args(sys.argv[1:] if argv is None else argv)
+    users = [user for chunk in generate_users(args.users, seed=args.seed, password_hash='-')
+             for user in chunk]
+    workload = Workload(users, args.seed)
+
+    server = None
+    with tempfile.TemporaryDirectory() as workdir:
+        base_url = args.url
+        if base_url is None:
+            # Each worker loads the same snapshot into its store: its own
+            # in-memory one, or the shared DATABASE_URL store if that is set
+            snapshot_path = os.path.join(workdir, 'users.ndjson')
+            write_snapshot(snapshot_path, generate_users(args.users, seed=args.seed))
+            server, base_url = start_gunicorn(args, snapshot_path)
+        try:
+            check_seeded(base_url, users, args.timeout)
+            samples, elapsed = run_load(base_url, MIXES[args.mix], args.rate, args.duration,
+                                        args.connections, args.timeout, workload, args.seed)
+        finally:
+            if server is not None:
+                server.terminate()
+                server.wait()
+
+    report = {
+        'config': {
+            'mix': args.mix, 'rate': args.rate, 'duration': args.duration,
+            'connections': args.connections, 'users': args.users,
+            'workers': args.workers, 'worker_class': args.worker_class, 'threads': args.threads,
+            'url': args.url
+        },
+        'elapsed_seconds': round(elapsed, 3),
+        'endpoints': summarize(samples, elapsed)
+    }
+    output = json.dumps(report, indent=2)
+    print(output)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output)
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,21 +1,104 @@
 """
 Database Initialization Script
-Run this script to initialize the in-memory database
+Run this script to initialize the in-memory database, to migrate a
+legacy users.db into the configured backend, or to seed synthetic users:
+
+    python init_db.py
+    python init_db.py migrate --from legacy.db
+    python init_db.py seed --users 1000000 --seed 42 --snapshot users.ndjson
 """
 
+import argparse
 import os
 import sys
-from models.db import init_db
+import time
+from dotenv import load_dotenv
+from models.db import DatabaseManager, create_database_manager, init_db
+from models.migrate import migrate_legacy_db
+from models.seed import generate_users, load_chunks, write_snapshot
+
+def parse_args(argv):
+    """Parse command line arguments"""
+    parser = argparse.ArgumentParser(description="Initialize or migrate the user database")
+    subparsers = parser.add_subparsers(dest='command')
+
+    migrate = subparsers.add_parser('migrate', help="Migrate a legacy plaintext users.db")
+    migrate.add_argument('--from', dest='legacy_path', required=True,
+                         help="Path to the legacy SQLite database")
+    migrate.add_argument('--to', dest='db_url', default=os.environ.get('DATABASE_URL'),
+                         help="Target DATABASE_URL (defaults to $DATABASE_URL)")
+    migrate.add_argument('--chunk-size', type=int, default=1000,
+                         help="Rows read, hashed and inserted per chunk")
+    migrate.add_argument('--workers', type=int, default=None,
+                         help="Password hashing processes (defaults to CPU count)")
+    migrate.add_argument('--checkpoint', default=None,
+                         help="Checkpoint file (defaults to <legacy path>.checkpoint.json)")
+
+    seed = subparsers.add_parser('seed', help="Generate deterministic synthetic users")
+    seed.add_argument('--users', type=int, required=True, help="Number of users to generate")
+    seed.add_argument('--seed', type=int, default=0, help="Random seed")
+    seed.add_argument('--domain-skew', type=float, default=1.0,
+                      help="Zipf exponent for email domain popularity (0 = uniform)")
+    target = seed.add_mutually_exclusive_group()
+    target.add_argument('--to', dest='db_url', default=os.environ.get('DATABASE_URL'),
+                        help="Target DATABASE_URL (defaults to $DATABASE_URL)")
+    target.add_argument('--snapshot', default=None,
+                        help="Write an NDJSON snapshot instead (load it with DATABASE_SNAPSHOT)")
+
+    return parser.parse_args(argv)
 
-def main():
+def migrate(args):
+    """Migrate a legacy database into the configured backend"""
+    if not os.path.exists(args.legacy_path):
+        raise FileNotFoundError(f"Legacy database not found: {args.legacy_path}")
+
+    db = create_database_manager(args.db_url)
+    if isinstance(db, DatabaseManager):
+        raise ValueError("Migrating into the in-memory store would be lost on exit; "
+                         "set DATABASE_URL (or --to) to e.g. sqlite:///users.db")
+
+    checkpoint = args.checkpoint or f"{args.legacy_path}.checkpoint.json"
+    print(f"Migrating {args.legacy_path} -> {args.db_url} (checkpoint: {checkpoint})")
+    state = migrate_legacy_db(args.legacy_path, db, checkpoint,
+                              chunk_size=args.chunk_size, workers=args.workers)
+    print(f"Migration complete: {state['migrated']} rows migrated, "
+          f"{state['skipped']} skipped, {state['rows_per_sec']} rows/sec")
+
+def seed(args):
+    """Generate synthetic users into the configured backend or a snapshot file"""
+    started = time.perf_counter()
+    chunks = generate_users(args.users, seed=args.seed, domain_skew=args.domain_skew)
+    if args.snapshot:
+        count = write_snapshot(args.snapshot, chunks)
+        destination = args.snapshot
+    else:
+        db = create_database_manager(args.db_url)
+        if isinstance(db, DatabaseManager):
+            raise ValueError("Seeding the in-memory store would be lost on exit; "
+                             "use --snapshot, or set DATABASE_URL (or --to)")
+        count = load_chunks(db, chunks)
+        destination = args.db_url
+    elapsed = time.perf_counter() - started
+    print(f"Seeded {count} users into {destination} in {elapsed:.1f}s "
+          f"({count / elapsed:.0f} rows/sec)")
+
+def main(argv=None):
     """Initialize the database"""
+    load_dotenv()
+    args = parse_args(sys.argv[1:] if argv is None else argv)
     try:
-        print("Initializing in-memory database...")
-        init_db()
-        print("Database initialized successfully!")
-            
+        if args.command == 'migrate':
+            migrate(args)
+        elif args.command == 'seed':
+            seed(args)
+        else:
+            print("Initializing in-memory database...")
+            init_db()
+            print("Database initialized successfully!")
+
     except Exception as e:
-        print(f"Error initializing database: {str(e)}")
+        action = {'migrate': 'migrating', 'seed': 'seeding'}.get(args.command, 'initializing')
+        print(f"Error {action} database: {str(e)}")
         sys.exit(1)
 
 if __name__ == '__main__':
@@ -4,12 +4,53 @@ Handles all database operations using in-memory storage
 """
 
 import logging
-from datetime import datetime
+import threading
+from collections import deque
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from itertools import islice
 import os
+from utils.tracing import traced
 
-# Simple in-memory storage for demonstration
-users_data = []
+logger = logging.getLogger(__name__)
+
+# Simple in-memory storage for demonstration.
+# users_data maps id -> user row (insertion ordered); users_by_email is a
+# secondary index so lookups and uniqueness checks don't scan the table.
+users_data = {}
+users_by_email = {}
 user_id_counter = 1
+# Bumped by every row change (never reset), so equal versions mean equal contents
+store_version = 0
+# The most recent row changes as (version, op, user_id, row), consecutive in
+# version; row is the stored row after the change (None for deletes)
+change_log = deque(maxlen=int(os.environ.get('CHANGE_LOG_SIZE', '100000')))
+
+# Guards every mutation so conditional operations are atomic
+_lock = threading.RLock()
+# (user_id, row before, row after) per change while transaction() is open
+_undo = None
+
+EPOCH = datetime(1970, 1, 1)
+
+
+def epoch_millis(value):
+    """
+    Milliseconds since the epoch of a naive datetime, rounded half up.
+
+    The value is read as UTC, the way the JSON encoder renders it, even though
+    rows are stamped with local datetime.now().
+    """
+    return ((value - EPOCH) // timedelta(microseconds=1) + 500) // 1000
+
+
+class DuplicateEmailError(Exception):
+    """Raised when a write would give two users the same email"""
+
+
+class VersionConflictError(Exception):
+    """Raised when a write's expected version does not match the stored row"""
+
 
 class DatabaseManager:
     """Database manager for in-memory operations"""
@@ -18,6 +59,7 @@ class DatabaseManager:
         # No database connection needed for in-memory storage
         pass
     
+    @traced('store')
     def get_all_users(self):
         """Get all users from memory"""
         try:
@@ -27,99 +69,435 @@ class DatabaseManager:
                     'id': user['id'],
                     'name': user['name'],
                     'email': user['email'],
-                    'created_at': user['created_at']
+                    'created_at': user['created_at'],
+                    'version': user['version']
                 }
-                for user in sorted(users_data, key=lambda x: x['created_at'], reverse=True)
+                for user in sorted(users_data.values(), key=lambda x: x['created_at'], reverse=True)
             ]
         except Exception as e:
-            logging.error(f"Error in get_all_users: {str(e)}")
+            logger.error("Error in get_all_users: %s", e)
+            raise
+    
+    @traced('store')
+    def snapshot_users(self):
+        """
+        Capture a consistent point-in-time view of every user row, in id order.
+
+        Only the row references are copied under the lock; rows are replaced
+        rather than mutated on update, so callers can iterate the snapshot for
+        as long as they like without blocking writers.
+        """
+        try:
+            with _lock:
+                return list(users_data.values())
+        except Exception as e:
+            logger.error("Error in snapshot_users: %s", e)
+            raise
+    
+    @contextmanager
+    def transaction(self):
+        """
+        Run several store calls under one acquisition of the store lock.
+
+        If the block raises, every change it made is rolled back before the
+        exception propagates. Nested transactions join the outer one.
+
+        This gives atomicity against other writers only, not isolation: the
+        lock-free readers (get_user_by_id, get_all_users, search and the
+        column/snapshot reads) see the block's changes as they are made,
+        including ones that are later rolled back. Use the SQLite backend
+        where readers must only see committed state.
+        """
+        global _undo
+        with _lock:
+            if _undo is not None:
+                yield
+                return
+            _undo = []
+            try:
+                yield
+            except BaseException:
+                undo, _undo = _undo, None
+                _roll_back(undo)
+                raise
+            finally:
+                _undo = None
+    
+    def store_version(self):
+        """Counter that changes whenever any user row changes"""
+        return store_version
+    
+    @traced('store')
+    def get_changes(self, since, limit):
+        """
+        Row changes after version since, at most limit of them, latest per user.
+
+        Returns:
+            dict or None: {'version', 'more', 'changes'}, where version is the
+            last change covered and changes lists {'op', 'id', 'user'} in
+            change order (user is the row after the change, None once
+            deleted); None when the log no longer reaches back to since
+        """
+        try:
+            with _lock:
+                current = store_version
+                floor = change_log[0][0] - 1 if change_log else current
+                if not floor <= since <= current:
+                    return None
+                upto = min(current, since + limit)
+                entries = list(islice(change_log, since - floor, upto - floor))
+            return {'version': upto, 'more': upto < current, 'changes': _compact(entries)}
+        except Exception as e:
+            logger.error("Error in get_changes: %s", e)
+            raise
+    
+    def store_stats(self):
+        """Row count and per-index entry counts, for monitoring"""
+        return {
+            'rows': len(users_data),
+            'indexes': {'id': len(users_data), 'email': len(users_by_email)}
+        }
+    
+    @traced('store')
+    def get_user_columns(self, fields):
+        """
+        Public fields of every user as parallel lists, newest first.
+
+        Returns:
+            dict: field -> list of values; created_at as epoch milliseconds
+        """
+        try:
+            with _lock:
+                rows = list(users_data.values())
+            rows.sort(key=lambda x: x['created_at'], reverse=True)
+            return {
+                field: [epoch_millis(user[field]) for user in rows] if field == 'created_at'
+                else [user[field] for user in rows]
+                for field in fields
+            }
+        except Exception as e:
+            logger.error("Error in get_user_columns: %s", e)
             raise
     
+    @traced('store')
     def get_user_by_id(self, user_id):
         """Get user by ID"""
         try:
-            for user in users_data:
-                if user['id'] == int(user_id):
-                    return user
-            return None
+            return users_data.get(int(user_id))
         except Exception as e:
-            logging.error(f"Error in get_user_by_id: {str(e)}")
+            logger.error("Error in get_user_by_id: %s", e)
             raise
     
+    @traced('store')
+    def get_users_by_ids(self, user_ids):
+        """
+        Look up many users by ID in one call.
+
+        Returns:
+            list: one entry per requested ID, in the same order (None if missing)
+        """
+        try:
+            return [users_data.get(int(user_id)) for user_id in user_ids]
+        except Exception as e:
+            logger.error("Error in get_users_by_ids: %s", e)
+            raise
+    
+    @traced('store')
     def get_user_by_email(self, email):
         """Get user by email"""
         try:
-            for user in users_data:
-                if user['email'] == email:
-                    return user
-            return None
+            return users_by_email.get(email)
         except Exception as e:
-            logging.error(f"Error in get_user_by_email: {str(e)}")
+            logger.error("Error in get_user_by_email: %s", e)
             raise
     
+    @traced('store')
     def create_user(self, name, email, password_hash):
         """Create a new user"""
+        try:
+            with _lock:
+                return self._insert(name, email, password_hash)['id']
+        except Exception as e:
+            logger.error("Error in create_user: %s", e)
+            raise
+    
+    @traced('store')
+    def create_user_if_email_absent(self, name, email, password_hash):
+        """
+        Atomically create a user unless the email is already taken.
+
+        Returns:
+            dict: the stored user row, or None if the email exists
+        """
+        try:
+            with _lock:
+                if email in users_by_email:
+                    return None
+                return self._insert(name, email, password_hash)
+        except Exception as e:
+            logger.error("Error in create_user_if_email_absent: %s", e)
+            raise
+    
+    @traced('store')
+    def bulk_create_users(self, users):
+        """
+        Insert many users under a single lock acquisition.
+
+        Args:
+            users (list): dicts with name, email and password_hash
+
+        Returns:
+            list: the stored row for each input, or None where the email
+            already existed (including earlier in the same batch)
+        """
+        try:
+            with _lock:
+                return [
+                    None if user['email'] in users_by_email
+                    else self._insert(user['name'], user['email'], user['password_hash'])
+                    for user in users
+                ]
+        except Exception as e:
+            logger.error("Error in bulk_create_users: %s", e)
+            raise
+    
+    @traced('store')
+    def bulk_load_users(self, users):
+        """
+        Load rows that already carry their id and created_at.
+
+        Rows whose id or email already exists are skipped, so re-loading the
+        same chunk (e.g. after an interrupted migration) is harmless.
+
+        Returns:
+            int: number of rows inserted
+        """
         global user_id_counter
         try:
-            new_user = {
-                'id': user_id_counter,
-                'name': name,
-                'email': email,
-                'password_hash': password_hash,
-                'created_at': datetime.now()
-            }
-            users_data.append(new_user)
-            user_id_counter += 1
-            return new_user['id']
+            inserted = 0
+            with _lock:
+                for user in users:
+                    if user['id'] in users_data or user['email'] in users_by_email:
+                        continue
+                    row = {
+                        'id': user['id'],
+                        'name': user['name'],
+                        'email': user['email'],
+                        'password_hash': user['password_hash'],
+                        'created_at': user['created_at'],
+                        'version': 1
+                    }
+                    users_data[row['id']] = row
+                    users_by_email[row['email']] = row
+                    user_id_counter = max(user_id_counter, row['id'] + 1)
+                    _record_change('create', row['id'], row, None)
+                    inserted += 1
+            return inserted
         except Exception as e:
-            logging.error(f"Error in create_user: {str(e)}")
+            logger.error("Error in bulk_load_users: %s", e)
             raise
     
+    @traced('store')
     def update_user(self, user_id, user_data):
         """Update user with provided data"""
         try:
-            for user in users_data:
-                if user['id'] == int(user_id):
-                    for key, value in user_data.items():
-                        if key in ['name', 'email', 'password_hash']:
-                            user[key] = value
-                    return
+            self.update_user_returning(user_id, user_data)
         except Exception as e:
-            logging.error(f"Error in update_user: {str(e)}")
+            logger.error("Error in update_user: %s", e)
             raise
     
+    @traced('store')
+    def update_user_returning(self, user_id, user_data, expected_version=None):
+        """
+        Atomically update a user and return the resulting row.
+
+        Args:
+            expected_version (int or set of int): if given, only update when
+                the stored row is still at this version (one of these versions)
+
+        Returns:
+            dict: the updated user row, or None if the user does not exist
+
+        Raises:
+            DuplicateEmailError: if the new email belongs to another user
+            VersionConflictError: if expected_version is stale
+        """
+        try:
+            with _lock:
+                user = users_data.get(int(user_id))
+                if user is None:
+                    return None
+                _check_version(user, expected_version)
+
+                changes = {
+                    key: value for key, value in user_data.items()
+                    if key in ['name', 'email', 'password_hash']
+                }
+                new_email = changes.get('email', user['email'])
+                owner = users_by_email.get(new_email)
+                if owner is not None and owner['id'] != user['id']:
+                    raise DuplicateEmailError(new_email)
+
+                # Replace rather than mutate so readers holding the old row
+                # never observe a half-applied update
+                updated = dict(user, **changes)
+                updated['version'] = user['version'] + 1
+                users_data[updated['id']] = updated
+                if new_email != user['email']:
+                    del users_by_email[user['email']]
+                users_by_email[new_email] = updated
+                _record_change('update', updated['id'], updated, user)
+                return updated
+        except (DuplicateEmailError, VersionConflictError):
+            raise
+        except Exception as e:
+            logger.error("Error in update_user_returning: %s", e)
+            raise
+    
+    @traced('store')
     def delete_user(self, user_id):
         """Delete user by ID"""
         try:
-            global users_data
-            initial_count = len(users_data)
-            users_data = [user for user in users_data if user['id'] != int(user_id)]
-            return len(users_data) < initial_count
+            return self.delete_user_returning(user_id) is not None
+        except Exception as e:
+            logger.error("Error in delete_user: %s", e)
+            raise
+    
+    @traced('store')
+    def delete_user_returning(self, user_id, expected_version=None):
+        """
+        Atomically delete a user and return the removed row.
+
+        Args:
+            expected_version (int or set of int): if given, only delete when
+                the stored row is still at this version (one of these versions)
+
+        Returns:
+            dict: the deleted user row, or None if the user does not exist
+
+        Raises:
+            VersionConflictError: if expected_version is stale
+        """
+        try:
+            with _lock:
+                user = users_data.get(int(user_id))
+                if user is None:
+                    return None
+                _check_version(user, expected_version)
+                del users_data[user['id']]
+                users_by_email.pop(user['email'], None)
+                _record_change('delete', user['id'], None, user)
+                return user
+        except VersionConflictError:
+            raise
         except Exception as e:
-            logging.error(f"Error in delete_user: {str(e)}")
+            logger.error("Error in delete_user_returning: %s", e)
             raise
     
+    @traced('store')
     def search_users_by_name(self, name):
         """Search users by name (case-insensitive)"""
         try:
             search_term = name.lower()
             matching_users = [
-                user for user in users_data 
+                user for user in users_data.values()
                 if search_term in user['name'].lower()
             ]
-            return sorted(matching_users, key=lambda x: x['name'])
+            return sorted(matching_users, key=lambda x: (x['name'], x['id']))
         except Exception as e:
-            logging.error(f"Error in search_users_by_name: {str(e)}")
+            logger.error("Error in search_users_by_name: %s", e)
             raise
+    
+    def _insert(self, name, email, password_hash):
+        """Insert a new row; caller must hold the store lock"""
+        global user_id_counter
+        new_user = {
+            'id': user_id_counter,
+            'name': name,
+            'email': email,
+            'password_hash': password_hash,
+            'created_at': datetime.now(),
+            'version': 1
+        }
+        users_data[new_user['id']] = new_user
+        users_by_email[email] = new_user
+        user_id_counter += 1
+        _record_change('create', new_user['id'], new_user, None)
+        return new_user
+
+def _record_change(op, user_id, row, previous):
+    """Bump the store version and log the change; caller must hold the store lock"""
+    global store_version
+    store_version += 1
+    change_log.append((store_version, op, user_id, row))
+    if _undo is not None:
+        _undo.append((user_id, previous, row))
+
+def _roll_back(undo):
+    """
+    Put back the rows changed since undo was started, newest change first.
+
+    Each restore is a change of its own, so the store version keeps moving
+    forward and change log readers converge on the restored rows.
+    """
+    for user_id, previous, row in reversed(undo):
+        if row is not None:
+            del users_data[user_id]
+            del users_by_email[row['email']]
+        if previous is None:
+            _record_change('delete', user_id, None, row)
+        else:
+            users_data[user_id] = previous
+            users_by_email[previous['email']] = previous
+            _record_change('create' if row is None else 'update', user_id, previous, row)
+
+def _compact(entries):
+    """Keep each user's latest (version, op, user_id, row) entry, in change order"""
+    latest = {}
+    for _, op, user_id, row in entries:
+        latest.pop(user_id, None)
+        latest[user_id] = {'op': op, 'id': user_id, 'user': row}
+    return list(latest.values())
+
+def _check_version(user, expected_version):
+    """Raise VersionConflictError unless the row matches expected_version (an int or a set)"""
+    if expected_version is None:
+        return
+    if isinstance(expected_version, int):
+        matches = user['version'] == expected_version
+    else:
+        matches = user['version'] in expected_version
+    if not matches:
+        raise VersionConflictError(
+            f"user {user['id']} is at version {user['version']}, expected {expected_version}"
+        )
+
+def create_database_manager(db_url=None):
+    """
+    Build the DatabaseManager for a DATABASE_URL.
+
+    sqlite:///path selects the persistent SQLite backend; anything else
+    (including no URL) uses the in-memory store.
+    """
+    if db_url and db_url.startswith('sqlite:///'):
+        from models.sqlite_db import SQLiteDatabaseManager
+        return SQLiteDatabaseManager(db_url)
+    return DatabaseManager(db_url)
 
 def init_db(db_url=None):
     """Initialize the in-memory database"""
     try:
-        global users_data, user_id_counter
-        users_data = []
-        user_id_counter = 1
-        logging.info("In-memory database initialized")
+        global users_data, users_by_email, user_id_counter, store_version
+        with _lock:
+            users_data = {}
+            users_by_email = {}
+            user_id_counter = 1
+            # Emptying the store is a change too; the version never goes back,
+            # and no earlier token can be replayed past this point
+            store_version += 1
+            change_log.clear()
+        logger.info("In-memory database initialized")
         
     except Exception as e:
-        logging.error(f"Error initializing database: {str(e)}")
+        logger.error("Error initializing database: %s", e)
         raise
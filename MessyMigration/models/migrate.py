@@ -0,0 +1,121 @@
+"""
+Legacy Migration Module
+Copies the original monolith's SQLite users table into the configured backend
+"""
+
+import json
+import logging
+import os
+import sqlite3
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from werkzeug.security import generate_password_hash
+
+logger = logging.getLogger(__name__)
+
+# Keyset pagination: each chunk resumes after the last id seen, so every
+# query is an index range scan no matter how far into the table we are
+LEGACY_CHUNK_QUERY = 'SELECT id, name, email, password FROM users WHERE id > ? ORDER BY id LIMIT ?'
+
+def read_checkpoint(path):
+    """Load a migration checkpoint, or None if there is none yet"""
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        return json.load(f)
+
+def write_checkpoint(path, state):
+    """Atomically replace the checkpoint file"""
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump(state, f)
+    os.replace(tmp_path, path)
+
+def iter_legacy_chunks(legacy_path, chunk_size, after_id=0):
+    """Yield legacy (id, name, email, password) rows in id-ordered chunks"""
+    conn = sqlite3.connect(f"file:{legacy_path}?mode=ro", uri=True)
+    try:
+        while True:
+            rows = conn.execute(LEGACY_CHUNK_QUERY, (after_id, chunk_size)).fetchall()
+            if not rows:
+                return
+            yield rows
+            after_id = rows[-1][0]
+    finally:
+        conn.close()
+
+def migrate_legacy_db(legacy_path, db, checkpoint_path, chunk_size=1000, workers=None,
+                      progress=print):
+    """
+    Migrate a legacy users.db into db, hashing plaintext passwords.
+
+    Passwords are hashed across a process pool while the previous chunk is
+    being loaded. After each chunk is stored the last migrated id is written
+    to checkpoint_path; a rerun resumes from there. db.bulk_load_users skips
+    rows that already exist, so a chunk stored just before a crash is safely
+    replayed.
+
+    Args:
+        legacy_path (str): path to the legacy SQLite file
+        db: target DatabaseManager
+        checkpoint_path (str): where to record progress
+        chunk_size (int): rows read, hashed and inserted per step
+        workers (int): hashing processes (defaults to the CPU count)
+        progress (callable): receives a human-readable line per chunk
+
+    Returns:
+        dict: final checkpoint state with last_id, migrated and skipped counts
+    """
+    source = os.path.abspath(legacy_path)
+    state = read_checkpoint(checkpoint_path)
+    if state is None:
+        state = {'source': source, 'last_id': 0, 'migrated': 0, 'skipped': 0}
+    elif state['source'] != source:
+        raise ValueError(f"Checkpoint {checkpoint_path} belongs to {state['source']}")
+    elif state['last_id']:
+        progress(f"Resuming after id {state['last_id']} ({state['migrated']} rows already migrated)")
+
+    workers = workers or os.cpu_count() or 1
+    started = time.perf_counter()
+    rows_this_run = 0
+
+    def load(rows, password_hashes):
+        nonlocal rows_this_run
+        created_at = datetime.now()
+        inserted = db.bulk_load_users([
+            {
+                'id': row[0],
+                'name': row[1],
+                'email': row[2],
+                'password_hash': password_hash,
+                'created_at': created_at
+            }
+            for row, password_hash in zip(rows, password_hashes)
+        ])
+        state['last_id'] = rows[-1][0]
+        state['migrated'] += inserted
+        state['skipped'] += len(rows) - inserted
+        write_checkpoint(checkpoint_path, state)
+
+        rows_this_run += len(rows)
+        elapsed = time.perf_counter() - started
+        progress(f"Migrated through id {state['last_id']}: {state['migrated']} rows, "
+                 f"{state['skipped']} skipped ({rows_this_run / elapsed:.0f} rows/sec)")
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        # Keep one chunk hashing in the pool while the previous one is loaded
+        in_flight = None
+        for rows in iter_legacy_chunks(legacy_path, chunk_size, after_id=state['last_id']):
+            submitted = (rows, pool.map(generate_password_hash, [row[3] for row in rows],
+                                        chunksize=max(1, len(rows) // (workers * 4))))
+            if in_flight:
+                load(*in_flight)
+            in_flight = submitted
+        if in_flight:
+            load(*in_flight)
+
+    elapsed = time.perf_counter() - started
+    state['rows_per_sec'] = round(rows_this_run / elapsed, 1) if elapsed else 0.0
+    logger.info("Legacy migration finished: %s", state)
+    return state
@@ -0,0 +1,111 @@
+"""
+Seed Data Module
+Deterministic synthetic users for benchmarking, and NDJSON store snapshots
+"""
+
+import json
+import random
+from datetime import datetime, timedelta
+from itertools import islice
+from werkzeug.security import generate_password_hash
+
+FIRST_NAMES = [
+    'James', 'Mary', 'John', 'Patricia', 'Robert', 'Jennifer', 'Michael', 'Linda',
+    'William', 'Elizabeth', 'David', 'Barbara', 'Richard', 'Susan', 'Joseph', 'Jessica',
+    'Thomas', 'Sarah', 'Charles', 'Karen', 'Daniel', 'Nancy', 'Matthew', 'Lisa',
+    'Anthony', 'Betty', 'Mark', 'Margaret', 'Priya', 'Arjun', 'Wei', 'Mei',
+    'Hiroshi', 'Yuki', 'Olga', 'Ivan', 'Fatima', 'Omar', 'Lucia', 'Mateo'
+]
+LAST_NAMES = [
+    'Smith', 'Johnson', 'Williams', 'Brown', 'Jones', 'Garcia', 'Miller', 'Davis',
+    'Rodriguez', 'Martinez', 'Hernandez', 'Lopez', 'Wilson', 'Anderson', 'Thomas', 'Taylor',
+    'Moore', 'Jackson', 'Martin', 'Lee', "O'Brien", 'Thompson', 'White', 'Harris',
+    'Clark', 'Lewis', 'Walker', 'Hall', 'Young', 'King', 'Sharma', 'Patel',
+    'Wang', 'Chen', 'Tanaka', 'Ivanova', 'Haddad', 'Rossi', 'Smith-Jones', 'Nguyen'
+]
+# Ordered by popularity; the domain skew favours the front of the list
+EMAIL_DOMAINS = [
+    'gmail.com', 'yahoo.com', 'outlook.com', 'hotmail.com', 'icloud.com',
+    'example.com', 'proton.me', 'aol.com', 'mail.com', 'zoho.com',
+    'acme.io', 'globex.com', 'initech.com', 'umbrella.org', 'hooli.xyz'
+]
+
+# Every seeded user logs in with this password; hashing it once per run is
+# what keeps seeding millions of rows fast
+SEED_PASSWORD = 'password123'
+SEED_START = datetime(2020, 1, 1)
+SEED_SPAN = timedelta(days=365 * 5)
+
+def generate_users(count, seed=0, domain_skew=1.0, chunk_size=10000, password_hash=None):
+    """
+    Yield chunks of synthetic user rows with ids 1..count.
+
+    The same (count, seed, domain_skew) always produces the same rows.
+    Domains follow a Zipf-like distribution with exponent domain_skew
+    (0 is uniform). created_at increases with id across SEED_SPAN.
+
+    Args:
+        password_hash (str): hash shared by every row; defaults to a hash
+            of SEED_PASSWORD computed once
+    """
+    rng = random.Random(seed)
+    password_hash = password_hash or generate_password_hash(SEED_PASSWORD)
+    weights = [1 / (rank ** domain_skew) for rank in range(1, len(EMAIL_DOMAINS) + 1)]
+    interval = SEED_SPAN.total_seconds() / max(count, 1)
+
+    for start in range(1, count + 1, chunk_size):
+        size = min(chunk_size, count - start + 1)
+        firsts = rng.choices(FIRST_NAMES, k=size)
+        lasts = rng.choices(LAST_NAMES, k=size)
+        domains = rng.choices(EMAIL_DOMAINS, weights=weights, k=size)
+        chunk = []
+        for offset in range(size):
+            user_id = start + offset
+            first, last = firsts[offset], lasts[offset]
+            local_part = f"{first}.{last}".lower().replace("'", '')
+            chunk.append({
+                'id': user_id,
+                'name': f"{first} {last}",
+                'email': f"{local_part}{user_id}@{domains[offset]}",
+                'password_hash': password_hash,
+                'created_at': SEED_START + timedelta(seconds=(user_id - 1 + rng.random()) * interval)
+            })
+        yield chunk
+
+def write_snapshot(path, chunks):
+    """
+    Write rows to an NDJSON snapshot file.
+
+    Returns:
+        int: number of rows written
+    """
+    written = 0
+    with open(path, 'w') as f:
+        for chunk in chunks:
+            f.write(''.join(
+                json.dumps(dict(user, created_at=user['created_at'].isoformat())) + '\n'
+                for user in chunk
+            ))
+            written += len(chunk)
+    return written
+
+def read_snapshot(path, chunk_size=10000):
+    """Yield chunks of rows from an NDJSON snapshot file"""
+    with open(path) as f:
+        lines = (line for line in f if line.strip())
+        while True:
+            chunk = [json.loads(line) for line in islice(lines, chunk_size)]
+            if not chunk:
+                return
+            for user in chunk:
+                user['created_at'] = datetime.fromisoformat(user['created_at'])
+            yield chunk
+
+def load_chunks(db, chunks):
+    """
+    Bulk-load row chunks into a DatabaseManager.
+
+    Returns:
+        int: number of rows inserted
+    """
+    return sum(db.bulk_load_users(chunk) for chunk in chunks)
@@ -0,0 +1,288 @@
+"""
+Shadow Database Module
+Serves from a primary DatabaseManager while mirroring sampled traffic to a
+shadow backend, so a new backend can be compared under real load
+"""
+
+import logging
+import random
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
+
+from utils.histogram import LatencyHistogram
+from utils.metrics import REGISTRY
+
+logger = logging.getLogger(__name__)
+
+# Fields compared between primary and shadow rows. version is left out: it
+# only lines up when every write since the shadow was filled was mirrored.
+COMPARED_FIELDS = ('id', 'name', 'email', 'created_at')
+
+def _comparable(result):
+    """Reduce a store result to the fields both backends must agree on"""
+    if result is None:
+        return None
+    if isinstance(result, dict):
+        return tuple(result.get(field) for field in COMPARED_FIELDS)
+    return [_comparable(row) for row in result]
+
+class ShadowDatabaseManager:
+    """
+    Composite DatabaseManager: primary answers every call, shadow is
+    exercised in the background.
+
+    A read_sample_rate fraction of reads is replayed against the shadow on a
+    single background thread and the two results are compared. With
+    mirror_writes, every write that succeeds on the primary is replayed on
+    the shadow in the same order (creates keep the primary's id). Latency
+    of each method is recorded per backend. When more than max_pending
+    shadow calls are queued, new ones are dropped and counted instead of
+    slowing the request path. Counters, latencies and the backlog are also
+    exported through the metrics registry (shadow_db_* at /metrics).
+
+    Sampled reads run after the primary answered, so a write landing in
+    between can show up as a mismatch; compare mismatch rates, not single
+    samples.
+
+    Writes made inside transaction() are mirrored only once the primary
+    commits; a rolled-back transaction never reaches the shadow.
+    """
+
+    def __init__(self, primary, shadow, read_sample_rate=0.01, mirror_writes=False,
+                 max_pending=1000, max_mismatch_samples=100, registry=REGISTRY):
+        self.primary = primary
+        self.shadow = shadow
+        self.read_sample_rate = read_sample_rate
+        self.mirror_writes = mirror_writes
+        self.max_pending = max_pending
+
+        # One worker keeps mirrored writes in primary order
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='shadow-db')
+        self._lock = threading.Lock()
+        self._pending = 0
+        self._latency = {}
+        self._counters = {'compared': 0, 'mismatches': 0, 'dropped': 0, 'shadow_errors': 0}
+        self._mismatches = deque(maxlen=max_mismatch_samples)
+        # Mirrored writes held back by this thread's open transaction
+        self._local = threading.local()
+
+        self._events = registry.counter(
+            'shadow_db_events_total',
+            'Shadow backend outcomes (compared, mismatches, dropped, shadow_errors).', ['event'])
+        self._durations = registry.histogram(
+            'shadow_db_call_duration_seconds', 'Store call latency per backend.',
+            ['backend', 'method'])
+        registry.gauge('shadow_db_pending', 'Shadow calls queued or running.',
+                       function=lambda: self._pending)
+
+    def __getattr__(self, name):
+        # Anything not shadowed (e.g. snapshot_users) goes to the primary only
+        return getattr(self.primary, name)
+
+    # Reads
+
+    def get_all_users(self):
+        """Get all users (shadow-sampled)"""
+        return self._read('get_all_users')
+
+    def get_user_by_id(self, user_id):
+        """Get user by ID (shadow-sampled)"""
+        return self._read('get_user_by_id', user_id)
+
+    def get_users_by_ids(self, user_ids):
+        """Get users by ID, in request order (shadow-sampled)"""
+        return self._read('get_users_by_ids', list(user_ids))
+
+    def get_user_by_email(self, email):
+        """Get user by email (shadow-sampled)"""
+        return self._read('get_user_by_email', email)
+
+    def search_users_by_name(self, name):
+        """Search users by name (shadow-sampled)"""
+        return self._read('search_users_by_name', name)
+
+    # Writes
+
+    @contextmanager
+    def transaction(self):
+        """Primary transaction; its mirrored writes are submitted on commit, dropped on rollback"""
+        if getattr(self._local, 'mirrored', None) is not None:
+            with self.primary.transaction():
+                yield
+            return
+        mirrored = self._local.mirrored = []
+        try:
+            with self.primary.transaction():
+                yield
+        finally:
+            self._local.mirrored = None
+        for fn, args in mirrored:
+            self._submit(fn, *args)
+
+    def create_user(self, name, email, password_hash):
+        """Create a new user (mirrored)"""
+        user_id = self._call_primary('create_user', name, email, password_hash)
+        if self.mirror_writes:
+            self._mirror_write(self._mirror_created_id, user_id)
+        return user_id
+
+    def create_user_if_email_absent(self, name, email, password_hash):
+        """Insert-if-absent on the primary (mirrored)"""
+        user = self._call_primary('create_user_if_email_absent', name, email, password_hash)
+        if user and self.mirror_writes:
+            self._mirror_write(self._mirror, 'bulk_load_users', [user])
+        return user
+
+    def bulk_create_users(self, users):
+        """Bulk create on the primary (mirrored)"""
+        created = self._call_primary('bulk_create_users', users)
+        rows = [user for user in created if user]
+        if rows and self.mirror_writes:
+            self._mirror_write(self._mirror, 'bulk_load_users', rows)
+        return created
+
+    def bulk_load_users(self, users):
+        """Bulk load on the primary (mirrored)"""
+        inserted = self._call_primary('bulk_load_users', users)
+        if self.mirror_writes:
+            self._mirror_write(self._mirror, 'bulk_load_users', users)
+        return inserted
+
+    def update_user(self, user_id, user_data):
+        """Update user with provided data (mirrored)"""
+        self.update_user_returning(user_id, user_data)
+
+    def update_user_returning(self, user_id, user_data, expected_version=None):
+        """Update-returning on the primary (mirrored without the version guard)"""
+        user = self._call_primary('update_user_returning', user_id, user_data,
+                                  expected_version=expected_version)
+        if user and self.mirror_writes:
+            self._mirror_write(self._mirror, 'update_user_returning', user_id, dict(user_data))
+        return user
+
+    def delete_user(self, user_id):
+        """Delete user by ID (mirrored)"""
+        return self.delete_user_returning(user_id) is not None
+
+    def delete_user_returning(self, user_id, expected_version=None):
+        """Delete-returning on the primary (mirrored without the version guard)"""
+        user = self._call_primary('delete_user_returning', user_id,
+                                  expected_version=expected_version)
+        if user and self.mirror_writes:
+            self._mirror_write(self._mirror, 'delete_user_returning', user_id)
+        return user
+
+    # Reporting
+
+    def stats(self):
+        """Per-method latency summaries for both backends plus comparison counters"""
+        with self._lock:
+            latency = dict(self._latency)
+            counters = dict(self._counters, pending=self._pending)
+            mismatches = list(self._mismatches)
+        return {
+            'latency': {
+                f"{backend}.{method}": histogram.summary()
+                for (backend, method), histogram in sorted(latency.items())
+            },
+            'counters': counters,
+            'recent_mismatches': mismatches
+        }
+
+    def flush(self):
+        """Block until every queued shadow call has run (for tests and shutdown)"""
+        self._executor.submit(lambda: None).result()
+
+    # Internals
+
+    def _observe(self, backend, method, seconds):
+        key = (backend, method)
+        histogram = self._latency.get(key)
+        if histogram is None:
+            with self._lock:
+                histogram = self._latency.setdefault(key, LatencyHistogram())
+        histogram.observe(seconds)
+        self._durations.observe(seconds, backend=backend, method=method)
+
+    def _count(self, event):
+        with self._lock:
+            self._counters[event] += 1
+        self._events.inc(event=event)
+
+    def _call_primary(self, method, *args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return getattr(self.primary, method)(*args, **kwargs)
+        finally:
+            self._observe('primary', method, time.perf_counter() - start)
+
+    def _call_shadow(self, method, *args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return getattr(self.shadow, method)(*args, **kwargs)
+        finally:
+            self._observe('shadow', method, time.perf_counter() - start)
+
+    def _read(self, method, *args):
+        result = self._call_primary(method, *args)
+        # Inside a transaction the shadow has not seen its writes yet
+        if getattr(self._local, 'mirrored', None) is not None:
+            return result
+        if self.read_sample_rate and random.random() < self.read_sample_rate:
+            self._submit(self._compare, method, args, _comparable(result))
+        return result
+
+    def _submit(self, fn, *args):
+        """Queue a shadow call unless the backlog is full"""
+        with self._lock:
+            dropped = self._pending >= self.max_pending
+            if not dropped:
+                self._pending += 1
+        if dropped:
+            self._count('dropped')
+            return
+        self._executor.submit(self._run, fn, *args)
+
+    def _mirror_write(self, fn, *args):
+        """Submit a mirrored write, or hold it until this thread's transaction commits"""
+        mirrored = getattr(self._local, 'mirrored', None)
+        if mirrored is not None:
+            mirrored.append((fn, args))
+        else:
+            self._submit(fn, *args)
+
+    def _run(self, fn, *args):
+        try:
+            fn(*args)
+        except Exception as e:
+            self._count('shadow_errors')
+            logger.warning("Shadow backend call failed: %s", e)
+        finally:
+            with self._lock:
+                self._pending -= 1
+
+    def _compare(self, method, args, expected):
+        actual = _comparable(self._call_shadow(method, *args))
+        self._count('compared')
+        if actual == expected:
+            return
+        self._count('mismatches')
+        with self._lock:
+            self._mismatches.append({
+                'method': method,
+                'args': [repr(arg) for arg in args],
+                'primary': repr(expected)[:500],
+                'shadow': repr(actual)[:500]
+            })
+        logger.warning("Shadow mismatch in %s%r", method, args)
+
+    def _mirror(self, method, *args):
+        self._call_shadow(method, *args)
+
+    def _mirror_created_id(self, user_id):
+        user = self.primary.get_user_by_id(user_id)
+        if user:
+            self._call_shadow('bulk_load_users', [user])
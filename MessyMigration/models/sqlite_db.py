@@ -0,0 +1,464 @@
+"""
+SQLite Database Module
+Persistent DatabaseManager backend, selected with DATABASE_URL=sqlite:///path
+"""
+
+import json
+import logging
+import os
+import sqlite3
+import threading
+from contextlib import contextmanager
+from datetime import datetime
+
+from models.db import DuplicateEmailError, VersionConflictError
+
+from utils.tracing import traced
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS users (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    name TEXT NOT NULL,
+    email TEXT NOT NULL UNIQUE,
+    password_hash TEXT NOT NULL,
+    created_at TEXT NOT NULL,
+    version INTEGER NOT NULL DEFAULT 1
+);
+CREATE INDEX IF NOT EXISTS idx_users_created_at ON users (created_at);
+CREATE TABLE IF NOT EXISTS store_meta (
+    key TEXT PRIMARY KEY,
+    value INTEGER NOT NULL
+);
+INSERT OR IGNORE INTO store_meta (key, value) VALUES ('version', 0);
+INSERT OR IGNORE INTO store_meta (key, value) VALUES ('change_log_size', 100000);
+-- One row per users change, seq being the store version it produced, with
+-- the row as it was after the change (NULLs for a delete)
+CREATE TABLE IF NOT EXISTS user_change_log (
+    seq INTEGER PRIMARY KEY,
+    op TEXT NOT NULL,
+    user_id INTEGER NOT NULL,
+    name TEXT,
+    email TEXT,
+    password_hash TEXT,
+    created_at TEXT,
+    version INTEGER
+);
+CREATE TRIGGER IF NOT EXISTS users_log_insert AFTER INSERT ON users
+BEGIN
+    UPDATE store_meta SET value = value + 1 WHERE key = 'version';
+    INSERT INTO user_change_log (seq, op, user_id, name, email, password_hash, created_at, version)
+        SELECT value, 'create', NEW.id, NEW.name, NEW.email, NEW.password_hash, NEW.created_at, NEW.version
+        FROM store_meta WHERE key = 'version';
+    DELETE FROM user_change_log WHERE seq <= (
+        SELECT version.value - size.value FROM store_meta AS version, store_meta AS size
+        WHERE version.key = 'version' AND size.key = 'change_log_size');
+END;
+CREATE TRIGGER IF NOT EXISTS users_log_update AFTER UPDATE ON users
+BEGIN
+    UPDATE store_meta SET value = value + 1 WHERE key = 'version';
+    INSERT INTO user_change_log (seq, op, user_id, name, email, password_hash, created_at, version)
+        SELECT value, 'update', NEW.id, NEW.name, NEW.email, NEW.password_hash, NEW.created_at, NEW.version
+        FROM store_meta WHERE key = 'version';
+    DELETE FROM user_change_log WHERE seq <= (
+        SELECT version.value - size.value FROM store_meta AS version, store_meta AS size
+        WHERE version.key = 'version' AND size.key = 'change_log_size');
+END;
+CREATE TRIGGER IF NOT EXISTS users_log_delete AFTER DELETE ON users
+BEGIN
+    UPDATE store_meta SET value = value + 1 WHERE key = 'version';
+    INSERT INTO user_change_log (seq, op, user_id, name, email, password_hash, created_at, version)
+        SELECT value, 'delete', OLD.id, NULL, NULL, NULL, NULL, NULL
+        FROM store_meta WHERE key = 'version';
+    DELETE FROM user_change_log WHERE seq <= (
+        SELECT version.value - size.value FROM store_meta AS version, store_meta AS size
+        WHERE version.key = 'version' AND size.key = 'change_log_size');
+END;
+'''
+
+USER_COLUMNS = 'id, name, email, password_hash, created_at, version'
+
+# Column expressions for get_user_columns; created_at text becomes epoch
+# milliseconds rounded half up, exactly as models.db.epoch_millis does
+COLUMN_EXPRESSIONS = {
+    'created_at': "CAST(round((julianday(created_at) - 2440587.5) * 86400000) AS INTEGER)"
+}
+
+# Rows fetched per round trip when iterating a snapshot
+SNAPSHOT_FETCH_ROWS = 1000
+
+def _format_timestamp(value):
+    """Fixed-width ISO timestamps so text order matches time order"""
+    return value.isoformat(timespec='microseconds')
+
+def _version_guard(expected_version):
+    """WHERE clause suffix and parameters for an expected version (an int or a set)"""
+    if isinstance(expected_version, int):
+        return ' AND version = ?', [expected_version]
+    versions = sorted(expected_version)
+    return f" AND version IN ({', '.join('?' * len(versions))})", versions
+
+def _row_to_user(cursor, row):
+    """sqlite3 row factory producing the same dicts as the in-memory store"""
+    user = {column[0]: value for column, value in zip(cursor.description, row)}
+    # created_at is NULL only in change log entries for deleted users
+    if user.get('created_at') is not None:
+        user['created_at'] = datetime.fromisoformat(user['created_at'])
+    return user
+
+class SQLiteDatabaseManager:
+    """Database manager backed by a SQLite file"""
+
+    def __init__(self, db_url):
+        self.path = db_url[len('sqlite:///'):] if db_url.startswith('sqlite:///') else db_url
+        self._local = threading.local()
+        conn = self._conn()
+        conn.executescript(SCHEMA)
+        conn.execute(
+            "UPDATE store_meta SET value = ? WHERE key = 'change_log_size'",
+            (int(os.environ.get('CHANGE_LOG_SIZE', '100000')),)
+        )
+
+    def _conn(self):
+        """Per-thread connection; sqlite3 connections must not be shared"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = self._open()
+            self._local.conn = conn
+        return conn
+
+    def _open(self):
+        """Open a connection in autocommit mode with WAL enabled"""
+        conn = sqlite3.connect(self.path, isolation_level=None, timeout=30)
+        conn.row_factory = _row_to_user
+        # WAL lets readers keep a snapshot while a writer commits
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        return conn
+
+    @traced('store')
+    def get_all_users(self):
+        """Get all users, newest first"""
+        try:
+            return self._conn().execute(
+                'SELECT id, name, email, created_at, version FROM users '
+                'ORDER BY created_at DESC, id'
+            ).fetchall()
+        except Exception as e:
+            logger.error("Error in get_all_users: %s", e)
+            raise
+
+    @traced('store')
+    def get_user_columns(self, fields):
+        """Public fields of every user as parallel lists, newest first"""
+        try:
+            columns = ', '.join(COLUMN_EXPRESSIONS.get(field, field) for field in fields)
+            cursor = self._conn().cursor()
+            # Plain tuples: no per-row dict or datetime to build
+            cursor.row_factory = None
+            rows = cursor.execute(
+                f'SELECT {columns} FROM users ORDER BY created_at DESC, id'
+            ).fetchall()
+            values = list(zip(*rows)) if rows else [()] * len(fields)
+            return {field: list(column) for field, column in zip(fields, values)}
+        except Exception as e:
+            logger.error("Error in get_user_columns: %s", e)
+            raise
+
+    @traced('store')
+    def snapshot_users(self):
+        """
+        Iterate every user row, in id order, from one read transaction.
+
+        Uses its own connection so the snapshot stays open while the caller
+        streams it; under WAL this never blocks writers.
+        """
+        try:
+            conn = self._open()
+            conn.execute('BEGIN')
+            cursor = conn.execute(f'SELECT {USER_COLUMNS} FROM users ORDER BY id')
+        except Exception as e:
+            logger.error("Error in snapshot_users: %s", e)
+            raise
+        return self._iter_snapshot(conn, cursor)
+
+    def _iter_snapshot(self, conn, cursor):
+        """Yield snapshot rows, closing the connection when done"""
+        try:
+            while True:
+                rows = cursor.fetchmany(SNAPSHOT_FETCH_ROWS)
+                if not rows:
+                    return
+                yield from rows
+        finally:
+            conn.close()
+
+    @contextmanager
+    def transaction(self):
+        """
+        Run several store calls in one write transaction on this thread's
+        connection, committed when the block ends and rolled back if it raises.
+        Nested transactions join the outer one.
+        """
+        with self._write():
+            yield
+
+    @contextmanager
+    def _write(self):
+        """Connection in a write transaction: its own, or the open transaction()"""
+        conn = self._conn()
+        if conn.in_transaction:
+            yield conn
+            return
+        with conn:
+            conn.execute('BEGIN IMMEDIATE')
+            yield conn
+
+    def store_version(self):
+        """Counter bumped by triggers on every row change, from any process"""
+        return self._conn().execute(
+            "SELECT value FROM store_meta WHERE key = 'version'"
+        ).fetchone()['value']
+
+    @traced('store')
+    def get_changes(self, since, limit):
+        """
+        Row changes after version since, at most limit of them, latest per user.
+
+        Returns:
+            dict or None: as DatabaseManager.get_changes
+        """
+        try:
+            conn = self._conn()
+            with conn:
+                # One read transaction: version and log agree
+                conn.execute('BEGIN')
+                current = self.store_version()
+                oldest = conn.execute('SELECT min(seq) AS seq FROM user_change_log').fetchone()['seq']
+                floor = oldest - 1 if oldest is not None else current
+                if not floor <= since <= current:
+                    return None
+                upto = min(current, since + limit)
+                # max(seq) makes SQLite take the other columns from each
+                # user's latest change, i.e. the row as of upto
+                rows = conn.execute(
+                    'SELECT max(seq) AS last_seq, op, user_id, name, email, password_hash, '
+                    'created_at, version FROM user_change_log WHERE seq > ? AND seq <= ? '
+                    'GROUP BY user_id ORDER BY last_seq',
+                    (since, upto)
+                ).fetchall()
+            changes = []
+            for row in rows:
+                del row['last_seq']
+                op, user_id = row.pop('op'), row.pop('user_id')
+                user = None if op == 'delete' else dict(row, id=user_id)
+                changes.append({'op': op, 'id': user_id, 'user': user})
+            return {'version': upto, 'more': upto < current, 'changes': changes}
+        except Exception as e:
+            logger.error("Error in get_changes: %s", e)
+            raise
+
+    def store_stats(self):
+        """Row count and per-index entry counts, for monitoring"""
+        rows = self._conn().execute('SELECT count(*) AS n FROM users').fetchone()['n']
+        # Every index on users covers every row
+        return {'rows': rows, 'indexes': {'id': rows, 'email': rows, 'created_at': rows}}
+
+    @traced('store')
+    def get_user_by_id(self, user_id):
+        """Get user by ID"""
+        try:
+            return self._conn().execute(
+                f'SELECT {USER_COLUMNS} FROM users WHERE id = ?', (int(user_id),)
+            ).fetchone()
+        except Exception as e:
+            logger.error("Error in get_user_by_id: %s", e)
+            raise
+
+    @traced('store')
+    def get_users_by_ids(self, user_ids):
+        """Look up many users by ID in one query; None where an ID is missing"""
+        try:
+            ids = [int(user_id) for user_id in user_ids]
+            # One primary-key probe per distinct ID, with no bound-parameter limit
+            rows = self._conn().execute(
+                f'SELECT {USER_COLUMNS} FROM users '
+                'WHERE id IN (SELECT value FROM json_each(?))',
+                (json.dumps(ids),)
+            ).fetchall()
+            by_id = {row['id']: row for row in rows}
+            return [by_id.get(user_id) for user_id in ids]
+        except Exception as e:
+            logger.error("Error in get_users_by_ids: %s", e)
+            raise
+
+    @traced('store')
+    def get_user_by_email(self, email):
+        """Get user by email"""
+        try:
+            return self._conn().execute(
+                f'SELECT {USER_COLUMNS} FROM users WHERE email = ?', (email,)
+            ).fetchone()
+        except Exception as e:
+            logger.error("Error in get_user_by_email: %s", e)
+            raise
+
+    @traced('store')
+    def create_user(self, name, email, password_hash):
+        """Create a new user"""
+        try:
+            user = self.create_user_if_email_absent(name, email, password_hash)
+            if user is None:
+                raise DuplicateEmailError(email)
+            return user['id']
+        except Exception as e:
+            logger.error("Error in create_user: %s", e)
+            raise
+
+    @traced('store')
+    def create_user_if_email_absent(self, name, email, password_hash):
+        """Atomically create a user unless the email is already taken"""
+        try:
+            return self._conn().execute(
+                'INSERT OR IGNORE INTO users (name, email, password_hash, created_at) '
+                f'VALUES (?, ?, ?, ?) RETURNING {USER_COLUMNS}',
+                (name, email, password_hash, _format_timestamp(datetime.now()))
+            ).fetchone()
+        except Exception as e:
+            logger.error("Error in create_user_if_email_absent: %s", e)
+            raise
+
+    @traced('store')
+    def bulk_create_users(self, users):
+        """Insert many users in one transaction; None where the email existed"""
+        try:
+            created_at = _format_timestamp(datetime.now())
+            with self._write() as conn:
+                return [
+                    conn.execute(
+                        'INSERT OR IGNORE INTO users (name, email, password_hash, created_at) '
+                        f'VALUES (?, ?, ?, ?) RETURNING {USER_COLUMNS}',
+                        (user['name'], user['email'], user['password_hash'], created_at)
+                    ).fetchone()
+                    for user in users
+                ]
+        except Exception as e:
+            logger.error("Error in bulk_create_users: %s", e)
+            raise
+
+    @traced('store')
+    def bulk_load_users(self, users):
+        """
+        Load rows that already carry their id and created_at.
+
+        Rows whose id or email already exists are skipped, so re-loading the
+        same chunk (e.g. after an interrupted migration) is harmless.
+
+        Returns:
+            int: number of rows inserted
+        """
+        try:
+            with self._write() as conn:
+                # rowcount, unlike total_changes, leaves out the version triggers
+                cursor = conn.executemany(
+                    'INSERT OR IGNORE INTO users (id, name, email, password_hash, created_at) '
+                    'VALUES (?, ?, ?, ?, ?)',
+                    [
+                        (user['id'], user['name'], user['email'], user['password_hash'],
+                         _format_timestamp(user['created_at']))
+                        for user in users
+                    ]
+                )
+                return cursor.rowcount
+        except Exception as e:
+            logger.error("Error in bulk_load_users: %s", e)
+            raise
+
+    @traced('store')
+    def update_user(self, user_id, user_data):
+        """Update user with provided data"""
+        try:
+            self.update_user_returning(user_id, user_data)
+        except Exception as e:
+            logger.error("Error in update_user: %s", e)
+            raise
+
+    @traced('store')
+    def update_user_returning(self, user_id, user_data, expected_version=None):
+        """Atomically update a user and return the resulting row"""
+        changes = {
+            key: value for key, value in user_data.items()
+            if key in ['name', 'email', 'password_hash']
+        }
+        assignments = ''.join(f'{key} = ?, ' for key in changes)
+        sql = f'UPDATE users SET {assignments}version = version + 1 WHERE id = ?'
+        params = list(changes.values()) + [int(user_id)]
+        if expected_version is not None:
+            guard, versions = _version_guard(expected_version)
+            sql += guard
+            params.extend(versions)
+        try:
+            with self._write() as conn:
+                try:
+                    user = conn.execute(f'{sql} RETURNING {USER_COLUMNS}', params).fetchone()
+                except sqlite3.IntegrityError:
+                    raise DuplicateEmailError(changes.get('email'))
+                if user is None:
+                    self._raise_if_exists(conn, user_id, expected_version)
+                return user
+        except (DuplicateEmailError, VersionConflictError):
+            raise
+        except Exception as e:
+            logger.error("Error in update_user_returning: %s", e)
+            raise
+
+    @traced('store')
+    def delete_user(self, user_id):
+        """Delete user by ID"""
+        try:
+            return self.delete_user_returning(user_id) is not None
+        except Exception as e:
+            logger.error("Error in delete_user: %s", e)
+            raise
+
+    @traced('store')
+    def delete_user_returning(self, user_id, expected_version=None):
+        """Atomically delete a user and return the removed row"""
+        sql = 'DELETE FROM users WHERE id = ?'
+        params = [int(user_id)]
+        if expected_version is not None:
+            guard, versions = _version_guard(expected_version)
+            sql += guard
+            params.extend(versions)
+        try:
+            with self._write() as conn:
+                user = conn.execute(f'{sql} RETURNING {USER_COLUMNS}', params).fetchone()
+                if user is None:
+                    self._raise_if_exists(conn, user_id, expected_version)
+                return user
+        except VersionConflictError:
+            raise
+        except Exception as e:
+            logger.error("Error in delete_user_returning: %s", e)
+            raise
+
+    def _raise_if_exists(self, conn, user_id, expected_version):
+        """A guarded write matched nothing: tell a stale version from a missing row"""
+        row = conn.execute('SELECT version FROM users WHERE id = ?', (int(user_id),)).fetchone()
+        if row is not None:
+            raise VersionConflictError(
+                f"user {user_id} is at version {row['version']}, expected {expected_version}"
+            )
+
+    @traced('store')
+    def search_users_by_name(self, name):
+        """Search users by name (case-insensitive)"""
+        try:
+            return self._conn().execute(
+                f'SELECT {USER_COLUMNS} FROM users WHERE instr(lower(name), ?) > 0 ORDER BY name, id',
+                (name.lower(),)
+            ).fetchall()
+        except Exception as e:
+            logger.error("Error in search_users_by_name: %s", e)
+            raise
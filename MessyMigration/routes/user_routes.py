@@ -3,46 +3,304 @@ User Routes Module
 Handles all user-related HTTP endpoints
 """
 
-from flask import Blueprint, request, jsonify
-from services.user_service import UserService
+from flask import Blueprint, Response, current_app, request, jsonify, stream_with_context
+from services.user_service import PUBLIC_FIELDS, UserService
 from utils.validation import validate_user_data, validate_login_data
+from utils.tracing import traced
+from utils.admission import admission_class
+from utils.scheduling import priority_class
+from utils.compression import cache_compressed
+from utils.rate_limit import LoginRateLimiter
+import csv
+import io
+import json
 import logging
+import re
+
+logger = logging.getLogger(__name__)
 
 user_bp = Blueprint('users', __name__)
 user_service = UserService()
+login_rate_limiter = LoginRateLimiter.from_env()
+
+# Rows per chunk written to a streaming export response
+EXPORT_CHUNK_ROWS = 500
+EXPORT_FIELDS = ['id', 'name', 'email', 'created_at', 'version']
+
+# Validated rows held before hashing and inserting them as one batch; this
+# bounds import memory and is what applies backpressure to the upload
+IMPORT_BATCH_SIZE = 100
+IMPORT_MAX_LINE_BYTES = 64 * 1024
+
+def _etag(user):
+    """Strong ETag for a user row, derived from its version"""
+    return f'"{user["version"]}"'
+
+# If-Match list syntax (RFC 9110): separators, then [W/]"opaque-tag" items
+_LIST_SEPARATORS = re.compile(r'[ \t,]*')
+_ENTITY_TAG = re.compile(r'(W/)?"([^"]*)"[ \t]*(?:,|\Z)')
+
+def _expected_version():
+    """
+    Map the If-Match header onto the user versions it accepts.
+
+    If-Match is '*' or a list of entity tags, and the write goes ahead when
+    the stored version matches any of them. Matching is strong, so weak tags
+    (W/"1") and tags that are not versions never match.
+
+    Returns:
+        tuple: (ok, versions) - ok is False when the header is malformed;
+        versions is None when the header is absent or '*', otherwise the set
+        of acceptable versions (empty when nothing can match)
+    """
+    value = request.headers.get('If-Match')
+    if value is None or value.strip() == '*':
+        return True, None
+    if not value.strip():
+        return False, None
+    versions = set()
+    position = 0
+    while True:
+        position = _LIST_SEPARATORS.match(value, position).end()
+        if position == len(value):
+            break
+        match = _ENTITY_TAG.match(value, position)
+        if match is None:
+            return False, None
+        weak, tag = match.groups()
+        if not weak and tag.isascii() and tag.isdigit():
+            versions.add(int(tag))
+        position = match.end()
+    return True, versions
 
 @user_bp.route('/', methods=['GET'])
+@traced('route')
 def home():
     """Root endpoint - API information"""
     return jsonify({
         "message": "User Management API - Refactored",
         "version": "1.0.0",
         "endpoints": {
-            "GET /users": "List all users",
+            "GET /users?fields=id,name": "List all users (optionally only some fields)",
+            "GET /users?layout=columns": "List all users as one array per field (epoch ms timestamps)",
+            "GET /users?ids=1,2,3": "Get users by id, in request order",
+            "POST /users/lookup": "Get users by id from a JSON body",
+            "GET /users/changes?since=<token>": "Users changed since a sync token, and a new token",
+            "GET /users/export?format=ndjson|csv": "Stream all users",
             "POST /users": "Create a new user",
+            "POST /users/import": "Bulk create users from NDJSON",
             "PUT /user/<id>": "Update a user",
             "DELETE /user/<id>": "Delete a user",
+            "POST /batch": "Run many create/update/delete/get operations, optionally all-or-nothing",
             "POST /login": "User authentication",
-            "GET /search?name=xyz": "Search users by name"
+            "GET /search?name=xyz&fields=id,name": "Search users by name"
         }
     }), 200
 
+# Longest ID list accepted by one multi-get
+MAX_LOOKUP_IDS = 10000
+
+def _parse_ids(values, from_query=False):
+    """
+    Positive integer IDs; None if any is invalid.
+
+    Query-string values are digit strings and are converted; JSON body values
+    must already be integers, so 1.9, "7" and true are rejected.
+    """
+    ids = []
+    for value in values:
+        if from_query:
+            try:
+                value = int(value)
+            except ValueError:
+                return None
+        elif isinstance(value, bool) or not isinstance(value, int):
+            return None
+        if value < 1:
+            return None
+        ids.append(value)
+    return ids
+
+def _requested_fields():
+    """
+    Fields named in ?fields=id,name (None means all).
+
+    Returns:
+        tuple: (ok, fields); ok is False for unknown or empty field lists
+    """
+    spec = request.args.get('fields')
+    if spec is None:
+        return True, None
+    fields = list(dict.fromkeys(field.strip() for field in spec.split(',') if field.strip()))
+    if not fields or any(field not in PUBLIC_FIELDS for field in fields):
+        return False, None
+    return True, fields
+
+def _fields_error():
+    return jsonify({"error": f"fields must be a comma-separated subset of {', '.join(PUBLIC_FIELDS)}"}), 400
+
+def _lookup_response(ids, fields=None):
+    """Users for ids in request order (null where unknown), or a 400"""
+    if ids is None:
+        return jsonify({"error": "ids must be positive integers"}), 400
+    if not ids:
+        return jsonify({"error": "At least one id is required"}), 400
+    if len(ids) > MAX_LOOKUP_IDS:
+        return jsonify({"error": f"At most {MAX_LOOKUP_IDS} ids per request"}), 400
+    return jsonify(user_service.get_users_by_ids(ids, fields)), 200
+
 @user_bp.route('/users', methods=['GET'])
+@cache_compressed
+@traced('route')
 def get_users():
-    """Get all users"""
+    """
+    Get all users, or only those listed in ?ids=1,2,3; ?fields=id,name trims
+    each row and ?layout=columns returns one array per field
+    """
     try:
-        users = user_service.get_all_users()
+        ok, fields = _requested_fields()
+        if not ok:
+            return _fields_error()
+        layout = request.args.get('layout', 'rows')
+        if layout not in ('rows', 'columns'):
+            return jsonify({"error": "layout must be 'rows' or 'columns'"}), 400
+        ids = request.args.get('ids')
+        if ids is not None:
+            if layout == 'columns':
+                return jsonify({"error": "layout=columns cannot be combined with ids"}), 400
+            return _lookup_response(_parse_ids(filter(None, ids.split(',')), from_query=True), fields)
+        if layout == 'columns':
+            return jsonify(user_service.get_user_columns(fields)), 200
+        users = user_service.get_all_users(fields)
         return jsonify(users), 200
     except Exception as e:
-        logging.error(f"Error fetching users: {str(e)}")
+        logger.error("Error fetching users: %s", e)
+        return jsonify({"error": "Internal server error"}), 500
+
+def _chunked(lines):
+    """Group encoded lines into chunks so each write carries many rows"""
+    chunk = []
+    for line in lines:
+        chunk.append(line)
+        if len(chunk) >= EXPORT_CHUNK_ROWS:
+            yield ''.join(chunk)
+            chunk = []
+    if chunk:
+        yield ''.join(chunk)
+
+def _ndjson_lines(users, dumps):
+    """Encode users as newline-delimited JSON"""
+    for user in users:
+        yield dumps(user) + '\n'
+
+def _csv_lines(users):
+    """Encode users as CSV with a header row"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(EXPORT_FIELDS)
+    for user in users:
+        writer.writerow([
+            user['id'], user['name'], user['email'],
+            user['created_at'].isoformat(), user['version']
+        ])
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+
+@user_bp.route('/users/lookup', methods=['POST'])
+@traced('route')
+def lookup_users():
+    """Get the users listed in a JSON body {"ids": [...]}, for lists too long for a URL"""
+    try:
+        data = request.get_json(force=True, silent=True)
+        ids = data.get('ids') if isinstance(data, dict) else None
+        if not isinstance(ids, list):
+            return jsonify({"error": "Body must be {\"ids\": [...]}"}), 400
+        ok, fields = _requested_fields()
+        if not ok:
+            return _fields_error()
+        return _lookup_response(_parse_ids(ids), fields)
+    except Exception as e:
+        logger.error("Error looking up users: %s", e)
+        return jsonify({"error": "Internal server error"}), 500
+
+# Changes returned per page by default and at most
+CHANGES_PAGE = 1000
+MAX_CHANGES_PAGE = 10000
+
+@user_bp.route('/users/changes', methods=['GET'])
+@traced('route')
+def get_changes():
+    """
+    Users created, updated or deleted since ?since=<token>, latest state per user.
+
+    Without since, returns the current token only: take it before a full
+    GET /users download, then poll with it. 410 means the change log no
+    longer covers the token and the replica must be reloaded.
+    """
+    try:
+        since = request.args.get('since')
+        if since is not None:
+            try:
+                since = int(since)
+            except ValueError:
+                since = -1
+            if since < 0:
+                return jsonify({"error": "since must be a token returned by this endpoint"}), 400
+        try:
+            limit = int(request.args.get('limit', CHANGES_PAGE))
+        except ValueError:
+            limit = 0
+        if not 1 <= limit <= MAX_CHANGES_PAGE:
+            return jsonify({"error": f"limit must be between 1 and {MAX_CHANGES_PAGE}"}), 400
+
+        result = user_service.get_changes(since, limit)
+        if result is None:
+            return jsonify({
+                "error": "Changes since this token are no longer available; reload all users",
+                "resync_required": True,
+                "token": user_service.get_changes()['token']
+            }), 410
+        return jsonify(result), 200
+    except Exception as e:
+        logger.error("Error fetching changes: %s", e)
+        return jsonify({"error": "Internal server error"}), 500
+
+@user_bp.route('/users/export', methods=['GET'])
+@admission_class('export')
+@priority_class('bulk')
+@traced('route')
+def export_users():
+    """Stream all users as NDJSON or CSV"""
+    try:
+        export_format = request.args.get('format', 'ndjson')
+        if export_format not in ('ndjson', 'csv'):
+            return jsonify({"error": "Format must be 'ndjson' or 'csv'"}), 400
+
+        # Only now open the snapshot (a read transaction on SQLite)
+        users = user_service.export_users()
+        if export_format == 'ndjson':
+            # Bind the app's JSON encoder now; the body is produced after
+            # the request context is gone
+            lines = _ndjson_lines(users, current_app.json.dumps)
+            mimetype = 'application/x-ndjson'
+        else:
+            lines = _csv_lines(users)
+            mimetype = 'text/csv'
+
+        return Response(_chunked(lines), mimetype=mimetype)
+
+    except Exception as e:
+        logger.error("Error exporting users: %s", e)
         return jsonify({"error": "Internal server error"}), 500
 
 @user_bp.route('/users', methods=['POST'])
+@admission_class('hashing')
+@traced('route')
 def create_user():
     """Create a new user"""
     try:
         data = request.get_json(force=True)
-        print("Received user data:", data)  # For debugging
 
         # Validate input data
         validation_result = validate_user_data(data)
@@ -52,18 +310,111 @@ def create_user():
         # Create user
         result = user_service.create_user(data)
         if result["success"]:
-            return jsonify(result["user"]), 201
+            return jsonify(result["user"]), 201, {"ETag": _etag(result["user"])}
         else:
             return jsonify({"error": result["message"]}), 400
 
     except Exception as e:
-        logging.error(f"Error creating user: {str(e)}")
+        logger.error("Error creating user: %s", e)
         return jsonify({"error": "Internal server error"}), 500
 
+def _read_import_lines(stream):
+    """
+    Read the request body one line at a time.
+
+    Yields (line_number, line) for each non-blank line; line is None when
+    it exceeded IMPORT_MAX_LINE_BYTES and was skipped.
+    """
+    line_number = 0
+    while True:
+        line = stream.readline(IMPORT_MAX_LINE_BYTES + 1)
+        if not line:
+            return
+        line_number += 1
+        if len(line) > IMPORT_MAX_LINE_BYTES and not line.endswith(b'\n'):
+            while line and not line.endswith(b'\n'):
+                line = stream.readline(IMPORT_MAX_LINE_BYTES)
+            yield line_number, None
+            continue
+        line = line.strip()
+        if line:
+            yield line_number, line
+
+def _parse_import_line(line):
+    """Decode and validate one import line; returns (data, error)"""
+    if line is None:
+        return None, "Line too long"
+    try:
+        data = json.loads(line)
+    except ValueError:
+        return None, "Invalid JSON"
+    if not isinstance(data, dict):
+        return None, "Each line must be a JSON object"
+    validation_result = validate_user_data(data)
+    if not validation_result["valid"]:
+        return None, validation_result["message"]
+    return data, None
+
+def _import_batch(batch, totals, dumps):
+    """Create one batch of users; returns per-line errors plus a progress line"""
+    results = user_service.import_users([data for _, data in batch])
+    out = []
+    for (line_number, _), result in zip(batch, results):
+        if result["success"]:
+            totals["created"] += 1
+        else:
+            totals["failed"] += 1
+            out.append(dumps({"line": line_number, "error": result["message"]}) + '\n')
+    out.append(dumps(totals) + '\n')
+    return ''.join(out)
+
+def _import_stream(stream, dumps):
+    """Consume an NDJSON upload in bounded batches, streaming back progress"""
+    totals = {"processed": 0, "created": 0, "failed": 0}
+    batch = []
+    try:
+        for line_number, line in _read_import_lines(stream):
+            totals["processed"] += 1
+            data, error = _parse_import_line(line)
+            if error:
+                totals["failed"] += 1
+                yield dumps({"line": line_number, "error": error}) + '\n'
+                continue
+            batch.append((line_number, data))
+            if len(batch) >= IMPORT_BATCH_SIZE:
+                yield _import_batch(batch, totals, dumps)
+                batch = []
+        if batch:
+            yield _import_batch(batch, totals, dumps)
+    except Exception as e:
+        logger.error("Error importing users: %s", e)
+        yield dumps({"error": "Internal server error"}) + '\n'
+        return
+    yield dumps(dict(totals, done=True)) + '\n'
+
+@user_bp.route('/users/import', methods=['POST'])
+@admission_class('import')
+@priority_class('bulk')
+@traced('route')
+def import_users():
+    """Bulk create users from an NDJSON body, one user object per line"""
+    return Response(
+        stream_with_context(_import_stream(request.stream, current_app.json.dumps)),
+        mimetype='application/x-ndjson'
+    )
+
 @user_bp.route('/user/<int:user_id>', methods=['PUT'])
+@admission_class('hashing')
+@traced('route')
 def update_user(user_id):
-    """Update an existing user"""
+    """Update an existing user (honours If-Match for optimistic concurrency)"""
     try:
+        ok, expected_version = _expected_version()
+        if not ok:
+            return jsonify({"error": "Invalid If-Match header"}), 400
+        if expected_version == set():
+            return jsonify({"error": "Precondition failed"}), 412
+
         data = request.get_json(force=True)
 
         # Validate input data (partial for update)
@@ -72,33 +423,153 @@ def update_user(user_id):
             return jsonify({"error": validation_result["message"]}), 400
 
         # Update user
-        result = user_service.update_user(user_id, data)
+        result = user_service.update_user(user_id, data, expected_version=expected_version)
         if result["success"]:
-            return jsonify(result["user"]), 200
+            return jsonify(result["user"]), 200, {"ETag": _etag(result["user"])}
         elif result["message"] == "User not found":
             return jsonify({"error": "User not found"}), 404
+        elif result["message"] == "Version conflict":
+            return jsonify({"error": "Precondition failed"}), 412
         else:
             return jsonify({"error": result["message"]}), 400
 
     except Exception as e:
-        logging.error(f"Error updating user {user_id}: {str(e)}")
+        logger.error("Error updating user %s: %s", user_id, e)
         return jsonify({"error": "Internal server error"}), 500
 
 @user_bp.route('/user/<int:user_id>', methods=['DELETE'])
+@traced('route')
 def delete_user(user_id):
-    """Delete a user"""
+    """Delete a user (honours If-Match for optimistic concurrency)"""
     try:
-        result = user_service.delete_user(user_id)
+        ok, expected_version = _expected_version()
+        if not ok:
+            return jsonify({"error": "Invalid If-Match header"}), 400
+        if expected_version == set():
+            return jsonify({"error": "Precondition failed"}), 412
+
+        result = user_service.delete_user(user_id, expected_version=expected_version)
         if result["success"]:
             return jsonify({"message": "User deleted successfully"}), 200
+        elif result["message"] == "Version conflict":
+            return jsonify({"error": "Precondition failed"}), 412
         else:
             return jsonify({"error": "User not found"}), 404
 
     except Exception as e:
-        logging.error(f"Error deleting user {user_id}: {str(e)}")
+        logger.error("Error deleting user %s: %s", user_id, e)
         return jsonify({"error": "Internal server error"}), 500
 
+# Longest operation list accepted by one POST /batch
+MAX_BATCH_OPERATIONS = 1000
+BATCH_OPERATIONS = ('create', 'update', 'delete', 'get')
+
+def _parse_batch_operation(item):
+    """
+    Validate one POST /batch entry with the same rules as the single-user routes.
+
+    Returns:
+        tuple: (operation, error) - the operation for UserService.execute_batch,
+        or None and an error message
+    """
+    if not isinstance(item, dict) or item.get('op') not in BATCH_OPERATIONS:
+        return None, f"op must be one of {', '.join(BATCH_OPERATIONS)}"
+    operation = {'op': item['op']}
+    if item['op'] != 'create':
+        ids = _parse_ids([item.get('id')])
+        if ids is None:
+            return None, "id must be a positive integer"
+        operation['id'] = ids[0]
+    if item['op'] in ('update', 'delete') and item.get('version') is not None:
+        version = item['version']
+        if isinstance(version, bool) or not isinstance(version, int):
+            return None, "version must be an integer"
+        operation['expected_version'] = version
+    if item['op'] in ('create', 'update'):
+        data = item.get('data')
+        if not isinstance(data, dict):
+            return None, "data must be an object"
+        validation_result = validate_user_data(data, partial=item['op'] == 'update')
+        if not validation_result["valid"]:
+            return None, validation_result["message"]
+        operation['data'] = data
+    return operation, None
+
+def _batch_result(op, result):
+    """Status and body for one batch operation, as its single-user route would answer"""
+    if result["success"]:
+        if "user" in result:
+            return {"status": 201 if op == 'create' else 200, "body": result["user"]}
+        return {"status": 200, "body": {"message": result["message"]}}
+    message = result["message"]
+    if message == "Version conflict":
+        return {"status": 412, "error": "Precondition failed"}
+    status = {"User not found": 404, "Rolled back": 424, "Not executed": 424}.get(message, 400)
+    return {"status": status, "error": message}
+
+@user_bp.route('/batch', methods=['POST'])
+@admission_class('hashing')
+@priority_class('bulk')
+@traced('route')
+def batch():
+    """
+    Run many user operations in one request and one store transaction.
+
+    Body: {"operations": [{"op": "create|update|delete|get", "id": ..., "data": {...},
+    "version": ...}], "atomic": false}. With atomic, nothing is kept unless
+    every operation succeeds. On the in-memory backend concurrent readers can
+    see an atomic batch's writes before it commits or rolls back.
+    """
+    try:
+        data = request.get_json(force=True, silent=True)
+        operations = data.get('operations') if isinstance(data, dict) else None
+        if not isinstance(operations, list) or not operations:
+            return jsonify({"error": "Body must be {\"operations\": [...]}"}), 400
+        if len(operations) > MAX_BATCH_OPERATIONS:
+            return jsonify({"error": f"At most {MAX_BATCH_OPERATIONS} operations per batch"}), 400
+        atomic = data.get('atomic', False)
+        if not isinstance(atomic, bool):
+            return jsonify({"error": "atomic must be true or false"}), 400
+
+        parsed = [_parse_batch_operation(item) for item in operations]
+        results = [{"status": 400, "error": error} if error else None for _, error in parsed]
+        if atomic and any(results):
+            results = [result or {"status": 424, "error": "Not executed"} for result in results]
+            return jsonify({"committed": False, "results": results}), 200
+
+        valid = [(index, operation) for index, (operation, _) in enumerate(parsed) if operation]
+        outcomes, committed = user_service.execute_batch(
+            [operation for _, operation in valid], atomic=atomic
+        )
+        for (index, operation), outcome in zip(valid, outcomes):
+            results[index] = _batch_result(operation['op'], outcome)
+        return jsonify({"committed": committed, "results": results}), 200
+
+    except Exception as e:
+        logger.error("Error running batch: %s", e)
+        return jsonify({"error": "Internal server error"}), 500
+
+def limit_logins():
+    """
+    before_request hook refusing logins over their failed-attempt budget.
+
+    create_app registers it ahead of admission and scheduling, so a
+    rate-limited client is turned away without waiting for a hashing slot.
+    Invalid payloads are left for the login view to reject.
+    """
+    if request.endpoint != 'users.login':
+        return None
+    data = request.get_json(force=True, silent=True)
+    if not isinstance(data, dict) or not validate_login_data(data)["valid"]:
+        return None
+    retry_after = login_rate_limiter.check(request.remote_addr, data['email'])
+    if retry_after is not None:
+        return jsonify({"error": "Too many login attempts"}), 429, {"Retry-After": str(retry_after)}
+    return None
+
 @user_bp.route('/login', methods=['POST'])
+@admission_class('hashing')
+@traced('route')
 def login():
     """User login endpoint"""
     try:
@@ -112,6 +583,7 @@ def login():
         # Authenticate
         result = user_service.authenticate_user(data.get('email'), data.get('password'))
         if result["success"]:
+            login_rate_limiter.succeeded(request.remote_addr, data['email'])
             return jsonify({
                 "message": "Login successful",
                 "user": result["user"]
@@ -120,12 +592,14 @@ def login():
             return jsonify({"error": "Invalid credentials"}), 401
 
     except Exception as e:
-        logging.error(f"Error during login: {str(e)}")
+        logger.error("Error during login: %s", e)
         return jsonify({"error": "Internal server error"}), 500
 
 @user_bp.route('/search', methods=['GET'])
+@cache_compressed
+@traced('route')
 def search_users():
-    """Search users by name"""
+    """Search users by name; ?fields=id,name trims each row"""
     try:
         name = request.args.get('name')
         if not name:
@@ -135,9 +609,13 @@ def search_users():
         if len(name) < 1:
             return jsonify({"error": "Search term must be at least 1 character"}), 400
 
-        users = user_service.search_users_by_name(name)
+        ok, fields = _requested_fields()
+        if not ok:
+            return _fields_error()
+
+        users = user_service.search_users_by_name(name, fields)
         return jsonify(users), 200
 
     except Exception as e:
-        logging.error(f"Error searching users: {str(e)}")
+        logger.error("Error searching users: %s", e)
         return jsonify({"error": "Internal server error"}), 500
@@ -3,149 +3,283 @@ User Service Module
 Contains all business logic for user operations
 """
 
-from models.db import DatabaseManager
-from werkzeug.security import generate_password_hash, check_password_hash
+from models.db import DuplicateEmailError, VersionConflictError, create_database_manager
+from utils.credential_cache import CredentialCache
+from utils.hashing import hash_password, hash_passwords, verify_password
+from utils.tracing import traced
 import logging
 import re
 import os
 
+logger = logging.getLogger(__name__)
+
+# Fields a client may see, in response order
+PUBLIC_FIELDS = ('id', 'name', 'email', 'created_at', 'version')
+
+def _projector(fields=None):
+    """Function projecting a stored row onto fields (every public field when None)"""
+    if fields is None:
+        return _safe_user
+    fields = tuple(fields)
+    return lambda user: {field: user[field] for field in fields}
+
+def _safe_user(user):
+    """Project a stored user row onto its public fields (no password hash)"""
+    return {
+        'id': user['id'],
+        'name': user['name'],
+        'email': user['email'],
+        'created_at': user['created_at'],
+        'version': user['version']
+    }
+
+class _BatchAborted(Exception):
+    """Raised inside an atomic batch's transaction to roll it back"""
+
 class UserService:
     """Service class for user-related business logic"""
     
     def __init__(self):
         db_url = os.environ.get('DATABASE_URL')
-        self.db = DatabaseManager(db_url)
+        self.db = create_database_manager(db_url)
+        
+        # Optionally exercise a candidate backend alongside the primary
+        shadow_url = os.environ.get('SHADOW_DATABASE_URL')
+        if shadow_url:
+            from models.shadow_db import ShadowDatabaseManager
+            self.db = ShadowDatabaseManager(
+                self.db,
+                create_database_manager(shadow_url),
+                read_sample_rate=float(os.environ.get('SHADOW_READ_SAMPLE_RATE', '0.01')),
+                mirror_writes=os.environ.get('SHADOW_MIRROR_WRITES', '').lower() in ('1', 'true', 'yes')
+            )
+        
+        # Opt-in cache of recently verified logins (None when disabled)
+        self.credential_cache = CredentialCache.from_env()
     
-    def get_all_users(self):
-        """Retrieve all users (excluding password hashes)"""
+    @traced('service')
+    def get_all_users(self, fields=None):
+        """Retrieve all users (excluding password hashes), optionally only some fields"""
         try:
             users = self.db.get_all_users()
             # Remove password hashes from response
-            safe_users = []
-            for user in users:
-                safe_user = {
-                    'id': user['id'],
-                    'name': user['name'],
-                    'email': user['email'],
-                    'created_at': user['created_at']
-                }
-                safe_users.append(safe_user)
-            return safe_users
+            project = _projector(fields)
+            return [project(user) for user in users]
+        except Exception as e:
+            logger.error("Error in get_all_users: %s", e)
+            raise
+    
+    @traced('service')
+    def get_users_by_ids(self, user_ids, fields=None):
+        """
+        Retrieve many users by ID in one store call.
+
+        Returns:
+            list: public user dicts in request order, None for unknown IDs
+        """
+        try:
+            project = _projector(fields)
+            return [
+                project(user) if user else None
+                for user in self.db.get_users_by_ids(user_ids)
+            ]
+        except Exception as e:
+            logger.error("Error in get_users_by_ids: %s", e)
+            raise
+    
+    @traced('service')
+    def get_user_columns(self, fields=None):
+        """
+        All users as one list per field, newest first.
+
+        Returns:
+            dict: {"count": n, "columns": {field: [values]}} with created_at
+            as epoch milliseconds
+        """
+        try:
+            fields = tuple(fields or PUBLIC_FIELDS)
+            if any(field not in PUBLIC_FIELDS for field in fields):
+                raise ValueError(f"Unknown fields: {fields}")
+            columns = self.db.get_user_columns(fields)
+            return {'count': len(columns[fields[0]]), 'columns': columns}
         except Exception as e:
-            logging.error(f"Error in get_all_users: {str(e)}")
+            logger.error("Error in get_user_columns: %s", e)
             raise
     
+    @traced('service')
+    def get_changes(self, since=None, limit=1000):
+        """
+        Users changed after a sync token, for keeping a replica current.
+
+        Args:
+            since: token from an earlier call, or None to get the current token
+
+        Returns:
+            dict or None: {"changes": [...], "token": str, "more": bool}, each
+            change being {"op", "id", "user"} with user None for deletes;
+            None when the change log no longer reaches back to since
+        """
+        try:
+            if since is None:
+                return {'changes': [], 'token': str(self.db.store_version()), 'more': False}
+            result = self.db.get_changes(since, limit)
+            if result is None:
+                return None
+            return {
+                'changes': [
+                    dict(change, user=_safe_user(change['user']) if change['user'] else None)
+                    for change in result['changes']
+                ],
+                'token': str(result['version']),
+                'more': result['more']
+            }
+        except Exception as e:
+            logger.error("Error in get_changes: %s", e)
+            raise
+    
+    @traced('service')
+    def export_users(self):
+        """
+        Lazily project every user (excluding password hashes) from a snapshot.
+
+        The snapshot is taken now; rows are projected one at a time as the
+        result is consumed, so writers are never blocked by a long export.
+        """
+        try:
+            users = self.db.snapshot_users()
+            return (_safe_user(user) for user in users)
+        except Exception as e:
+            logger.error("Error in export_users: %s", e)
+            raise
+    
+    @traced('service')
     def create_user(self, user_data):
         """Create a new user with secure password hashing"""
         try:
-            # Check if email already exists
-            if self.db.get_user_by_email(user_data['email']):
-                return {
-                    "success": False,
-                    "message": "Email already exists"
-                }
-            
             # Hash the password
-            password_hash = generate_password_hash(user_data['password'])
-            
-            # Create user in database
-            user_id = self.db.create_user(
-                name=user_data['name'],
-                email=user_data['email'],
-                password_hash=password_hash
-            )
-            
-            # Return created user (without password hash)
-            user = self.db.get_user_by_id(user_id)
-            if not user:
-                return {
-                    "success": False,
-                    "message": "Failed to retrieve created user"
-                }
-            safe_user = {
-                'id': user['id'],
-                'name': user['name'],
-                'email': user['email'],
-                'created_at': user['created_at']
-            }
-            
-            return {
-                "success": True,
-                "user": safe_user
-            }
+            password_hash = hash_password(user_data['password'])
+            return self._insert_user(user_data, password_hash)
             
         except Exception as e:
-            logging.error(f"Error in create_user: {str(e)}")
+            logger.error("Error in create_user: %s", e)
             return {
                 "success": False,
                 "message": "Failed to create user"
             }
     
-    def update_user(self, user_id, user_data):
-        """Update an existing user"""
+    def _insert_user(self, user_data, password_hash):
+        """Store a user whose password is already hashed"""
+        # Insert only if the email is free; the store checks atomically
+        user = self.db.create_user_if_email_absent(
+            name=user_data['name'],
+            email=user_data['email'],
+            password_hash=password_hash
+        )
+        if not user:
+            return {
+                "success": False,
+                "message": "Email already exists"
+            }
+        
+        return {
+            "success": True,
+            "user": _safe_user(user)
+        }
+    
+    @traced('service')
+    def import_users(self, users):
+        """
+        Create a batch of already-validated users.
+
+        Passwords are hashed in parallel and the rows are inserted with one
+        store call.
+
+        Returns:
+            list: a create_user-style result dict for each input user
+        """
         try:
-            # Check if user exists
-            existing_user = self.db.get_user_by_id(user_id)
-            if not existing_user:
-                return {
-                    "success": False,
-                    "message": "User not found"
+            password_hashes = hash_passwords([user['password'] for user in users])
+            created = self.db.bulk_create_users([
+                {
+                    'name': user['name'],
+                    'email': user['email'],
+                    'password_hash': password_hash
                 }
-            
-            # If email is being updated, check for duplicates
-            if 'email' in user_data and user_data['email'] != existing_user['email']:
-                if self.db.get_user_by_email(user_data['email']):
-                    return {
-                        "success": False,
-                        "message": "Email already exists"
-                    }
-            
+                for user, password_hash in zip(users, password_hashes)
+            ])
+            return [
+                {"success": True, "user": _safe_user(user)} if user
+                else {"success": False, "message": "Email already exists"}
+                for user in created
+            ]
+        except Exception as e:
+            logger.error("Error in import_users: %s", e)
+            raise
+    
+    @traced('service')
+    def update_user(self, user_id, user_data, expected_version=None):
+        """Update an existing user, optionally only if still at expected_version"""
+        try:
             # Hash password if it's being updated
             if 'password' in user_data:
-                user_data['password_hash'] = generate_password_hash(user_data['password'])
+                user_data['password_hash'] = hash_password(user_data['password'])
                 del user_data['password']
             
-            # Update user in database
-            self.db.update_user(user_id, user_data)
-            
-            # Return updated user (without password hash)
-            updated_user = self.db.get_user_by_id(user_id)
+            # Update and read back the row in a single store operation
+            try:
+                updated_user = self.db.update_user_returning(
+                    user_id, user_data, expected_version=expected_version
+                )
+            except DuplicateEmailError:
+                return {
+                    "success": False,
+                    "message": "Email already exists"
+                }
+            except VersionConflictError:
+                return {
+                    "success": False,
+                    "message": "Version conflict"
+                }
             if not updated_user:
                 return {
                     "success": False,
-                    "message": "Failed to retrieve updated user"
+                    "message": "User not found"
                 }
-            safe_user = {
-                'id': updated_user['id'],
-                'name': updated_user['name'],
-                'email': updated_user['email'],
-                'created_at': updated_user['created_at']
-            }
+            if self.credential_cache is not None and 'password_hash' in user_data:
+                self.credential_cache.invalidate(updated_user['id'])
             
             return {
                 "success": True,
-                "user": safe_user
+                "user": _safe_user(updated_user)
             }
             
         except Exception as e:
-            logging.error(f"Error in update_user: {str(e)}")
+            logger.error("Error in update_user: %s", e)
             return {
                 "success": False,
                 "message": "Failed to update user"
             }
     
-    def delete_user(self, user_id):
-        """Delete a user"""
+    @traced('service')
+    def delete_user(self, user_id, expected_version=None):
+        """Delete a user, optionally only if still at expected_version"""
         try:
-            # Check if user exists
-            if not self.db.get_user_by_id(user_id):
+            try:
+                deleted_user = self.db.delete_user_returning(
+                    user_id, expected_version=expected_version
+                )
+            except VersionConflictError:
+                return {
+                    "success": False,
+                    "message": "Version conflict"
+                }
+            if not deleted_user:
                 return {
                     "success": False,
                     "message": "User not found"
                 }
-            
-            # Delete user
-            self.db.delete_user(user_id)
+            if self.credential_cache is not None:
+                self.credential_cache.invalidate(deleted_user['id'])
             
             return {
                 "success": True,
@@ -153,12 +287,76 @@ class UserService:
             }
             
         except Exception as e:
-            logging.error(f"Error in delete_user: {str(e)}")
+            logger.error("Error in delete_user: %s", e)
             return {
                 "success": False,
                 "message": "Failed to delete user"
             }
     
+    @traced('service')
+    def execute_batch(self, operations, atomic=False):
+        """
+        Run many create/update/delete/get operations in one store transaction.
+
+        Passwords are hashed in parallel before the transaction starts, so
+        the store is only held for the writes themselves.
+
+        Args:
+            operations (list): validated dicts with "op" plus "id", "data" and
+                "expected_version" as the op needs
+            atomic (bool): stop at the first failed operation and roll back
+                the whole batch
+
+        Returns:
+            tuple: (results, committed) - a create_user-style result dict per
+            operation, in order, and False if an atomic batch was rolled back
+        """
+        passwords = [op['data']['password'] for op in operations
+                     if 'password' in (op.get('data') or {})]
+        password_hashes = iter(hash_passwords(passwords))
+        prepared = []
+        for op in operations:
+            data = op.get('data')
+            if data and 'password' in data:
+                data = {key: value for key, value in data.items() if key != 'password'}
+                data['password_hash'] = next(password_hashes)
+            prepared.append(dict(op, data=data))
+        
+        results = []
+        try:
+            with self.db.transaction():
+                for op in prepared:
+                    results.append(self._run_batch_operation(op))
+                    if atomic and not results[-1]["success"]:
+                        raise _BatchAborted()
+        except _BatchAborted:
+            failed = len(results) - 1
+            return [
+                results[failed] if index == failed
+                else {"success": False, "message": "Rolled back" if index < failed else "Not executed"}
+                for index in range(len(operations))
+            ], False
+        return results, True
+    
+    def _run_batch_operation(self, op):
+        """One batch operation, through the same paths as the single-user calls"""
+        name = op['op']
+        if name == 'create':
+            try:
+                return self._insert_user(op['data'], op['data']['password_hash'])
+            except Exception as e:
+                logger.error("Error in batch create: %s", e)
+                return {"success": False, "message": "Failed to create user"}
+        if name == 'update':
+            return self.update_user(op['id'], op['data'], expected_version=op.get('expected_version'))
+        if name == 'delete':
+            return self.delete_user(op['id'], expected_version=op.get('expected_version'))
+        user = self.get_users_by_ids([op['id']])[0]
+        if user is None:
+            return {"success": False, "message": "User not found"}
+        return {"success": True, "user": _safe_user(user)}
+    
+    @traced('service')
     def authenticate_user(self, email, password):
         """Authenticate a user login"""
         try:
@@ -170,18 +368,19 @@ class UserService:
                     "message": "Invalid credentials"
                 }
             
-            # Check password
-            if check_password_hash(user['password_hash'], password):
+            # Check password, skipping scrypt for a login verified moments ago
+            cache = self.credential_cache
+            if cache is not None and cache.verify(user, password):
+                verified = True
+            else:
+                verified = verify_password(user['password_hash'], password)
+                if verified and cache is not None:
+                    cache.remember(user, password)
+            if verified:
                 # Return user data (without password hash)
-                safe_user = {
-                    'id': user['id'],
-                    'name': user['name'],
-                    'email': user['email'],
-                    'created_at': user['created_at']
-                }
                 return {
                     "success": True,
-                    "user": safe_user
+                    "user": _safe_user(user)
                 }
             else:
                 return {
@@ -190,27 +389,20 @@ class UserService:
                 }
                 
         except Exception as e:
-            logging.error(f"Error in authenticate_user: {str(e)}")
+            logger.error("Error in authenticate_user: %s", e)
             return {
                 "success": False,
                 "message": "Authentication failed"
             }
     
-    def search_users_by_name(self, name):
-        """Search users by name (case-insensitive)"""
+    @traced('service')
+    def search_users_by_name(self, name, fields=None):
+        """Search users by name (case-insensitive), optionally only some fields"""
         try:
             users = self.db.search_users_by_name(name)
             # Remove password hashes from response
-            safe_users = []
-            for user in users:
-                safe_user = {
-                    'id': user['id'],
-                    'name': user['name'],
-                    'email': user['email'],
-                    'created_at': user['created_at']
-                }
-                safe_users.append(safe_user)
-            return safe_users
+            project = _projector(fields)
+            return [project(user) for user in users]
         except Exception as e:
-            logging.error(f"Error in search_users_by_name: {str(e)}")
+            logger.error("Error in search_users_by_name: %s", e)
             raise
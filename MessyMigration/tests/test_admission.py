@@ -0,0 +1,103 @@
+"""
+Unit Tests for admission control
+"""
+
+import threading
+import time
+from flask import Flask
+from utils.admission import (ADMITTED, QUEUE_FULL, TIMED_OUT, AdmissionLimiter,
+                             admission_class, init_admission, parse_limits)
+from utils.metrics import Registry
+
+class TestAdmissionLimiter:
+    """Test class for AdmissionLimiter"""
+    
+    def test_queue_then_reject(self):
+        """Test waiters are admitted in turn and a full queue is refused at once"""
+        limiter = AdmissionLimiter('hashing', concurrency=1, max_queue=1, timeout=5)
+        assert limiter.acquire() == ADMITTED
+        
+        outcomes = []
+        waiter = threading.Thread(target=lambda: outcomes.append(limiter.acquire()))
+        waiter.start()
+        while limiter.waiting == 0:
+            time.sleep(0.001)
+        
+        start = time.perf_counter()
+        assert limiter.acquire() == QUEUE_FULL
+        assert time.perf_counter() - start < 0.1
+        
+        limiter.release(held=2.0)
+        waiter.join()
+        assert outcomes == [ADMITTED]
+        assert limiter.active == 1
+        limiter.release()
+        assert limiter.active == 0
+    
+    def test_wait_times_out(self):
+        """Test a queued request gives up after the timeout"""
+        limiter = AdmissionLimiter('export', concurrency=1, max_queue=1, timeout=0.05)
+        assert limiter.acquire() == ADMITTED
+        assert limiter.acquire() == TIMED_OUT
+        assert limiter.waiting == 0
+    
+    def test_parse_limits(self):
+        """Test limit parsing"""
+        assert parse_limits('hashing=4:8, export=2') == {'hashing': (4, 8), 'export': (2, 0)}
+
+class TestAdmissionMiddleware:
+    """Test class for init_admission"""
+    
+    def test_overloaded_class_returns_503(self):
+        """Test requests beyond the limit get 503 + Retry-After while other routes still work"""
+        app = Flask(__name__)
+        release = threading.Event()
+        entered = threading.Event()
+        
+        @app.route('/hash')
+        @admission_class('hashing')
+        def hash_route():
+            entered.set()
+            release.wait(5)
+            return 'hashed'
+        
+        @app.route('/read')
+        def read_route():
+            return 'read'
+        
+        registry = Registry()
+        init_admission(app, limits={'hashing': (1, 0)}, routes={}, timeout=1, registry=registry)
+        
+        responses = []
+        busy = threading.Thread(target=lambda: responses.append(app.test_client().get('/hash')))
+        busy.start()
+        entered.wait(5)
+        try:
+            client = app.test_client()
+            rejected = client.get('/hash')
+            assert rejected.status_code == 503
+            assert int(rejected.headers['Retry-After']) >= 1
+            assert client.get('/read').status_code == 200
+        finally:
+            release.set()
+            busy.join()
+        assert responses[0].status_code == 200
+        
+        rendered = registry.render()
+        assert 'admission_rejections_total{class="hashing",reason="queue_full"} 1' in rendered
+        assert 'admission_queue_seconds_count{class="hashing"} 2' in rendered
+    
+    def test_streamed_export_holds_slot(self, monkeypatch):
+        """Test an export keeps its admission slot until its body has been sent"""
+        monkeypatch.delenv('DATABASE_URL', raising=False)
+        monkeypatch.setenv('ADMISSION_LIMITS', 'export=1:0')
+        from app import create_app
+        client = create_app().test_client()
+        
+        first = client.get('/users/export', buffered=False)
+        assert first.status_code == 200
+        try:
+            assert client.get('/users/export').status_code == 503
+        finally:
+            first.close()
+        assert client.get('/users/export').status_code == 200
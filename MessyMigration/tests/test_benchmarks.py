@@ -0,0 +1,54 @@
+"""
+Unit Tests for the benchmark regression checks
+"""
+
+from benchmarks.bench_fieldsets import format_results, make_client, measure_fieldsets
+from benchmarks.bench_hot_paths import check, scaling_exponent
+from benchmarks.loadtest import percentile, summarize
+
+class TestBenchmarkChecks:
+    """Test class for scaling and baseline regression detection"""
+    
+    def test_scaling_exponent(self):
+        """Test the fitted exponent for constant, linear and quadratic timings"""
+        sizes = [1000, 10000, 100000]
+        assert abs(scaling_exponent({n: 1e-6 for n in sizes})) < 1e-9
+        assert abs(scaling_exponent({n: n * 1e-8 for n in sizes}) - 1) < 1e-9
+        assert abs(scaling_exponent({n: n * n * 1e-12 for n in sizes}) - 2) < 1e-9
+        assert scaling_exponent({1000: 1e-6}) is None
+    
+    def test_check_flags_regressions(self):
+        """Test a lookup turning O(n) and a slowdown against baseline are both reported"""
+        results = {
+            'db.get_user_by_id': {1000: 1e-6, 10000: 1e-5, 100000: 1e-4},
+            'db.get_all_users': {1000: 1e-3, 10000: 1e-2}
+        }
+        baseline = {'db.get_all_users': {'1000': 1e-3, '10000': 5e-3}}
+        
+        failures = check(results, baseline, max_slowdown=1.5, exponent_tolerance=0.3)
+        assert len(failures) == 2
+        assert failures[0].startswith('db.get_all_users @ 10000')
+        assert failures[1].startswith('db.get_user_by_id: scales as n^1.00')
+        
+        assert check(results, {}, max_slowdown=1.5, exponent_tolerance=1.5) == []
+    
+    def test_load_report_percentiles(self):
+        """Test per-endpoint percentiles, status counts and throughput in the load report"""
+        samples = [('login', 200, (i + 1) / 1000) for i in range(1000)]
+        samples += [('search', 200, 0.002), ('search', None, 30.0)]
+        
+        report = summarize(samples, elapsed=10.0)
+        assert report['login']['p50'] == 500.0
+        assert report['login']['p99'] == 990.0
+        assert report['login']['p99.9'] == 999.0
+        assert report['search']['status_codes'] == {'200': 1, 'error': 1}
+        assert report['all']['count'] == 1002
+        assert report['all']['throughput_rps'] == 100.2
+        assert percentile([], 0.5) is None
+    
+    def test_fieldset_savings(self):
+        """Test the fieldset benchmark reports smaller bodies for narrower field sets"""
+        results = measure_fieldsets(make_client(50), ['', 'id,name', 'id'])
+        assert [result['fields'] for result in results] == ['(all)', 'id,name', 'id']
+        assert results[0]['bytes'] > results[1]['bytes'] > results[2]['bytes']
+        assert format_results(results).splitlines()[1].startswith('(all)')
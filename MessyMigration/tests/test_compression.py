@@ -0,0 +1,133 @@
+"""
+Unit Tests for response compression
+"""
+
+import gzip
+import json
+import zlib
+from flask import Flask, Response, jsonify
+from utils.compression import CompressedCache, cache_compressed, init_compression
+from utils.metrics import Registry
+
+class FakeStore:
+    """Stands in for a DatabaseManager: only the version matters here"""
+
+    def __init__(self):
+        self.version = 1
+
+    def store_version(self):
+        return self.version
+
+def _make_app(cache_bytes=1024 * 1024):
+    """App with a cached listing, an uncached one and a streamed export"""
+    app = Flask(__name__)
+    store = FakeStore()
+    calls = []
+    rows = [{'id': i, 'name': f"User {i}"} for i in range(200)]
+
+    @app.route('/list')
+    @cache_compressed
+    def listing():
+        calls.append(store.version)
+        return jsonify(rows + [{'version': store.version}])
+
+    @app.route('/small')
+    def small():
+        return jsonify({'ok': True})
+
+    @app.route('/export')
+    def export():
+        return Response((json.dumps(row) + '\n' for row in rows), mimetype='application/x-ndjson')
+
+    cache = init_compression(app, store, min_bytes=1024, cache_bytes=cache_bytes, registry=Registry())
+    return app.test_client(), store, calls, cache
+
+class TestCompression:
+    """Test class for negotiated compression and the compressed body cache"""
+    
+    def test_negotiation_and_threshold(self):
+        """Test gzip and deflate are chosen from Accept-Encoding and small bodies are left alone"""
+        client, _, _, _ = _make_app()
+    
+        response = client.get('/list', headers={'Accept-Encoding': 'gzip'})
+        assert response.headers['Content-Encoding'] == 'gzip'
+        assert 'Accept-Encoding' in response.headers['Vary']
+        assert json.loads(gzip.decompress(response.data))[0] == {'id': 0, 'name': "User 0"}
+    
+        response = client.get('/list', headers={'Accept-Encoding': 'gzip;q=0, deflate'})
+        assert response.headers['Content-Encoding'] == 'deflate'
+        assert len(json.loads(zlib.decompress(response.data))) == 201
+    
+        plain = client.get('/list')
+        assert 'Content-Encoding' not in plain.headers
+        assert 'Accept-Encoding' in plain.headers['Vary']
+    
+        small = client.get('/small', headers={'Accept-Encoding': 'gzip'})
+        assert 'Content-Encoding' not in small.headers
+        assert small.get_json() == {'ok': True}
+    
+    def test_streamed_export(self):
+        """Test streamed responses are compressed chunk by chunk into one valid body"""
+        client, _, _, _ = _make_app()
+    
+        response = client.get('/export', headers={'Accept-Encoding': 'gzip'})
+        assert response.headers['Content-Encoding'] == 'gzip'
+        assert 'Content-Length' not in response.headers
+        lines = gzip.decompress(response.data).decode().splitlines()
+        assert len(lines) == 200
+        assert json.loads(lines[-1]) == {'id': 199, 'name': "User 199"}
+    
+    def test_cache_per_store_version(self):
+        """Test repeats are served from the cache until the store version changes"""
+        client, store, calls, cache = _make_app()
+        headers = {'Accept-Encoding': 'gzip'}
+    
+        first = client.get('/list', headers=headers)
+        second = client.get('/list', headers=headers)
+        assert calls == [1]
+        assert second.data == first.data
+        assert second.headers['Content-Encoding'] == 'gzip'
+    
+        client.get('/list', headers={'Accept-Encoding': 'deflate'})
+        client.get('/list')
+        assert calls == [1, 1, 1]
+    
+        store.version = 2
+        third = client.get('/list', headers=headers)
+        assert calls == [1, 1, 1, 2]
+        assert json.loads(gzip.decompress(third.data))[-1] == {'version': 2}
+        assert len(cache) == 1
+    
+    def test_cache_bounded_in_bytes(self):
+        """Test least recently used bodies are evicted beyond the byte budget"""
+        cache = CompressedCache(max_bytes=10)
+        cache.put('a', 1, b'12345', 'application/json')
+        cache.put('b', 1, b'12345', 'application/json')
+        assert cache.get('a', 1) is not None
+        cache.put('c', 1, b'12345', 'application/json')
+        assert cache.get('b', 1) is None
+        assert cache.get('a', 1) is not None
+        assert cache.size == 10
+    
+        cache.put('d', 0, b'1', 'application/json')  # From a request that raced a write
+        assert cache.get('d', 0) is None
+        assert cache.get('a', 2) is None
+    
+    def test_users_listing(self, monkeypatch):
+        """Test GET /users is compressed and a write retires the cached body"""
+        monkeypatch.delenv('DATABASE_URL', raising=False)
+        from app import create_app
+        client = create_app().test_client()
+        headers = {'Accept-Encoding': 'gzip'}
+        for i in range(20):
+            response = client.post('/users', json={'name': f"User {chr(65 + i)}",
+                                                   'email': f"user{i}@example.com",
+                                                   'password': 'password123'})
+            assert response.status_code == 201
+    
+        first = json.loads(gzip.decompress(client.get('/users', headers=headers).data))
+        assert len(first) == 20
+    
+        client.delete(f"/user/{first[0]['id']}")
+        second = json.loads(gzip.decompress(client.get('/users', headers=headers).data))
+        assert len(second) == 19
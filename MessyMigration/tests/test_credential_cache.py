@@ -0,0 +1,70 @@
+"""
+Unit Tests for the verified-credential cache
+"""
+
+import time
+import pytest
+import services.user_service
+from models.db import init_db
+from services.user_service import UserService
+from utils.credential_cache import CredentialCache
+
+class TestCredentialCache:
+    """Test class for CredentialCache"""
+    
+    def test_verify_remembered_login(self):
+        """Test only the exact remembered login matches"""
+        cache = CredentialCache(ttl=60)
+        user = {'id': 1, 'password_hash': 'scrypt:abc'}
+        assert not cache.verify(user, 'password123')
+        cache.remember(user, 'password123')
+        assert cache.verify(user, 'password123')
+        assert not cache.verify(user, 'password124')
+        # A new stored hash (password changed elsewhere) never matches
+        assert not cache.verify({'id': 1, 'password_hash': 'scrypt:def'}, 'password123')
+    
+    def test_expiry_and_bound(self):
+        """Test entries expire after the TTL and the least recently used are evicted"""
+        cache = CredentialCache(ttl=0.05, max_entries=2)
+        users = [{'id': i, 'password_hash': f'hash{i}'} for i in range(3)]
+        for user in users:
+            cache.remember(user, 'pw')
+        assert len(cache) == 2
+        assert not cache.verify(users[0], 'pw')
+        assert cache.verify(users[2], 'pw')
+        time.sleep(0.06)
+        assert not cache.verify(users[2], 'pw')
+
+class TestServiceCredentialCache:
+    """Test class for the cache inside UserService.authenticate_user"""
+    
+    @pytest.fixture
+    def service(self, monkeypatch):
+        """Service with the cache enabled and password checks counted"""
+        monkeypatch.setenv('CREDENTIAL_CACHE_TTL', '60')
+        monkeypatch.delenv('DATABASE_URL', raising=False)
+        monkeypatch.delenv('SHADOW_DATABASE_URL', raising=False)
+        init_db()
+        service = UserService()
+        service.checks = []
+        real_verify = services.user_service.verify_password
+        monkeypatch.setattr(services.user_service, 'verify_password',
+                            lambda *args: service.checks.append(1) or real_verify(*args))
+        return service
+    
+    def test_repeat_login_skips_hash(self, service):
+        """Test repeat logins are served from the cache until the password changes"""
+        user = service.create_user({'name': 'Cache User', 'email': 'cache@example.com',
+                                    'password': 'password123'})['user']
+        for _ in range(3):
+            assert service.authenticate_user('cache@example.com', 'password123')['success']
+        assert len(service.checks) == 1
+        assert not service.authenticate_user('cache@example.com', 'password999')['success']
+        
+        service.update_user(user['id'], {'password': 'newpass123'})
+        assert not service.authenticate_user('cache@example.com', 'password123')['success']
+        assert service.authenticate_user('cache@example.com', 'newpass123')['success']
+        assert len(service.credential_cache) == 1
+        
+        service.delete_user(user['id'])
+        assert len(service.credential_cache) == 0
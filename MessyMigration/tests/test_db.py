@@ -0,0 +1,270 @@
+"""
+Unit Tests for the DatabaseManager backends
+Tests for conditional and returning store operations
+"""
+
+import pytest
+from collections import deque
+from datetime import datetime
+import models.db
+from models.db import (DuplicateEmailError, VersionConflictError, create_database_manager,
+                       epoch_millis, init_db)
+
+def _shrink_change_log(db, size, monkeypatch):
+    """Keep only the last size changes, on either backend"""
+    if isinstance(db, models.db.DatabaseManager):
+        monkeypatch.setattr(models.db, 'change_log', deque(models.db.change_log, maxlen=size))
+    else:
+        db._conn().execute("UPDATE store_meta SET value = ? WHERE key = 'change_log_size'", (size,))
+
+class TestDatabaseManager:
+    """Test class for DatabaseManager store operations, run against every backend"""
+    
+    @pytest.fixture(params=['memory', 'sqlite'])
+    def db(self, request, tmp_path):
+        """Create a manager over a freshly initialized store"""
+        if request.param == 'sqlite':
+            return create_database_manager(f"sqlite:///{tmp_path / 'users.db'}")
+        init_db()
+        return create_database_manager()
+    
+    def test_create_if_email_absent(self, db):
+        """Test insert-if-absent returns the row, then None on duplicate"""
+        user = db.create_user_if_email_absent("John Doe", "john@example.com", "hash")
+        assert user['id'] == 1
+        assert user['email'] == "john@example.com"
+        assert db.get_user_by_email("john@example.com") == user
+        
+        duplicate = db.create_user_if_email_absent("Other", "john@example.com", "hash")
+        assert duplicate is None
+        assert len(db.get_all_users()) == 1
+    
+    def test_get_users_by_ids(self, db):
+        """Test multi-get keeps request order, repeats and gaps"""
+        john = db.create_user_if_email_absent("John Doe", "john@example.com", "hash")
+        jane = db.create_user_if_email_absent("Jane Doe", "jane@example.com", "hash")
+        
+        users = db.get_users_by_ids([jane['id'], 999, john['id'], jane['id']])
+        assert users == [jane, None, john, jane]
+        assert db.get_users_by_ids([]) == []
+    
+    def test_get_user_columns(self, db):
+        """Test column data follows get_all_users order with epoch-millisecond timestamps"""
+        assert db.get_user_columns(('id', 'name')) == {'id': [], 'name': []}
+        db.create_user_if_email_absent("John Doe", "john@example.com", "hash")
+        db.create_user_if_email_absent("Jane Doe", "jane@example.com", "hash")
+        rows = db.get_all_users()
+        
+        columns = db.get_user_columns(('id', 'created_at', 'email'))
+        assert columns['id'] == [row['id'] for row in rows]
+        assert columns['email'] == [row['email'] for row in rows]
+        assert columns['created_at'] == [epoch_millis(row['created_at']) for row in rows]
+    
+    def test_user_columns_sub_millisecond(self, db):
+        """Test both backends round sub-millisecond timestamps the same way"""
+        stamps = [datetime(2024, 1, 1, 0, 0, 59, 999600), datetime(2024, 1, 1, 0, 0, 1, 500),
+                  datetime(2024, 1, 1, 0, 0, 1, 499), datetime(2024, 1, 1, 23, 59, 59, 999999)]
+        db.bulk_load_users([
+            {'id': index + 1, 'name': "User", 'email': f"user{index}@example.com",
+             'password_hash': "hash", 'created_at': stamp}
+            for index, stamp in enumerate(stamps)
+        ])
+        
+        columns = db.get_user_columns(('id', 'created_at'))
+        by_id = dict(zip(columns['id'], columns['created_at']))
+        assert [by_id[index + 1] for index in range(len(stamps))] == [
+            1704067260000, 1704067201001, 1704067201000, 1704153600000
+        ]
+    
+    def test_update_returning(self, db):
+        """Test update-returning applies changes and reindexes email"""
+        user = db.create_user_if_email_absent("John Doe", "john@example.com", "hash")
+        
+        updated = db.update_user_returning(user['id'], {"email": "new@example.com", "id": 42})
+        assert updated['email'] == "new@example.com"
+        assert updated['id'] == user['id']  # Non-updatable fields are ignored
+        assert db.get_user_by_email("john@example.com") is None
+        assert db.get_user_by_email("new@example.com") == updated
+        
+        assert db.update_user_returning(999, {"name": "Nobody"}) is None
+    
+    def test_update_returning_duplicate_email(self, db):
+        """Test update-returning refuses another user's email"""
+        db.create_user_if_email_absent("John Doe", "john@example.com", "hash")
+        jane = db.create_user_if_email_absent("Jane Doe", "jane@example.com", "hash")
+        
+        with pytest.raises(DuplicateEmailError):
+            db.update_user_returning(jane['id'], {"email": "john@example.com"})
+        assert db.get_user_by_id(jane['id'])['email'] == "jane@example.com"
+        
+        # Re-submitting a user's own email is not a conflict
+        assert db.update_user_returning(jane['id'], {"email": "jane@example.com"})
+    
+    def test_delete_returning(self, db):
+        """Test delete-returning hands back the removed row once"""
+        user = db.create_user_if_email_absent("John Doe", "john@example.com", "hash")
+        
+        deleted = db.delete_user_returning(user['id'])
+        assert deleted['email'] == "john@example.com"
+        assert db.get_user_by_email("john@example.com") is None
+        assert db.delete_user_returning(user['id']) is None
+    
+    def test_versions_and_expected_version(self, db):
+        """Test versions increment on update and guard conditional writes"""
+        user = db.create_user_if_email_absent("John Doe", "john@example.com", "hash")
+        assert user['version'] == 1
+        
+        updated = db.update_user_returning(user['id'], {"name": "John Smith"}, expected_version=1)
+        assert updated['version'] == 2
+        
+        with pytest.raises(VersionConflictError):
+            db.update_user_returning(user['id'], {"name": "Lost Update"}, expected_version=1)
+        with pytest.raises(VersionConflictError):
+            db.delete_user_returning(user['id'], expected_version=1)
+        assert db.get_user_by_id(user['id'])['name'] == "John Smith"
+        
+        # A set accepts any of its versions
+        with pytest.raises(VersionConflictError):
+            db.update_user_returning(user['id'], {"name": "Lost Update"}, expected_version={1, 3})
+        with pytest.raises(VersionConflictError):
+            db.delete_user_returning(user['id'], expected_version=set())
+        assert db.update_user_returning(user['id'], {"name": "John Smith"},
+                                        expected_version={1, 2})['version'] == 3
+        
+        assert db.delete_user_returning(user['id'], expected_version={3})
+    
+    def test_search_ties_ordered_by_id(self, db):
+        """Test users with the same name come back in id order on both backends"""
+        db.bulk_load_users([
+            {'id': user_id, 'name': name, 'email': f"user{user_id}@example.com",
+             'password_hash': "hash", 'created_at': datetime(2024, 1, 1)}
+            for user_id, name in [(5, "Ann Lee"), (2, "Ann Lee"), (9, "Al Lee"), (7, "Ann Lee")]
+        ])
+        
+        assert [user['id'] for user in db.search_users_by_name("lee")] == [9, 2, 5, 7]
+    
+    def test_bulk_load_skips_existing(self, db):
+        """Test bulk load keeps ids, skips existing rows and moves the id counter on"""
+        existing = db.create_user_if_email_absent("John Doe", "john@example.com", "hash")
+        created_at = existing['created_at']
+        rows = [
+            {'id': 10, 'name': "Jane Doe", 'email': "jane@example.com",
+             'password_hash': "hash", 'created_at': created_at},
+            {'id': 11, 'name': "Copy", 'email': "john@example.com",
+             'password_hash': "hash", 'created_at': created_at}
+        ]
+        
+        assert db.bulk_load_users(rows) == 1
+        assert db.bulk_load_users(rows) == 0  # Replaying a chunk is harmless
+        assert db.get_user_by_id(10)['email'] == "jane@example.com"
+        
+        user = db.create_user_if_email_absent("Bob Johnson", "bob@example.com", "hash")
+        assert user['id'] > 10
+    
+    def test_store_version(self, db):
+        """Test every row change moves the store version forward and failed writes do not"""
+        start = db.store_version()
+        user = db.create_user_if_email_absent("John Doe", "john@example.com", "hash")
+        assert db.store_version() > start
+        
+        created = db.store_version()
+        db.create_user_if_email_absent("Copy", "john@example.com", "hash")
+        with pytest.raises(VersionConflictError):
+            db.update_user_returning(user['id'], {'name': "John Smith"}, expected_version=5)
+        assert db.store_version() == created
+        
+        db.update_user_returning(user['id'], {'name': "John Smith"})
+        updated = db.store_version()
+        assert updated > created
+        db.delete_user_returning(user['id'])
+        assert db.store_version() > updated
+    
+    def test_get_changes(self, db):
+        """Test changes after a version come back once per user, latest state, in change order"""
+        since = db.store_version()
+        john = db.create_user_if_email_absent("John Doe", "john@example.com", "hash")
+        jane = db.create_user_if_email_absent("Jane Doe", "jane@example.com", "hash")
+        bob = db.create_user_if_email_absent("Bob Johnson", "bob@example.com", "hash")
+        db.update_user_returning(john['id'], {'name': "John Smith"})
+        db.delete_user_returning(jane['id'])
+        
+        result = db.get_changes(since, 100)
+        assert result['version'] == db.store_version()
+        assert not result['more']
+        assert [(change['op'], change['id']) for change in result['changes']] == [
+            ('create', bob['id']), ('update', john['id']), ('delete', jane['id'])
+        ]
+        assert result['changes'][1]['user']['name'] == "John Smith"
+        assert result['changes'][2]['user'] is None
+        
+        page = db.get_changes(since, 2)
+        assert page['more'] and page['version'] == since + 2
+        assert [change['id'] for change in page['changes']] == [john['id'], jane['id']]
+        
+        assert db.get_changes(result['version'], 100)['changes'] == []
+        assert db.get_changes(result['version'] + 1, 100) is None
+    
+    def test_get_changes_paged(self, db):
+        """Test each page reports users as of its own token, the same on every backend"""
+        since = db.store_version()
+        john = db.create_user_if_email_absent("John Doe", "john@example.com", "hash")
+        jane = db.create_user_if_email_absent("Jane Doe", "jane@example.com", "hash")
+        db.update_user_returning(john['id'], {'name': "John Smith"})
+        db.delete_user_returning(jane['id'])
+        bob = db.create_user_if_email_absent("Bob Johnson", "bob@example.com", "hash")
+        db.update_user_returning(bob['id'], {'name': "Bob Smith"})
+        
+        pages = []
+        while True:
+            page = db.get_changes(since, 2)
+            pages.append([(change['op'], change['id'], change['user'] and change['user']['name'])
+                          for change in page['changes']])
+            since = page['version']
+            if not page['more']:
+                break
+        assert pages == [
+            [('create', john['id'], "John Doe"), ('create', jane['id'], "Jane Doe")],
+            [('update', john['id'], "John Smith"), ('delete', jane['id'], None)],
+            [('update', bob['id'], "Bob Smith")]
+        ]
+        assert db.get_changes(since - 6, 2)['changes'][0]['user'] == john
+    
+    def test_get_changes_truncated(self, db, monkeypatch):
+        """Test tokens older than the bounded log ask for a resync"""
+        _shrink_change_log(db, 3, monkeypatch)
+        since = db.store_version()
+        for i in range(3):
+            db.create_user_if_email_absent(f"User {i}", f"user{i}@example.com", "hash")
+        assert len(db.get_changes(since, 100)['changes']) == 3
+        
+        db.create_user_if_email_absent("One More", "more@example.com", "hash")
+        assert db.get_changes(since, 100) is None
+        assert len(db.get_changes(since + 1, 100)['changes']) == 3
+    
+    def test_transaction_rollback(self, db):
+        """Test a transaction that raises undoes its creates, updates and deletes"""
+        john = db.create_user_if_email_absent("John Doe", "john@example.com", "hash")
+        jane = db.create_user_if_email_absent("Jane Doe", "jane@example.com", "hash")
+        before = db.store_version()
+        
+        with pytest.raises(RuntimeError):
+            with db.transaction():
+                db.create_user_if_email_absent("Bob Johnson", "bob@example.com", "hash")
+                db.update_user_returning(john['id'], {'email': "johnny@example.com"})
+                db.delete_user_returning(jane['id'])
+                with db.transaction():  # Joins the outer transaction
+                    db.update_user_returning(john['id'], {'name': "John Smith"})
+                raise RuntimeError("abort")
+        
+        assert sorted(user['email'] for user in db.get_all_users()) == [
+            "jane@example.com", "john@example.com"
+        ]
+        assert db.get_user_by_email("john@example.com") == john
+        assert db.get_user_by_email("johnny@example.com") is None
+        assert db.get_user_by_email("bob@example.com") is None
+        # Readers of the change log converge on the restored rows
+        assert db.store_version() >= before
+        
+        with db.transaction():
+            db.delete_user_returning(jane['id'])
+        assert db.get_user_by_id(jane['id']) is None
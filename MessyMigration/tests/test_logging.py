@@ -0,0 +1,100 @@
+"""
+Unit Tests for the queue-based JSON logging pipeline
+"""
+
+import io
+import json
+import logging
+import os
+import queue
+import pytest
+from app import create_app
+from utils.logging_config import AsyncQueueHandler, configure_logging, parse_levels
+
+class TestLogging:
+    """Test class for configure_logging and request-id correlation"""
+    
+    @pytest.fixture
+    def stream(self):
+        """Capture log output; restoring the default drains the queue into it"""
+        stream = io.StringIO()
+        configure_logging(stream=stream, level='INFO', levels={'tests.quiet': 'WARNING'})
+        yield stream
+        configure_logging()
+    
+    def _records(self, stream):
+        configure_logging()
+        return [json.loads(line) for line in stream.getvalue().splitlines()]
+    
+    def test_json_records_with_request_id(self, stream):
+        """Test records logged during a request carry the id echoed in the response"""
+        app = create_app()
+        app.config['TESTING'] = True
+        
+        @app.route('/log-something')
+        def log_something():
+            logging.getLogger('tests.route').warning("hello %s", 'world', extra={'user_id': 7})
+            return 'ok'
+        
+        with app.test_client() as client:
+            response = client.get('/log-something', headers={'X-Request-ID': 'abc-123'})
+            generated = client.get('/log-something').headers['X-Request-ID']
+            rejected = client.get('/log-something', headers={'X-Request-ID': 'bad id;drop'})
+        assert response.headers['X-Request-ID'] == 'abc-123'
+        assert rejected.headers['X-Request-ID'] != 'bad id;drop'
+        
+        records = [r for r in self._records(stream) if r['logger'] == 'tests.route']
+        assert [r['request_id'] for r in records] == [
+            'abc-123', generated, rejected.headers['X-Request-ID']]
+        assert records[0]['message'] == 'hello world'
+        assert records[0]['level'] == 'WARNING'
+        assert records[0]['user_id'] == 7
+    
+    def test_per_module_levels(self, stream):
+        """Test module overrides filter records before they are queued"""
+        logging.getLogger('tests.quiet').info("suppressed")
+        logging.getLogger('tests.quiet').warning("kept")
+        logging.getLogger('tests.loud').info("also kept")
+        
+        messages = [r['message'] for r in self._records(stream) if r['logger'].startswith('tests.')]
+        assert messages == ['kept', 'also kept']
+        
+        assert parse_levels('a=debug, b.c=ERROR') == {'a': 'DEBUG', 'b.c': 'ERROR'}
+        with pytest.raises(ValueError):
+            parse_levels('a=LOUD')
+    
+    def test_full_queue_drops_instead_of_blocking(self):
+        """Test a full queue drops and counts records"""
+        handler = AsyncQueueHandler(queue.Queue(maxsize=1))
+        logger = logging.getLogger('tests.dropping')
+        logger.propagate = False
+        logger.addHandler(handler)
+        try:
+            logger.warning("first")
+            logger.warning("second")
+        finally:
+            logger.removeHandler(handler)
+            logger.propagate = True
+        assert handler.dropped == 1
+        assert handler.queue.get_nowait().getMessage() == 'first'
+    
+    @pytest.mark.skipif(not hasattr(os, 'fork'), reason="needs os.fork")
+    def test_forked_child_still_logs(self, tmp_path):
+        """Test a child forked after configure_logging (gunicorn --preload) gets its records written"""
+        path = tmp_path / 'log.jsonl'
+        with open(path, 'w') as f:
+            configure_logging(stream=f, level='INFO')
+            try:
+                logging.getLogger('tests.fork').warning("parent")
+                pid = os.fork()
+                if pid == 0:
+                    logging.getLogger('tests.fork').warning("child")
+                    configure_logging()
+                    os._exit(0)
+                os.waitpid(pid, 0)
+            finally:
+                configure_logging()
+        
+        records = [json.loads(line) for line in path.read_text().splitlines()]
+        messages = sorted(r['message'] for r in records if r['logger'] == 'tests.fork')
+        assert messages == ['child', 'parent']
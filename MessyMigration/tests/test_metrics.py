@@ -0,0 +1,84 @@
+"""
+Unit Tests for the Prometheus metrics registry
+"""
+
+import json
+import os
+import threading
+import time
+from flask import Flask
+from utils.metrics import Registry, init_metrics
+
+class TestMetricsRegistry:
+    """Test class for Registry rendering and cross-process aggregation"""
+    
+    def test_render_text_format(self):
+        """Test counters, gauges and histograms render in the exposition format"""
+        registry = Registry()
+        requests_total = registry.counter('requests_total', 'Requests.', ['route'])
+        registry.gauge('queue_depth', 'Queue depth.', function=lambda: 3)
+        latency = registry.histogram('latency_seconds', 'Latency.', ['route'], buckets=(0.1, 1.0))
+        
+        requests_total.inc(route='/users')
+        requests_total.inc(2, route='/users')
+        latency.observe(0.05, route='/users')
+        latency.observe(0.5, route='/users')
+        
+        text = registry.render()
+        assert '# TYPE requests_total counter' in text
+        assert 'requests_total{route="/users"} 3' in text
+        assert 'queue_depth 3' in text
+        assert 'latency_seconds_bucket{route="/users",le="0.1"} 1' in text
+        assert 'latency_seconds_bucket{route="/users",le="+Inf"} 2' in text
+        assert 'latency_seconds_count{route="/users"} 2' in text
+    
+    def test_multiprocess_aggregation(self, tmp_path):
+        """Test values from another worker's file are merged; dead workers' live gauges dropped"""
+        registry = Registry()
+        registry.counter('requests_total', 'Requests.').inc(5)
+        registry.gauge('in_flight', 'In flight.').inc(2)
+        
+        other = Registry()
+        other.counter('requests_total', 'Requests.').inc(7)
+        other.gauge('in_flight', 'In flight.').inc(4)
+        dead_pid = 2 ** 22 + 1  # Above the default pid_max, so never alive
+        with open(os.path.join(tmp_path, f"metrics_{dead_pid}.json"), 'w') as f:
+            json.dump({'pid': dead_pid, 'metrics': other.collect()}, f)
+        
+        text = registry.render(str(tmp_path))
+        assert 'requests_total 12' in text
+        assert 'in_flight 2' in text
+    
+    def test_flushed_off_the_request_path(self, tmp_path, monkeypatch):
+        """Test requests never write the metrics file and store stats are cached"""
+        monkeypatch.setenv('PROMETHEUS_MULTIPROC_DIR', str(tmp_path))
+        
+        class Store:
+            calls = 0
+            
+            def store_stats(self):
+                Store.calls += 1
+                return {'rows': 3, 'indexes': {'email': 3}}
+        
+        app = Flask(__name__)
+        app.add_url_rule('/ping', 'ping', lambda: 'pong')
+        registry = Registry()
+        flushed_by = []
+        real_flush = registry.flush
+        registry.flush = lambda directory: (flushed_by.append(threading.current_thread().name)
+                                            or real_flush(directory))
+        init_metrics(app, db=Store(), registry=registry)
+        client = app.test_client()
+        
+        for _ in range(5):
+            assert client.get('/ping').status_code == 200
+        assert flushed_by.count('metrics-flush') == len(flushed_by)
+        deadline = time.monotonic() + 5
+        while not os.path.exists(tmp_path / f"metrics_{os.getpid()}.json") and time.monotonic() < deadline:
+            time.sleep(0.01)
+        assert 'metrics-flush' in flushed_by
+        
+        text = client.get('/metrics').get_data(as_text=True)
+        assert 'user_store_rows{pid=' in text
+        client.get('/metrics')
+        assert Store.calls == 1
@@ -0,0 +1,63 @@
+"""
+Unit Tests for the legacy users.db migration
+"""
+
+import sqlite3
+import pytest
+from werkzeug.security import check_password_hash
+from models.db import create_database_manager
+from models.migrate import migrate_legacy_db, read_checkpoint
+
+def make_legacy_db(path, rows):
+    """Create a legacy-schema database holding plaintext passwords"""
+    conn = sqlite3.connect(path)
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS users (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT NOT NULL,
+            email TEXT NOT NULL,
+            password TEXT NOT NULL
+        )
+    ''')
+    conn.executemany("INSERT INTO users (name, email, password) VALUES (?, ?, ?)", rows)
+    conn.commit()
+    conn.close()
+
+class TestLegacyMigration:
+    """Test class for migrate_legacy_db"""
+    
+    @pytest.fixture
+    def paths(self, tmp_path):
+        """Legacy source, SQLite target URL and checkpoint paths"""
+        return {
+            'legacy': str(tmp_path / 'legacy.db'),
+            'target': f"sqlite:///{tmp_path / 'users.db'}",
+            'checkpoint': str(tmp_path / 'checkpoint.json')
+        }
+    
+    def test_migrate_and_resume(self, paths):
+        """Test passwords are hashed, duplicates skipped and reruns resume"""
+        make_legacy_db(paths['legacy'], [
+            ('John Doe', 'john@example.com', 'password123'),
+            ('Jane Smith', 'jane@example.com', 'secret456'),
+            ('John Copy', 'john@example.com', 'qwerty789')
+        ])
+        db = create_database_manager(paths['target'])
+        
+        state = migrate_legacy_db(paths['legacy'], db, paths['checkpoint'],
+                                  chunk_size=2, workers=1, progress=lambda line: None)
+        assert state['migrated'] == 2
+        assert state['skipped'] == 1
+        assert read_checkpoint(paths['checkpoint'])['last_id'] == 3
+        
+        john = db.get_user_by_email('john@example.com')
+        assert john['id'] == 1
+        assert check_password_hash(john['password_hash'], 'password123')
+        
+        # Rows added later are picked up from the checkpoint onwards
+        make_legacy_db(paths['legacy'], [('Bob Johnson', 'bob@example.com', 'qwerty789')])
+        state = migrate_legacy_db(paths['legacy'], db, paths['checkpoint'],
+                                  chunk_size=2, workers=1, progress=lambda line: None)
+        assert state['migrated'] == 3
+        assert state['last_id'] == 4
+        assert len(db.get_all_users()) == 3
@@ -0,0 +1,45 @@
+"""
+Unit Tests for on-demand request profiling
+"""
+
+import os
+import pstats
+import pytest
+from app import create_app
+
+class TestProfiling:
+    """Test class for the X-Profile request header"""
+    
+    @pytest.fixture
+    def client(self, tmp_path, monkeypatch):
+        """App with profiling configured and a limit of two captures per minute"""
+        monkeypatch.setenv('PROFILING_DIR', str(tmp_path))
+        monkeypatch.setenv('PROFILING_TOKEN', 'secret-token')
+        monkeypatch.setenv('PROFILING_MAX_PER_MINUTE', '2')
+        app = create_app()
+        app.config['TESTING'] = True
+        with app.test_client() as client:
+            yield client
+    
+    def test_profile_captured(self, client, tmp_path):
+        """Test an authorized request is profiled and its id returned"""
+        response = client.get('/users', headers={'X-Profile': '1', 'X-Profile-Token': 'secret-token'})
+        assert response.status_code == 200
+        assert response.headers['X-Profile-Status'] == 'captured'
+        
+        path = os.path.join(tmp_path, f"{response.headers['X-Profile-Id']}.pstats")
+        assert pstats.Stats(path).total_calls > 0
+    
+    def test_profile_denied_and_rate_limited(self, client):
+        """Test bad tokens are refused and captures beyond the limit are skipped"""
+        response = client.get('/users', headers={'X-Profile': '1', 'X-Profile-Token': 'wrong'})
+        assert response.status_code == 200
+        assert response.headers['X-Profile-Status'] == 'unauthorized'
+        assert 'X-Profile-Id' not in response.headers
+        
+        headers = {'X-Profile': '1', 'X-Profile-Token': 'secret-token'}
+        statuses = [client.get('/users', headers=headers).headers['X-Profile-Status'] for _ in range(3)]
+        assert statuses == ['captured', 'captured', 'rate-limited']
+        
+        # Requests without the header are never touched
+        assert 'X-Profile-Status' not in client.get('/users').headers
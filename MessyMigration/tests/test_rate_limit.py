@@ -0,0 +1,141 @@
+"""
+Unit Tests for the shared sliding-window login rate limiter
+"""
+
+import json
+import os
+import pytest
+import routes.user_routes
+import services.user_service
+import utils.admission
+from app import create_app
+from models.db import init_db
+from utils.rate_limit import LoginRateLimiter, SharedWindowTable, default_table_path, parse_rule
+
+class TestSharedWindowTable:
+    """Test class for SharedWindowTable"""
+    
+    def test_sliding_window(self):
+        """Test limits, all-or-nothing counting and the previous window's weight"""
+        table = SharedWindowTable(slots=64)
+        rules = [('ip:1', 3, 60.0), ('email:a', 2, 60.0)]
+        # t=1000 is 40s into its window
+        assert [table.hit(rules, now=1000.0) for _ in range(3)] == [None, None, 20]
+        # The refused attempt counted against neither key
+        table.refund([('email:a', 2, 60.0)], now=1001.0)
+        assert table.hit(rules, now=1001.0) is None
+        assert table.hit(rules, now=1002.0) is not None
+        
+        # 15s into the next window, 75% of the previous two attempts still count
+        email = [('email:a', 2, 60.0)]
+        assert table.hit(email, now=1035.0) is None
+        assert table.hit(email, now=1036.0) is not None
+        # 55s in, only 1/12 of them do
+        assert table.hit(email, now=1075.0) is None
+    
+    def test_shared_between_mappings(self, tmp_path):
+        """Test two workers mapping the same file see each other's counts"""
+        path = str(tmp_path / 'ratelimit')
+        first = SharedWindowTable(path, slots=64)
+        second = SharedWindowTable(path, slots=64)
+        rules = [('ip:10.0.0.1', 2, 60.0)]
+        assert first.hit(rules, now=1000.0) is None
+        assert second.hit(rules, now=1000.0) is None
+        assert first.hit(rules, now=1000.0) is not None
+        assert second.live_keys(now=1000.0) == 1
+    
+    @pytest.mark.skipif(not hasattr(os, 'fork'), reason="needs os.fork")
+    def test_forked_workers_serialize_updates(self, tmp_path):
+        """Test workers forked after the table was opened (gunicorn --preload) lose no hits"""
+        table = SharedWindowTable(str(tmp_path / 'ratelimit'), slots=64)
+        rules = [('ip:10.0.0.1', 8001, 60.0)]
+        table.hit(rules, now=1000.0)
+        pids = []
+        for _ in range(4):
+            pid = os.fork()
+            if pid == 0:
+                for _ in range(2000):
+                    table.hit(rules, now=1000.0)
+                os._exit(0)
+            pids.append(pid)
+        for pid in pids:
+            os.waitpid(pid, 0)
+        assert table.hit(rules, now=1000.0) is not None
+    
+    def test_from_env_shares_a_file_by_default(self, monkeypatch):
+        """Test the limiter's table is file-backed even without RATE_LIMIT_FILE"""
+        monkeypatch.delenv('RATE_LIMIT_FILE', raising=False)
+        monkeypatch.setenv('RATE_LIMIT_SLOTS', '64')
+        limiter = LoginRateLimiter.from_env()
+        assert limiter.table.path == default_table_path(64)
+        assert os.path.exists(default_table_path(64))
+    
+    def test_bounded_with_eviction(self):
+        """Test many keys never grow the table and expired slots are reused"""
+        table = SharedWindowTable(slots=8)
+        for i in range(100):
+            assert table.hit([(f"ip:{i}", 1, 60.0)], now=1000.0) is None
+        assert table.live_keys(now=1000.0) == 8
+        assert table.live_keys(now=1000.0 + 180) == 0
+    
+    def test_parse_rule(self):
+        """Test rule parsing"""
+        assert parse_rule('5/60') == (5, 60.0)
+        assert parse_rule('off') is None
+        with pytest.raises(ValueError):
+            parse_rule('5')
+
+class TestLoginRateLimit:
+    """Test class for rate limiting on POST /login"""
+    
+    @pytest.fixture
+    def client(self, monkeypatch):
+        """App with a fresh limiter allowing 3 failed logins per email"""
+        init_db()
+        limiter = LoginRateLimiter(SharedWindowTable(slots=64), per_ip=(20, 60.0), per_email=(3, 60.0))
+        monkeypatch.setattr(routes.user_routes, 'login_rate_limiter', limiter)
+        app = create_app()
+        app.config['TESTING'] = True
+        with app.test_client() as client:
+            yield client
+    
+    def test_failed_logins_limited_before_hashing(self, client, monkeypatch):
+        """Test attempts past the limit get 429 without a password check"""
+        client.post('/users', data=json.dumps({
+            "name": "Test User", "email": "test@example.com", "password": "password123"
+        }), content_type='application/json')
+        checks = []
+        real_verify = services.user_service.verify_password
+        monkeypatch.setattr(services.user_service, 'verify_password',
+                            lambda *args: checks.append(1) or real_verify(*args))
+        
+        def login(password):
+            return client.post('/login', data=json.dumps({
+                "email": "test@example.com", "password": password
+            }), content_type='application/json')
+        
+        # Correct logins are refunded and never use up the budget
+        assert [login('password123').status_code for _ in range(4)] == [200] * 4
+        assert [login('wrong1234').status_code for _ in range(3)] == [401] * 3
+        
+        response = login('password123')
+        assert response.status_code == 429
+        assert int(response.headers['Retry-After']) >= 1
+        assert len(checks) == 7
+    
+    def test_limited_before_admission(self, client, monkeypatch):
+        """Test an over-budget login gets 429 without asking for a hashing slot"""
+        for _ in range(3):
+            client.post('/login', data=json.dumps({
+                "email": "test@example.com", "password": "wrong1234"
+            }), content_type='application/json')
+        
+        # Every hashing slot is taken: an admitted login would get 503
+        acquired = []
+        monkeypatch.setattr(utils.admission.AdmissionLimiter, 'acquire',
+                            lambda self: acquired.append(self.name) or utils.admission.QUEUE_FULL)
+        response = client.post('/login', data=json.dumps({
+            "email": "test@example.com", "password": "password123"
+        }), content_type='application/json')
+        assert response.status_code == 429
+        assert acquired == []
@@ -0,0 +1,54 @@
+"""
+Unit Tests for the continuous stack sampler
+"""
+
+import os
+import threading
+from app import create_app
+from utils.sampler import StackSampler
+
+def _spin(stop):
+    while not stop.is_set():
+        sum(range(1000))
+
+class TestStackSampler:
+    """Test class for StackSampler and its app wiring"""
+    
+    def test_samples_folded_stacks(self, tmp_path):
+        """Test a busy thread's stack is written root-first in folded format"""
+        stop = threading.Event()
+        worker = threading.Thread(target=_spin, args=(stop,))
+        worker.start()
+        sampler = StackSampler(str(tmp_path), hz=200, interval=60)
+        try:
+            for _ in range(20):
+                sampler.sample()
+        finally:
+            stop.set()
+            worker.join()
+        
+        path = sampler.flush()
+        assert os.path.basename(path).startswith(f"{os.getpid()}-")
+        with open(path) as f:
+            lines = f.read().splitlines()
+        spinning = [line for line in lines if line.split(' ')[0].endswith('test_sampler.py:_spin')]
+        assert spinning
+        assert sum(int(line.rsplit(' ', 1)[1]) for line in spinning) == 20
+        assert spinning[0].startswith('threading.py:')
+        
+        # Counts are reset after each interval
+        assert sampler.flush() is None
+    
+    def test_sampler_started_per_process(self, tmp_path, monkeypatch):
+        """Test the app starts one sampler thread on its first request"""
+        monkeypatch.setenv('SAMPLER_DIR', str(tmp_path))
+        monkeypatch.setenv('SAMPLER_HZ', '100')
+        app = create_app()
+        app.config['TESTING'] = True
+        
+        before = [t for t in threading.enumerate() if t.name == 'stack-sampler']
+        with app.test_client() as client:
+            client.get('/users')
+            client.get('/users')
+        started = [t for t in threading.enumerate() if t.name == 'stack-sampler']
+        assert len(started) == len(before) + 1
@@ -0,0 +1,104 @@
+"""
+Unit Tests for priority scheduling
+"""
+
+import threading
+import time
+from flask import Blueprint, Flask, g
+from utils.admission import ADMITTED, QUEUE_FULL
+from utils.metrics import Registry
+from utils.scheduling import (BULK, INTERACTIVE, PriorityScheduler, init_scheduling,
+                              priority_class, scheduler_limits)
+
+def _queue(scheduler, name, outcomes):
+    """Start a thread that waits in scheduler for a slot of class name"""
+    before = scheduler.waiting(name)
+    thread = threading.Thread(target=lambda: outcomes.append((name, scheduler.acquire(name))))
+    thread.start()
+    while scheduler.waiting(name) == before:
+        time.sleep(0.001)
+    return thread
+
+class TestPriorityScheduler:
+    """Test class for PriorityScheduler"""
+    
+    def test_limits(self):
+        """Test bulk stays out of the interactive share and interactive leaves bulk a slot"""
+        assert scheduler_limits(8, 0.75, 1) == {INTERACTIVE: 7, BULK: 2}
+        assert scheduler_limits(4, 1.0, 1) == {INTERACTIVE: 3, BULK: 1}
+    
+    def test_interactive_first_bulk_progresses(self):
+        """Test freed slots go to interactive waiters first, then to bulk"""
+        scheduler = PriorityScheduler(4, scheduler_limits(4, 0.5, 1), timeout=5)
+        assert [scheduler.acquire(BULK) for _ in range(2)] == [ADMITTED, ADMITTED]
+        assert [scheduler.acquire(INTERACTIVE) for _ in range(2)] == [ADMITTED, ADMITTED]
+        
+        outcomes = []
+        bulk_waiter = _queue(scheduler, BULK, outcomes)
+        interactive_waiter = _queue(scheduler, INTERACTIVE, outcomes)
+        
+        # A bulk slot frees up: the later-arriving interactive request gets it
+        scheduler.release(BULK)
+        interactive_waiter.join()
+        assert outcomes == [(INTERACTIVE, ADMITTED)]
+        assert scheduler.waiting(BULK) == 1
+        
+        # The next free slot goes to bulk, which is under its cap
+        scheduler.release(INTERACTIVE)
+        bulk_waiter.join()
+        assert outcomes[-1] == (BULK, ADMITTED)
+        assert scheduler.active == {INTERACTIVE: 2, BULK: 2}
+    
+    def test_bulk_capped_with_free_capacity(self):
+        """Test bulk waits at its cap even when slots are idle"""
+        scheduler = PriorityScheduler(4, scheduler_limits(4, 0.5, 1), max_queue=0, timeout=1)
+        assert [scheduler.acquire(BULK) for _ in range(2)] == [ADMITTED, ADMITTED]
+        assert scheduler.acquire(BULK) == QUEUE_FULL
+        assert scheduler.acquire(INTERACTIVE) == ADMITTED
+
+class TestSchedulingMiddleware:
+    """Test class for request classification"""
+    
+    def test_classification(self):
+        """Test route marks and the X-Priority header pick the class"""
+        bp = Blueprint('users', __name__)
+        
+        @bp.route('/read')
+        def read():
+            return g.scheduler_slot
+        
+        @bp.route('/export')
+        @priority_class(BULK)
+        def export():
+            return g.scheduler_slot
+        
+        app = Flask(__name__)
+        app.register_blueprint(bp)
+        scheduler = init_scheduling(app, PriorityScheduler(2, {INTERACTIVE: 1, BULK: 1}),
+                                    routes={}, registry=Registry())
+        client = app.test_client()
+        
+        assert client.get('/read').get_data(as_text=True) == INTERACTIVE
+        assert client.get('/export').get_data(as_text=True) == BULK
+        assert client.get('/read', headers={'X-Priority': 'bulk'}).get_data(as_text=True) == BULK
+        # The header cannot promote bulk routes
+        assert client.get('/export', headers={'X-Priority': 'interactive'}).get_data(as_text=True) == BULK
+        assert scheduler.active == {INTERACTIVE: 0, BULK: 0}
+    
+    def test_streamed_export_holds_slot(self, monkeypatch):
+        """Test an export in flight keeps its bulk slot while interactive requests still run"""
+        monkeypatch.delenv('DATABASE_URL', raising=False)
+        monkeypatch.setenv('SCHEDULER_CAPACITY', '2')
+        monkeypatch.setenv('SCHEDULER_INTERACTIVE_SHARE', '0.5')
+        monkeypatch.setenv('SCHEDULER_QUEUE', '0')
+        from app import create_app
+        client = create_app().test_client()
+        
+        export = client.get('/users/export', buffered=False)
+        assert export.status_code == 200
+        try:
+            assert client.get('/users').status_code == 200
+            assert client.get('/users/export').status_code == 503
+        finally:
+            export.close()
+        assert client.get('/users/export').status_code == 200
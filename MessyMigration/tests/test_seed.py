@@ -0,0 +1,60 @@
+"""
+Unit Tests for synthetic seed data and snapshots
+"""
+
+from werkzeug.security import check_password_hash
+import routes.user_routes
+from app import create_app
+from models.db import DatabaseManager, init_db
+from models.seed import SEED_PASSWORD, generate_users, load_chunks, read_snapshot, write_snapshot
+from services.user_service import UserService
+from utils.validation import validate_user_data
+
+def flatten(chunks):
+    """Join generated chunks into one list of rows"""
+    return [user for chunk in chunks for user in chunk]
+
+class TestSeedData:
+    """Test class for generate_users and snapshot round trips"""
+    
+    def test_generate_is_deterministic_and_valid(self):
+        """Test the same seed gives the same users and rows pass validation"""
+        first = flatten(generate_users(250, seed=3, chunk_size=100, password_hash='hash'))
+        second = flatten(generate_users(250, seed=3, chunk_size=100, password_hash='hash'))
+        other = flatten(generate_users(250, seed=4, chunk_size=100, password_hash='hash'))
+        
+        assert first == second
+        assert first != other
+        assert [user['id'] for user in first] == list(range(1, 251))
+        assert len({user['email'] for user in first}) == 250
+        for user in first:
+            data = {'name': user['name'], 'email': user['email'], 'password': SEED_PASSWORD}
+            assert validate_user_data(data)['valid']
+    
+    def test_snapshot_round_trip(self, tmp_path):
+        """Test a written snapshot loads into the in-memory store with a usable hash"""
+        path = str(tmp_path / 'users.ndjson')
+        assert write_snapshot(path, generate_users(30, seed=1, chunk_size=7)) == 30
+        
+        init_db()
+        db = DatabaseManager()
+        assert load_chunks(db, read_snapshot(path, chunk_size=8)) == 30
+        
+        user = db.get_user_by_id(30)
+        assert check_password_hash(user['password_hash'], SEED_PASSWORD)
+        assert db.get_all_users()[0]['id'] == 30  # Newest first
+    
+    def test_snapshot_preloads_configured_backend(self, tmp_path, monkeypatch):
+        """Test DATABASE_SNAPSHOT fills the SQLite store named by DATABASE_URL"""
+        path = str(tmp_path / 'users.ndjson')
+        write_snapshot(path, generate_users(5, seed=1))
+        monkeypatch.setenv('DATABASE_URL', f"sqlite:///{tmp_path / 'users.db'}")
+        monkeypatch.delenv('SHADOW_DATABASE_URL', raising=False)
+        monkeypatch.setenv('DATABASE_SNAPSHOT', path)
+        monkeypatch.setattr(routes.user_routes, 'user_service', UserService())
+        
+        client = create_app().test_client()
+        assert len(client.get('/users').get_json()) == 5
+        # A second worker loading the same snapshot adds nothing
+        create_app()
+        assert len(client.get('/users').get_json()) == 5
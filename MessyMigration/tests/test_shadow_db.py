@@ -0,0 +1,120 @@
+"""
+Unit Tests for the shadow-read DatabaseManager
+"""
+
+import pytest
+from models.db import create_database_manager, init_db
+from models.shadow_db import ShadowDatabaseManager
+from services.user_service import UserService
+from utils.metrics import Registry
+
+class TestShadowDatabaseManager:
+    """Test class for ShadowDatabaseManager"""
+    
+    @pytest.fixture
+    def db(self, tmp_path):
+        """In-memory primary shadowed by a SQLite backend, sampling every read"""
+        init_db()
+        db = ShadowDatabaseManager(
+            create_database_manager(),
+            create_database_manager(f"sqlite:///{tmp_path / 'shadow.db'}"),
+            read_sample_rate=1.0,
+            mirror_writes=True,
+            registry=Registry()
+        )
+        yield db
+        db.flush()
+    
+    def test_mirrored_writes_match(self, db):
+        """Test mirrored writes keep the shadow in step and reads agree"""
+        john = db.create_user_if_email_absent("John Doe", "john@example.com", "hash")
+        db.create_user_if_email_absent("Jane Doe", "jane@example.com", "hash")
+        db.update_user_returning(john['id'], {"name": "John Smith"})
+        db.delete_user_returning(2)
+        db.flush()
+        
+        assert db.get_user_by_id(john['id'])['name'] == "John Smith"
+        assert db.search_users_by_name("john") == [db.get_user_by_id(john['id'])]
+        db.flush()
+        
+        stats = db.stats()
+        assert stats['counters']['compared'] == 3
+        assert stats['counters']['mismatches'] == 0
+        assert stats['latency']['primary.get_user_by_id']['count'] == 2
+        assert stats['latency']['shadow.update_user_returning']['count'] == 1
+    
+    def test_mismatch_recorded(self, db):
+        """Test a diverged shadow is reported without affecting the answer"""
+        john = db.create_user_if_email_absent("John Doe", "john@example.com", "hash")
+        db.flush()
+        db.shadow.update_user_returning(john['id'], {"name": "Diverged"})
+        
+        assert db.get_user_by_email("john@example.com")['name'] == "John Doe"
+        db.flush()
+        
+        stats = db.stats()
+        assert stats['counters']['mismatches'] == 1
+        assert stats['recent_mismatches'][0]['method'] == 'get_user_by_email'
+    
+    def test_exported_as_metrics(self, tmp_path):
+        """Test comparison counters, dropped calls, latency and backlog reach the registry"""
+        init_db()
+        registry = Registry()
+        db = ShadowDatabaseManager(
+            create_database_manager(),
+            create_database_manager(f"sqlite:///{tmp_path / 'metrics.db'}"),
+            read_sample_rate=1.0, mirror_writes=True, max_pending=1, registry=registry
+        )
+        db.create_user_if_email_absent("John Doe", "john@example.com", "hash")
+        db.flush()
+        db.shadow.update_user_returning(1, {"name": "Diverged"})
+        db.get_user_by_id(1)
+        db.flush()
+        db.max_pending = 0
+        db.get_user_by_id(1)
+        
+        text = registry.render()
+        assert 'shadow_db_events_total{event="compared"} 1' in text
+        assert 'shadow_db_events_total{event="mismatches"} 1' in text
+        assert 'shadow_db_events_total{event="dropped"} 1' in text
+        assert 'shadow_db_call_duration_seconds_count{backend="shadow",method="get_user_by_id"} 1' in text
+        assert 'shadow_db_pending 0' in text
+    
+    def test_rolled_back_transaction_not_mirrored(self, db):
+        """Test a rolled-back transaction never reaches the shadow and a committed one does"""
+        db.create_user_if_email_absent("John Doe", "john@example.com", "hash")
+        with pytest.raises(RuntimeError):
+            with db.transaction():
+                db.create_user_if_email_absent("Jane Doe", "jane@example.com", "hash")
+                db.update_user_returning(1, {"name": "John Smith"})
+                raise RuntimeError("abort")
+        db.flush()
+        
+        assert db.primary.get_user_by_email("jane@example.com") is None
+        assert db.shadow.get_user_by_email("jane@example.com") is None
+        assert db.shadow.get_user_by_id(1)['name'] == "John Doe"
+        
+        with db.transaction():
+            db.update_user_returning(1, {"name": "John Smith"})
+            assert db.shadow.get_user_by_id(1)['name'] == "John Doe"
+        db.flush()
+        assert db.shadow.get_user_by_id(1)['name'] == "John Smith"
+    
+    def test_rolled_back_batch_not_mirrored(self, tmp_path, monkeypatch):
+        """Test an atomic batch that fails leaves the mirrored shadow untouched"""
+        monkeypatch.delenv('DATABASE_URL', raising=False)
+        monkeypatch.setenv('SHADOW_DATABASE_URL', f"sqlite:///{tmp_path / 'batch.db'}")
+        monkeypatch.setenv('SHADOW_MIRROR_WRITES', 'true')
+        init_db()
+        service = UserService()
+        
+        results, committed = service.execute_batch([
+            {'op': 'create', 'data': {'name': "Jane Doe", 'email': "jane@example.com",
+                                      'password': 'password123'}},
+            {'op': 'delete', 'id': 999}
+        ], atomic=True)
+        assert not committed
+        service.db.flush()
+        
+        assert service.db.primary.get_user_by_email("jane@example.com") is None
+        assert service.db.shadow.get_user_by_email("jane@example.com") is None
@@ -0,0 +1,106 @@
+"""
+Unit Tests for the slow request log
+"""
+
+import json
+import os
+import time
+import pytest
+from flask import Blueprint, Flask, Response
+from utils.slow_requests import REDACTED, init_slow_request_log, redact
+
+class TestSlowRequestLog:
+    """Test class for slow request logging"""
+    
+    @pytest.fixture
+    def app(self, tmp_path, monkeypatch):
+        """App with a 'users' blueprint whose /slow route crosses a 50ms threshold"""
+        monkeypatch.setenv('SLOW_REQUEST_LOG', str(tmp_path / 'slow.ndjson'))
+        monkeypatch.setenv('SLOW_REQUEST_THRESHOLD_MS', '50')
+        bp = Blueprint('users', __name__)
+        
+        @bp.route('/slow/<int:user_id>', methods=['POST'])
+        def slow(user_id):
+            time.sleep(0.2)
+            return 'done'
+        
+        @bp.route('/fast')
+        def fast():
+            return 'done'
+        
+        @bp.route('/export')
+        def export():
+            def rows():
+                for i in range(3):
+                    time.sleep(0.05)
+                    yield f"{i}\n"
+            return Response(rows(), mimetype='text/csv')
+        
+        app = Flask(__name__)
+        app.register_blueprint(bp)
+        
+        @app.route('/outside')
+        def outside():
+            time.sleep(0.1)
+            return 'done'
+        
+        app.slow_log = init_slow_request_log(app)
+        return app
+    
+    def test_slow_request_recorded(self, app, tmp_path):
+        """Test only slow blueprint requests are logged, with stack and redacted body"""
+        with app.test_client() as client:
+            client.post('/slow/7?verbose=1', json={'email': 'a@b.com', 'password': 'hunter22'})
+            client.get('/fast')
+            client.get('/outside')
+        app.slow_log.close()
+        
+        with open(tmp_path / 'slow.ndjson') as f:
+            entries = [json.loads(line) for line in f]
+        assert len(entries) == 1
+        entry = entries[0]
+        assert entry['route'] == '/slow/<int:user_id>'
+        assert entry['status'] == 200
+        assert entry['duration_ms'] >= 200
+        assert entry['params']['view_args'] == {'user_id': 7}
+        assert entry['params']['query'] == {'verbose': ['1']}
+        assert entry['params']['body'] == {'email': 'a@b.com', 'password': REDACTED}
+        # The sample was taken mid-request, inside the sleeping view
+        assert entry['stack'][-1].endswith(' in slow')
+    
+    def test_slow_streamed_export(self, app, tmp_path):
+        """Test a streamed body is timed until it has been sent, not until the view returns"""
+        with app.test_client() as client:
+            response = client.get('/export', buffered=False)
+            assert response.get_data(as_text=True) == "0\n1\n2\n"
+            response.close()
+        app.slow_log.close()
+        
+        with open(tmp_path / 'slow.ndjson') as f:
+            entries = [json.loads(line) for line in f]
+        assert [entry['route'] for entry in entries] == ['/export']
+        assert entries[0]['status'] == 200
+        assert entries[0]['duration_ms'] >= 150
+    
+    def test_redact_nested(self):
+        """Test password fields are masked at any depth"""
+        value = {'users': [{'password': 'x', 'name': 'A'}], 'new_password': 'y'}
+        assert redact(value) == {'users': [{'password': REDACTED, 'name': 'A'}], 'new_password': REDACTED}
+    
+    @pytest.mark.skipif(not hasattr(os, 'fork'), reason="needs os.fork")
+    def test_forked_worker_logs(self, app, tmp_path):
+        """Test a worker forked after app creation (gunicorn --preload) samples and writes slow requests"""
+        pid = os.fork()
+        if pid == 0:
+            try:
+                with app.test_client() as client:
+                    client.post('/slow/7', json={})
+                app.slow_log.close()
+            finally:
+                os._exit(0)
+        os.waitpid(pid, 0)
+        
+        with open(tmp_path / 'slow.ndjson') as f:
+            entries = [json.loads(line) for line in f]
+        assert [entry['route'] for entry in entries] == ['/slow/<int:user_id>']
+        assert entries[0]['stack'][-1].endswith(' in slow')
@@ -0,0 +1,88 @@
+"""
+Unit Tests for per-layer tracing spans
+"""
+
+import json
+import os
+import time
+import pytest
+from flask import Flask
+from utils import tracing
+
+class RecordingExporter:
+    """Collects exported documents in memory"""
+    
+    def __init__(self):
+        self.documents = []
+    
+    def export(self, document):
+        self.documents.append(document)
+
+class TestTracing:
+    """Test class for traced spans, Server-Timing and OTLP export"""
+    
+    @pytest.fixture
+    def enabled(self, monkeypatch):
+        """Turn tracing on for functions decorated inside the test"""
+        monkeypatch.setattr(tracing, 'TRACING_ENABLED', True)
+    
+    def test_disabled_decorator_is_identity(self):
+        """Test @traced leaves functions untouched while tracing is off"""
+        def handler():
+            return 'ok'
+        assert tracing.traced('route')(handler) is handler
+    
+    def test_request_spans(self, enabled):
+        """Test spans nest per layer, feed Server-Timing and export as OTLP JSON"""
+        @tracing.traced('store')
+        def lookup():
+            return {'id': 1}
+        
+        @tracing.traced('store')
+        def lookup_twice():
+            return lookup() and lookup()  # Nested store spans are not double counted
+        
+        @tracing.traced('service')
+        def service_call():
+            return lookup_twice()
+        
+        app = Flask(__name__)
+        exporter = RecordingExporter()
+        tracing.init_tracing(app, exporter=exporter)
+        
+        @app.route('/thing')
+        @tracing.traced('route')
+        def thing():
+            return service_call()
+        
+        response = app.test_client().get('/thing')
+        header = response.headers['Server-Timing']
+        assert [entry.split(';')[0] for entry in header.split(', ')] == ['route', 'service', 'store', 'total']
+        
+        spans = exporter.documents[0]['resourceSpans'][0]['scopeSpans'][0]['spans']
+        assert len(spans) == 6
+        root = spans[0]
+        assert root['name'] == 'GET /thing'
+        assert root['kind'] == tracing.SPAN_KIND_SERVER
+        assert 'parentSpanId' not in root
+        assert all(span['traceId'] == root['traceId'] for span in spans)
+        assert spans[1]['parentSpanId'] == root['spanId']
+        assert tracing.current_trace() is None
+    
+    @pytest.mark.skipif(not hasattr(os, 'fork'), reason="needs os.fork")
+    def test_file_exporter_in_forked_worker(self, tmp_path):
+        """Test an exporter created before a fork (gunicorn --preload) still writes from the worker"""
+        path = tmp_path / 'spans.jsonl'
+        exporter = tracing.SpanFileExporter(str(path))
+        pid = os.fork()
+        if pid == 0:
+            try:
+                exporter.export({'worker': True})
+                deadline = time.monotonic() + 5
+                while not (path.exists() and path.read_text()) and time.monotonic() < deadline:
+                    time.sleep(0.01)
+            finally:
+                os._exit(0)
+        os.waitpid(pid, 0)
+        
+        assert [json.loads(line) for line in path.read_text().splitlines()] == [{'worker': True}]
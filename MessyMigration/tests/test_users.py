@@ -7,6 +7,7 @@ import pytest
 import json
 import os
 import tempfile
+import routes.user_routes
 from app import create_app
 from models.db import init_db
 
@@ -304,6 +305,266 @@ class TestUserAPI:
         data = json.loads(response.data)
         assert 'error' in data
         assert 'User not found' in data['error']
+    
+    def test_update_user_if_match(self, client):
+        """Test PUT /user/<id> with If-Match returns 412 on a stale version"""
+        user_data = {
+            "name": "Original Name",
+            "email": "original@example.com",
+            "password": "password123"
+        }
+        
+        response = client.post('/users',
+                              data=json.dumps(user_data),
+                              content_type='application/json')
+        assert response.headers['ETag'] == '"1"'
+        user_id = json.loads(response.data)['id']
+        
+        response = client.put(f'/user/{user_id}',
+                             data=json.dumps({"name": "First Writer"}),
+                             content_type='application/json',
+                             headers={'If-Match': '"1"'})
+        assert response.status_code == 200
+        assert response.headers['ETag'] == '"2"'
+        assert json.loads(response.data)['version'] == 2
+        
+        # A second writer still holding version 1 must not overwrite
+        response = client.put(f'/user/{user_id}',
+                             data=json.dumps({"name": "Second Writer"}),
+                             content_type='application/json',
+                             headers={'If-Match': '"1"'})
+        assert response.status_code == 412
+        
+        response = client.delete(f'/user/{user_id}', headers={'If-Match': '"1"'})
+        assert response.status_code == 412
+        
+        # Weak tags never match; any strong tag in a list may
+        def put(if_match):
+            return client.put(f'/user/{user_id}', data=json.dumps({"name": "Third Writer"}),
+                              content_type='application/json', headers={'If-Match': if_match})
+        assert put('W/"2"').status_code == 412
+        assert put('"abc", W/"2"').status_code == 412
+        assert put('"1", "2"').headers['ETag'] == '"3"'
+        assert put('2').status_code == 400
+        assert put('"3').status_code == 400
+        
+        response = client.delete(f'/user/{user_id}', headers={'If-Match': '"9", "3",'})
+        assert response.status_code == 200
+    
+    def test_export_users(self, client, monkeypatch):
+        """Test GET /users/export streams NDJSON and CSV"""
+        users = [
+            {"name": "John Smith", "email": "john@example.com", "password": "password123"},
+            {"name": "Jane Doe", "email": "jane@example.com", "password": "password123"}
+        ]
+        for user in users:
+            client.post('/users',
+                       data=json.dumps(user),
+                       content_type='application/json')
+        
+        response = client.get('/users/export?format=ndjson')
+        assert response.status_code == 200
+        assert response.is_streamed
+        assert response.mimetype == 'application/x-ndjson'
+        rows = [json.loads(line) for line in response.data.decode().splitlines()]
+        assert [row['email'] for row in rows] == ["john@example.com", "jane@example.com"]
+        assert 'password_hash' not in rows[0]
+        # Like a WSGI server, hand back the export slot once the body is read
+        response.close()
+        
+        response = client.get('/users/export?format=csv')
+        assert response.status_code == 200
+        lines = response.data.decode().splitlines()
+        response.close()
+        assert lines[0] == "id,name,email,created_at,version"
+        assert len(lines) == 3
+        
+        # A bad format is refused before any snapshot is opened
+        snapshots = []
+        monkeypatch.setattr(routes.user_routes.user_service, 'export_users',
+                            lambda: snapshots.append(1) or iter(()))
+        response = client.get('/users/export?format=xml')
+        assert response.status_code == 400
+        assert snapshots == []
+    
+    def test_import_users(self, client):
+        """Test POST /users/import creates valid rows and reports bad lines"""
+        lines = [
+            json.dumps({"name": "John Smith", "email": "john@example.com", "password": "password123"}),
+            json.dumps({"name": "Bad Email", "email": "not-an-email", "password": "password123"}),
+            "",
+            "{not json",
+            json.dumps({"name": "Jane Doe", "email": "jane@example.com", "password": "password123"}),
+            json.dumps({"name": "John Again", "email": "john@example.com", "password": "password123"})
+        ]
+        
+        response = client.post('/users/import',
+                              data='\n'.join(lines) + '\n',
+                              content_type='application/x-ndjson')
+        assert response.status_code == 200
+        output = [json.loads(line) for line in response.data.decode().splitlines()]
+        
+        errors = {item['line']: item['error'] for item in output if 'line' in item}
+        assert 'Invalid email format' in errors[2]
+        assert errors[4] == "Invalid JSON"
+        assert errors[6] == "Email already exists"
+        assert output[-1] == {"processed": 5, "created": 2, "failed": 3, "done": True}
+        
+        response = client.get('/users')
+        assert len(json.loads(response.data)) == 2
+    
+    def test_get_users_by_ids(self, client):
+        """Test GET /users?ids= and POST /users/lookup return users in request order"""
+        ids = []
+        for name, email in [("John Doe", "john@example.com"), ("Jane Doe", "jane@example.com")]:
+            response = client.post('/users',
+                                  data=json.dumps({"name": name, "email": email, "password": "password123"}),
+                                  content_type='application/json')
+            ids.append(json.loads(response.data)['id'])
+        
+        response = client.get(f'/users?ids={ids[1]},999,{ids[0]}')
+        assert response.status_code == 200
+        users = json.loads(response.data)
+        assert [user and user['email'] for user in users] == ["jane@example.com", None, "john@example.com"]
+        assert 'password_hash' not in users[0]
+        
+        response = client.post('/users/lookup', data=json.dumps({"ids": [ids[0]]}),
+                              content_type='application/json')
+        assert response.status_code == 200
+        assert json.loads(response.data)[0]['name'] == "John Doe"
+        
+        assert client.get('/users?ids=1,abc').status_code == 400
+        assert client.get('/users?ids=').status_code == 400
+        assert client.post('/users/lookup', data=json.dumps({"ids": "1,2"}),
+                          content_type='application/json').status_code == 400
+        for bad in ([1.9], ["1"], [True], [ids[0], 2.0]):
+            assert client.post('/users/lookup', data=json.dumps({"ids": bad}),
+                              content_type='application/json').status_code == 400
+        response = client.post('/batch', json={"operations": [{"op": "get", "id": 1.9}]})
+        assert response.get_json()['results'][0]['status'] == 400
+    
+    def test_sparse_fieldsets(self, client):
+        """Test fields= trims /users and /search rows to the requested fields"""
+        client.post('/users',
+                   data=json.dumps({"name": "John Doe", "email": "john@example.com", "password": "password123"}),
+                   content_type='application/json')
+        
+        response = client.get('/users?fields=id,name')
+        assert response.status_code == 200
+        assert json.loads(response.data) == [{"id": 1, "name": "John Doe"}]
+        
+        response = client.get('/search?name=john&fields=email')
+        assert json.loads(response.data) == [{"email": "john@example.com"}]
+        
+        response = client.get('/users?ids=1&fields=name')
+        assert json.loads(response.data) == [{"name": "John Doe"}]
+        
+        assert client.get('/users?fields=id,password_hash').status_code == 400
+        assert client.get('/search?name=john&fields=').status_code == 400
+    
+    def test_columns_layout(self, client):
+        """Test layout=columns returns one array per field with epoch-millisecond timestamps"""
+        for name, email in [("John Doe", "john@example.com"), ("Jane Doe", "jane@example.com")]:
+            client.post('/users',
+                       data=json.dumps({"name": name, "email": email, "password": "password123"}),
+                       content_type='application/json')
+        rows = json.loads(client.get('/users').data)
+        
+        response = client.get('/users?layout=columns')
+        assert response.status_code == 200
+        data = json.loads(response.data)
+        assert data['count'] == 2
+        assert set(data['columns']) == {'id', 'name', 'email', 'created_at', 'version'}
+        assert data['columns']['id'] == [row['id'] for row in rows]
+        assert all(isinstance(value, int) for value in data['columns']['created_at'])
+        
+        data = json.loads(client.get('/users?layout=columns&fields=name').data)
+        assert data['columns'] == {'name': [row['name'] for row in rows]}
+        
+        assert client.get('/users?layout=table').status_code == 400
+        assert client.get('/users?layout=columns&ids=1').status_code == 400
+    
+    def test_changes_endpoint(self, client):
+        """Test /users/changes returns changes since a token and a token to continue from"""
+        token = json.loads(client.get('/users/changes').data)['token']
+        client.post('/users',
+                   data=json.dumps({"name": "John Doe", "email": "john@example.com", "password": "password123"}),
+                   content_type='application/json')
+        client.delete('/user/1')
+        
+        response = client.get(f'/users/changes?since={token}')
+        assert response.status_code == 200
+        data = json.loads(response.data)
+        assert data['changes'] == [{"op": "delete", "id": 1, "user": None}]
+        assert data['more'] is False
+        
+        data = json.loads(client.get(f"/users/changes?since={data['token']}").data)
+        assert data['changes'] == []
+        
+        response = client.get(f"/users/changes?since={int(data['token']) + 1}")
+        assert response.status_code == 410
+        assert json.loads(response.data)['resync_required'] is True
+        assert client.get('/users/changes?since=abc').status_code == 400
+        assert client.get(f'/users/changes?since={token}&limit=0').status_code == 400
+        assert client.get('/users/changes?since=%C2%B2').status_code == 400
+        assert client.get('/users/changes?since=-1').status_code == 400
+        assert client.get(f'/users/changes?since={token}&limit=%C2%B2').status_code == 400
+    
+    def test_batch_operations(self, client):
+        """Test POST /batch runs mixed operations and reports each one's result"""
+        response = client.post('/batch', data=json.dumps({"operations": [
+            {"op": "create", "data": {"name": "John Doe", "email": "john@example.com", "password": "password123"}},
+            {"op": "update", "id": 1, "version": 1, "data": {"name": "John Smith"}},
+            {"op": "get", "id": 1},
+            {"op": "delete", "id": 99},
+            {"op": "create", "data": {"name": "Jane Doe", "email": "not-an-email", "password": "password123"}},
+            {"op": "rename", "id": 1}
+        ]}), content_type='application/json')
+        assert response.status_code == 200
+        data = json.loads(response.data)
+        assert data['committed'] is True
+        assert [result['status'] for result in data['results']] == [201, 200, 200, 404, 400, 400]
+        assert data['results'][2]['body']['name'] == "John Smith"
+        assert 'password_hash' not in data['results'][2]['body']
+        
+        assert client.post('/batch', data=json.dumps({"operations": []}),
+                           content_type='application/json').status_code == 400
+    
+    def test_batch_atomic(self, client):
+        """Test an atomic batch keeps nothing unless every operation succeeds"""
+        client.post('/users',
+                   data=json.dumps({"name": "John Doe", "email": "john@example.com", "password": "password123"}),
+                   content_type='application/json')
+        
+        response = client.post('/batch', data=json.dumps({"atomic": True, "operations": [
+            {"op": "create", "data": {"name": "Jane Doe", "email": "jane@example.com", "password": "password123"}},
+            {"op": "delete", "id": 1, "version": 5},
+            {"op": "delete", "id": 1}
+        ]}), content_type='application/json')
+        data = json.loads(response.data)
+        assert data['committed'] is False
+        assert [result['status'] for result in data['results']] == [424, 412, 424]
+        assert [user['email'] for user in json.loads(client.get('/users').data)] == ["john@example.com"]
+        
+        response = client.post('/batch', data=json.dumps({"atomic": True, "operations": [
+            {"op": "delete", "id": 1},
+            {"op": "get", "id": "x"}
+        ]}), content_type='application/json')
+        data = json.loads(response.data)
+        assert [result['status'] for result in data['results']] == [424, 400]
+        assert client.get('/users?ids=1').get_json()[0]['email'] == "john@example.com"
+    
+    def test_metrics_endpoint(self, client):
+        """Test GET /metrics reports per-route requests, latency and store size"""
+        client.get('/users')
+        
+        response = client.get('/metrics')
+        assert response.status_code == 200
+        text = response.data.decode()
+        assert 'http_requests_total{method="GET",route="/users",status="200"}' in text
+        assert 'http_request_duration_seconds_bucket{method="GET",route="/users",le="+Inf"}' in text
+        assert 'user_store_rows{pid=' in text
+        assert 'password_hash_queue_depth 0' in text
 
 if __name__ == '__main__':
     pytest.main([__file__, '-v'])
@@ -0,0 +1,215 @@
+"""
+Admission Control Module
+Per-endpoint-class concurrency limits with bounded wait queues
+
+Routes opt in with @admission_class('<class>'). Each class admits at most
+`concurrency` requests at once and lets at most `queue` more wait (FIFO) for
+up to ADMISSION_QUEUE_TIMEOUT_MS. Anything beyond that is answered at once
+with 503 and a Retry-After estimated from recent service times, so a burst
+of scrypt-bound logins cannot occupy every worker thread.
+
+Configuration:
+    ADMISSION_LIMITS            per-class limits, e.g. "hashing=4:8,export=2:2"
+                                (concurrency:queue); classes without limits are unbounded
+    ADMISSION_ROUTES            per-route class overrides, e.g. "users.search_users=export"
+    ADMISSION_QUEUE_TIMEOUT_MS  longest a request waits for a slot (default 5000)
+
+Keep concurrency + queue of all classes below the worker's thread count so
+unlimited routes always find a free thread.
+"""
+
+import math
+import os
+import threading
+import time
+from collections import deque
+from flask import g, jsonify, request
+
+from utils.metrics import REGISTRY
+
+ADMITTED = 'admitted'
+QUEUE_FULL = 'queue_full'
+TIMED_OUT = 'timeout'
+
+# Weight of the newest hold time in the moving average behind Retry-After
+HOLD_TIME_SMOOTHING = 0.2
+
+def admission_class(name):
+    """Decorator assigning a view to an admission class"""
+    def decorator(fn):
+        fn.admission_class = name
+        return fn
+    return decorator
+
+class AdmissionLimiter:
+    """Counting semaphore with a bounded FIFO wait queue"""
+
+    def __init__(self, name, concurrency, max_queue, timeout):
+        self.name = name
+        self.concurrency = concurrency
+        self.max_queue = max_queue
+        self.timeout = timeout
+        self.active = 0
+        self.avg_hold = 0.0
+        self._waiters = deque()
+        self._lock = threading.Lock()
+
+    @property
+    def waiting(self):
+        return len(self._waiters)
+
+    def acquire(self):
+        """
+        Take a slot, waiting in line if needed.
+
+        Returns:
+            str: ADMITTED, QUEUE_FULL (rejected without waiting) or TIMED_OUT
+        """
+        with self._lock:
+            if self.active < self.concurrency and not self._waiters:
+                self.active += 1
+                return ADMITTED
+            if len(self._waiters) >= self.max_queue:
+                return QUEUE_FULL
+            waiter = threading.Event()
+            self._waiters.append(waiter)
+        if waiter.wait(self.timeout):
+            return ADMITTED
+        with self._lock:
+            # A release may have handed us the slot just as the wait expired
+            if waiter.is_set():
+                return ADMITTED
+            self._waiters.remove(waiter)
+            return TIMED_OUT
+
+    def release(self, held=None):
+        """Free a slot, handing it straight to the longest waiter if any"""
+        with self._lock:
+            if held is not None:
+                self.avg_hold += HOLD_TIME_SMOOTHING * (held - self.avg_hold)
+            if self._waiters:
+                self._waiters.popleft().set()
+            else:
+                self.active -= 1
+
+    def retry_after(self):
+        """Seconds until the current queue has likely drained (at least 1)"""
+        with self._lock:
+            backlog = len(self._waiters) + 1
+        return max(1, math.ceil(self.avg_hold * backlog / max(self.concurrency, 1)))
+
+def overloaded_response(retry_after):
+    """503 response telling the client when to retry"""
+    response = jsonify({"error": "Service temporarily overloaded"})
+    response.status_code = 503
+    response.headers['Retry-After'] = str(retry_after)
+    return response
+
+def parse_limits(spec):
+    """
+    Parse "class=concurrency:queue,..." into {class: (concurrency, queue)}.
+
+    Raises:
+        ValueError: for malformed entries
+    """
+    limits = {}
+    for item in filter(None, (part.strip() for part in (spec or '').split(','))):
+        name, sep, values = item.partition('=')
+        concurrency, _, max_queue = values.partition(':')
+        try:
+            concurrency, max_queue = int(concurrency), int(max_queue or 0)
+        except ValueError:
+            concurrency, max_queue = 0, 0
+        if not sep or not name.strip() or concurrency < 1 or max_queue < 0:
+            raise ValueError(f"Invalid admission limit: {item!r}")
+        limits[name.strip()] = (concurrency, max_queue)
+    return limits
+
+def parse_routes(spec):
+    """Parse "endpoint=class,..." into {endpoint: class}"""
+    routes = {}
+    for item in filter(None, (part.strip() for part in (spec or '').split(','))):
+        endpoint, sep, name = item.partition('=')
+        if not sep or not endpoint.strip() or not name.strip():
+            raise ValueError(f"Invalid admission route: {item!r}")
+        routes[endpoint.strip()] = name.strip()
+    return routes
+
+def default_limits():
+    """Built-in limits: hashing routes get one slot per hashing pool worker"""
+    hash_workers = int(os.environ.get('PASSWORD_HASH_WORKERS', os.cpu_count() or 1))
+    return {
+        'hashing': (hash_workers, 2 * hash_workers),
+        'import': (1, 1),
+        'export': (2, 2)
+    }
+
+def init_admission(app, limits=None, routes=None, timeout=None, registry=REGISTRY):
+    """
+    Apply admission control to every route of app that has a class.
+
+    Returns:
+        dict: {class: AdmissionLimiter}
+    """
+    if limits is None:
+        limits = dict(default_limits(), **parse_limits(os.environ.get('ADMISSION_LIMITS')))
+    if routes is None:
+        routes = parse_routes(os.environ.get('ADMISSION_ROUTES'))
+    if timeout is None:
+        timeout = float(os.environ.get('ADMISSION_QUEUE_TIMEOUT_MS', '5000')) / 1000
+    limiters = {
+        name: AdmissionLimiter(name, concurrency, max_queue, timeout)
+        for name, (concurrency, max_queue) in limits.items()
+    }
+
+    rejections = registry.counter(
+        'admission_rejections_total', 'Requests refused by admission control.', ['class', 'reason'])
+    queue_time = registry.histogram(
+        'admission_queue_seconds', 'Time requests waited for an admission slot.', ['class'])
+    registry.gauge('admission_queue_depth', 'Requests waiting for an admission slot.', ['class'],
+                   function=lambda: {(name,): limiter.waiting for name, limiter in limiters.items()})
+
+    def limiter_for_request():
+        endpoint = request.endpoint
+        name = routes.get(endpoint)
+        if name is None:
+            view = app.view_functions.get(endpoint)
+            name = getattr(view, 'admission_class', None)
+        return limiters.get(name)
+
+    @app.before_request
+    def _admit():
+        limiter = limiter_for_request()
+        if limiter is None:
+            return None
+        start = time.perf_counter()
+        outcome = limiter.acquire()
+        admitted_at = time.perf_counter()
+        queue_time.observe(admitted_at - start, **{'class': limiter.name})
+        if outcome != ADMITTED:
+            rejections.inc(**{'class': limiter.name, 'reason': outcome})
+            return overloaded_response(limiter.retry_after())
+        g.admission = (limiter, admitted_at)
+        return None
+
+    def release(admission):
+        limiter, admitted_at = admission
+        limiter.release(time.perf_counter() - admitted_at)
+
+    @app.after_request
+    def _hold_while_streaming(response):
+        # Teardown runs as soon as the view returns, before a streamed body
+        # (an export) is sent; keep its slot until the server closes it
+        if response.is_streamed:
+            admission = g.pop('admission', None)
+            if admission is not None:
+                response.call_on_close(lambda: release(admission))
+        return response
+
+    @app.teardown_request
+    def _release(exc):
+        admission = g.pop('admission', None)
+        if admission is not None:
+            release(admission)
+
+    return limiters
@@ -0,0 +1,179 @@
+"""
+Compression Module
+Accept-Encoding-negotiated gzip/deflate for JSON, NDJSON and CSV responses
+
+Buffered responses are compressed when their body is at least
+COMPRESSION_MIN_BYTES; streamed ones (exports) are compressed chunk by chunk
+with a sync flush, so clients still receive rows as they are produced.
+
+Views marked @cache_compressed (the user listings) keep their compressed
+bodies in an LRU keyed by full path, encoding and store version. A repeat of
+the same request against an unchanged store is answered from the cache
+without running the view or compressing again; any write bumps the store
+version, which retires every cached body. COMPRESSION_CACHE_BYTES bounds the
+cache (0 disables it).
+"""
+
+import os
+import threading
+import zlib
+from collections import OrderedDict
+from flask import Response, g, request
+
+from utils.metrics import REGISTRY
+
+# zlib window bits selecting the container of each content coding
+ENCODINGS = {'gzip': 31, 'deflate': 15}
+COMPRESSIBLE_TYPES = ('application/json', 'application/x-ndjson', 'text/csv')
+
+def cache_compressed(fn):
+    """Decorator letting a view's compressed responses be cached per store version"""
+    fn.cache_compressed = True
+    return fn
+
+def compress(data, encoding, level=6):
+    """data as one complete gzip or deflate body"""
+    compressor = zlib.compressobj(level, zlib.DEFLATED, ENCODINGS[encoding])
+    return compressor.compress(data) + compressor.flush()
+
+def compress_stream(chunks, encoding, level=6):
+    """Compress an iterable of byte chunks, flushing after each so none is held back"""
+    compressor = zlib.compressobj(level, zlib.DEFLATED, ENCODINGS[encoding])
+    try:
+        for chunk in chunks:
+            data = compressor.compress(chunk) + compressor.flush(zlib.Z_SYNC_FLUSH)
+            if data:
+                yield data
+        yield compressor.flush()
+    finally:
+        close = getattr(chunks, 'close', None)
+        if close is not None:
+            close()
+
+class CompressedCache:
+    """LRU of compressed bodies for a single store version, bounded in bytes"""
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self._version = None
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key, version):
+        """(body, mimetype) cached for key at version, or None"""
+        with self._lock:
+            if version != self._version:
+                return None
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+            return entry
+
+    def put(self, key, version, body, mimetype):
+        """Cache body for key at version; bodies from an older version are discarded"""
+        if len(body) > self.max_bytes:
+            return
+        with self._lock:
+            if self._version is None or version > self._version:
+                self._entries.clear()
+                self.size = 0
+                self._version = version
+            elif version < self._version:
+                return
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self.size -= len(previous[0])
+            self._entries[key] = (body, mimetype)
+            self.size += len(body)
+            while self.size > self.max_bytes:
+                _, (evicted, _) = self._entries.popitem(last=False)
+                self.size -= len(evicted)
+
+def _compressible(response):
+    return (response.status_code == 200
+            and response.mimetype in COMPRESSIBLE_TYPES
+            and 'Content-Encoding' not in response.headers)
+
+def init_compression(app, db, min_bytes=None, level=None, cache_bytes=None, registry=REGISTRY):
+    """
+    Compress app's responses for clients that accept it.
+
+    Args:
+        db: store whose store_version() keys the cache
+
+    Returns:
+        CompressedCache or None: None when caching is disabled
+    """
+    if min_bytes is None:
+        min_bytes = int(os.environ.get('COMPRESSION_MIN_BYTES', '1024'))
+    if level is None:
+        level = int(os.environ.get('COMPRESSION_LEVEL', '6'))
+    if cache_bytes is None:
+        cache_bytes = int(os.environ.get('COMPRESSION_CACHE_BYTES', str(64 * 1024 * 1024)))
+    cache = CompressedCache(cache_bytes) if cache_bytes > 0 else None
+
+    lookups = registry.counter(
+        'compression_cache_lookups_total', 'Compressed response cache lookups.', ['result'])
+    if cache is not None:
+        registry.gauge('compression_cache_bytes', 'Bytes held by the compressed response cache.',
+                       function=lambda: cache.size)
+
+    def negotiated_encoding():
+        if request.method == 'HEAD':
+            return None
+        return request.accept_encodings.best_match(list(ENCODINGS))
+
+    @app.before_request
+    def _serve_cached():
+        encoding = negotiated_encoding()
+        g.content_encoding = encoding
+        if cache is None or encoding is None:
+            return None
+        view = app.view_functions.get(request.endpoint)
+        if not getattr(view, 'cache_compressed', False):
+            return None
+        # Read before the view runs: the body it produces is at least this new
+        key = (request.full_path, encoding)
+        version = db.store_version()
+        entry = cache.get(key, version)
+        if entry is None:
+            lookups.inc(result='miss')
+            g.compression_cache_key = (key, version)
+            return None
+        lookups.inc(result='hit')
+        body, mimetype = entry
+        response = Response(body, mimetype=mimetype)
+        response.headers['Content-Encoding'] = encoding
+        response.vary.add('Accept-Encoding')
+        return response
+
+    @app.after_request
+    def _compress(response):
+        cache_key = g.pop('compression_cache_key', None)
+        encoding = g.pop('content_encoding', None)
+        if not _compressible(response):
+            return response
+        response.vary.add('Accept-Encoding')
+        if encoding is None:
+            return response
+        if response.is_streamed:
+            response.response = compress_stream(response.iter_encoded(), encoding, level)
+            response.headers.pop('Content-Length', None)
+            response.direct_passthrough = False
+        else:
+            data = response.get_data()
+            if len(data) < min_bytes:
+                return response
+            body = compress(data, encoding, level)
+            response.set_data(body)
+            if cache is not None and cache_key is not None:
+                key, version = cache_key
+                cache.put(key, version, body, response.mimetype)
+        response.headers['Content-Encoding'] = encoding
+        return response
+
+    return cache
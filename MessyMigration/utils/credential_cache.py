@@ -0,0 +1,75 @@
+"""
+Credential Cache Module
+Short-lived cache of recently verified logins, so a client that logs in with
+the same credentials many times a minute pays for scrypt once per TTL
+
+Opt in with CREDENTIAL_CACHE_TTL=<seconds>. Nothing reversible is stored:
+each entry is an HMAC-SHA256, under a random per-process key, of the user
+id, the stored password hash and the supplied password. Because the stored
+hash is part of the MAC, a password changed by any worker makes old entries
+unusable; the service also drops entries on password change and deletion.
+At most CREDENTIAL_CACHE_SIZE users are kept (least recently used evicted).
+"""
+
+import hashlib
+import hmac
+import os
+import threading
+import time
+from collections import OrderedDict
+
+class CredentialCache:
+    """Bounded, expiring map of user id -> MAC of a verified login"""
+
+    def __init__(self, ttl, max_entries=10000):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._key = os.urandom(32)
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls):
+        """Cache configured from the environment, or None when disabled"""
+        ttl = float(os.environ.get('CREDENTIAL_CACHE_TTL', '0'))
+        if ttl <= 0:
+            return None
+        return cls(ttl, int(os.environ.get('CREDENTIAL_CACHE_SIZE', '10000')))
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _mac(self, user, password):
+        message = b'\0'.join([
+            str(user['id']).encode(),
+            user['password_hash'].encode(),
+            password.encode()
+        ])
+        return hmac.new(self._key, message, hashlib.sha256).digest()
+
+    def verify(self, user, password):
+        """True if this exact login for this stored user was verified within the TTL"""
+        with self._lock:
+            entry = self._entries.get(user['id'])
+            if entry is None:
+                return False
+            mac, expires = entry
+            if expires <= time.monotonic():
+                del self._entries[user['id']]
+                return False
+            self._entries.move_to_end(user['id'])
+        return hmac.compare_digest(mac, self._mac(user, password))
+
+    def remember(self, user, password):
+        """Record a login that passed the full password check"""
+        mac = self._mac(user, password)
+        with self._lock:
+            self._entries[user['id']] = (mac, time.monotonic() + self.ttl)
+            self._entries.move_to_end(user['id'])
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, user_id):
+        """Forget any verified login for user_id"""
+        with self._lock:
+            self._entries.pop(user_id, None)
@@ -0,0 +1,67 @@
+"""
+Password Hashing Module
+Runs werkzeug password hashing on a bounded worker pool
+"""
+
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from werkzeug.security import generate_password_hash, check_password_hash
+from utils.tracing import traced
+
+_executor = None
+_executor_lock = threading.Lock()
+_pending = 0
+
+def _get_executor():
+    """Create the shared hashing pool on first use"""
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            # scrypt releases the GIL, so threads hash in parallel
+            workers = int(os.environ.get('PASSWORD_HASH_WORKERS', os.cpu_count() or 1))
+            _executor = ThreadPoolExecutor(max_workers=workers,
+                                           thread_name_prefix='password-hash')
+        return _executor
+
+@traced('hashing')
+def hash_password(password):
+    """Hash one password on the calling thread"""
+    return generate_password_hash(password)
+
+@traced('hashing')
+def verify_password(password_hash, password):
+    """Check a password against its stored hash"""
+    return check_password_hash(password_hash, password)
+
+def queue_depth():
+    """Passwords submitted to the pool that have not finished hashing"""
+    return _pending
+
+def _track(delta):
+    global _pending
+    with _executor_lock:
+        _pending += delta
+
+@traced('hashing')
+def hash_passwords(passwords):
+    """
+    Hash a batch of passwords in parallel.
+
+    Blocks until the whole batch is done, so callers that feed one bounded
+    batch at a time never queue more work than they can hold.
+
+    Args:
+        passwords (list): plaintext passwords
+
+    Returns:
+        list: password hashes, in the same order as passwords
+    """
+    if len(passwords) <= 1:
+        return [generate_password_hash(password) for password in passwords]
+    executor = _get_executor()
+    _track(len(passwords))
+    try:
+        return list(executor.map(generate_password_hash, passwords))
+    finally:
+        _track(-len(passwords))
@@ -0,0 +1,62 @@
+"""
+Histogram Module
+Fixed-bucket latency histograms that are cheap enough for the request path
+"""
+
+import threading
+from bisect import bisect_left
+
+# Upper bounds in seconds, roughly 1-2.5-5 per decade from 50us to 10s
+DEFAULT_BUCKETS = (
+    0.00005, 0.0001, 0.00025, 0.0005,
+    0.001, 0.0025, 0.005, 0.01, 0.025, 0.05,
+    0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0
+)
+
+class LatencyHistogram:
+    """Counts observations into fixed buckets; the last bucket is +Inf"""
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, seconds):
+        """Record one observation"""
+        index = bisect_left(self.buckets, seconds)
+        with self._lock:
+            self.counts[index] += 1
+            self.count += 1
+            self.sum += seconds
+
+    def quantile(self, q):
+        """
+        Estimate the q-quantile (0 < q <= 1) as the upper bound of the
+        bucket that contains it; None when empty.
+        """
+        with self._lock:
+            counts = list(self.counts)
+            total = self.count
+        if not total:
+            return None
+        rank = q * total
+        seen = 0
+        for bound, count in zip(self.buckets + (float('inf'),), counts):
+            seen += count
+            if seen >= rank:
+                return bound
+        return float('inf')
+
+    def summary(self):
+        """Count, mean and bucketed p50/p95/p99 for reporting"""
+        with self._lock:
+            count, total = self.count, self.sum
+        return {
+            'count': count,
+            'mean': total / count if count else None,
+            'p50': self.quantile(0.5),
+            'p95': self.quantile(0.95),
+            'p99': self.quantile(0.99)
+        }
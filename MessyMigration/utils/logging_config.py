@@ -0,0 +1,220 @@
+"""
+Logging Configuration Module
+Non-blocking, structured (JSON lines) logging with request-id correlation
+
+Request threads only put records on a bounded queue; a QueueListener thread
+does the JSON encoding and the writes to stderr. When the queue is full the
+record is dropped and counted instead of blocking the request. The listener
+thread does not survive a fork (gunicorn --preload), so a forked child starts
+its own listener on a fresh queue.
+
+Configuration:
+    LOG_LEVEL       root level (default INFO)
+    LOG_LEVELS      per-module overrides, e.g. "models.shadow_db=WARNING,werkzeug=ERROR"
+    LOG_QUEUE_SIZE  records buffered before dropping (default 10000)
+"""
+
+import atexit
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import re
+import sys
+import uuid
+from contextvars import ContextVar
+from datetime import datetime, timezone
+
+REQUEST_ID_HEADER = 'X-Request-ID'
+
+# Client-supplied request ids are echoed into logs, so only accept safe tokens
+_VALID_REQUEST_ID = re.compile(r'[A-Za-z0-9._-]{1,64}')
+
+# Attributes every LogRecord has; anything else came in through extra=
+_RECORD_ATTRIBUTES = set(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {
+    'message', 'asctime', 'request_id'
+}
+
+_request_id = ContextVar('request_id', default=None)
+
+# (handler, listener) currently attached to the root logger
+_installed = None
+
+def current_request_id():
+    """Id of the request being handled, if any"""
+    return _request_id.get()
+
+class RequestIdFilter(logging.Filter):
+    """Stamps records with the current request id on the logging thread"""
+
+    def filter(self, record):
+        record.request_id = _request_id.get()
+        return True
+
+class AsyncQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler that never blocks: records are dropped when the queue is full"""
+
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+    def prepare(self, record):
+        """
+        Make the record safe to hand to another thread.
+
+        Only the %-merge of msg and args happens here (and tracebacks, which
+        pin frames); JSON encoding is left to the listener.
+        """
+        record = logging.makeLogRecord(record.__dict__)
+        record.message = record.getMessage()
+        record.msg = record.message
+        record.args = None
+        if record.exc_info:
+            if not record.exc_text:
+                record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per record, including fields passed with extra="""
+
+    def format(self, record):
+        entry = {
+            'ts': datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage()
+        }
+        request_id = getattr(record, 'request_id', None)
+        if request_id:
+            entry['request_id'] = request_id
+        for key, value in record.__dict__.items():
+            if key not in _RECORD_ATTRIBUTES:
+                entry[key] = value
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry['exc_info'] = record.exc_text
+        if record.stack_info:
+            entry['stack_info'] = record.stack_info
+        return json.dumps(entry, default=str)
+
+class DrainingQueueListener(logging.handlers.QueueListener):
+    """QueueListener whose stop() waits for room rather than failing on a full queue"""
+
+    def enqueue_sentinel(self):
+        self.queue.put(self._sentinel)
+
+def parse_levels(spec):
+    """
+    Parse "module=LEVEL,module=LEVEL" into {module: level}.
+
+    Raises:
+        ValueError: for malformed entries or unknown level names
+    """
+    levels = {}
+    for item in filter(None, (part.strip() for part in (spec or '').split(','))):
+        name, sep, level = item.partition('=')
+        level = level.strip().upper()
+        if not sep or not name.strip() or not isinstance(logging.getLevelName(level), int):
+            raise ValueError(f"Invalid log level setting: {item!r}")
+        levels[name.strip()] = level
+    return levels
+
+def configure_logging(stream=None, level=None, levels=None, queue_size=None):
+    """
+    Route all logging through a background writer; replaces any previous call.
+
+    Args:
+        stream: destination of the JSON lines (default stderr)
+        level: root level (default LOG_LEVEL or INFO)
+        levels: {module: level} overrides (default parsed from LOG_LEVELS)
+        queue_size: records buffered before dropping (default LOG_QUEUE_SIZE)
+
+    Returns:
+        AsyncQueueHandler: the handler installed on the root logger
+    """
+    global _installed
+    shutdown_logging()
+
+    level = (level or os.environ.get('LOG_LEVEL', 'INFO')).upper()
+    if levels is None:
+        levels = parse_levels(os.environ.get('LOG_LEVELS'))
+    if queue_size is None:
+        queue_size = int(os.environ.get('LOG_QUEUE_SIZE', '10000'))
+
+    writer = logging.StreamHandler(stream or sys.stderr)
+    writer.setFormatter(JsonFormatter())
+    handler = AsyncQueueHandler(queue.Queue(maxsize=queue_size))
+    handler.addFilter(RequestIdFilter())
+    listener = DrainingQueueListener(handler.queue, writer)
+
+    root = logging.getLogger()
+    root.setLevel(level)
+    for name, module_level in levels.items():
+        logging.getLogger(name).setLevel(module_level)
+    root.addHandler(handler)
+    listener.start()
+    _installed = (handler, listener)
+    return handler
+
+def shutdown_logging():
+    """Detach the queue handler and write out everything still queued"""
+    global _installed
+    if _installed is None:
+        return
+    handler, listener = _installed
+    _installed = None
+    logging.getLogger().removeHandler(handler)
+    listener.stop()
+
+def _restart_after_fork():
+    """In a forked child: the parent's listener thread is gone, so start another"""
+    global _installed
+    if _installed is None:
+        return
+    handler, listener = _installed
+    # Records already queued belong to the parent, which writes them itself
+    handler.queue = queue.Queue(maxsize=handler.queue.maxsize)
+    listener = DrainingQueueListener(handler.queue, *listener.handlers)
+    listener.start()
+    _installed = (handler, listener)
+
+atexit.register(shutdown_logging)
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_restart_after_fork)
+
+def init_logging(app):
+    """Give every request of app an id, attached to its log records and response"""
+    from flask import g, request
+
+    @app.before_request
+    def _bind_request_id():
+        supplied = request.headers.get(REQUEST_ID_HEADER, '')
+        request_id = supplied if _VALID_REQUEST_ID.fullmatch(supplied) else uuid.uuid4().hex
+        g.request_id_token = _request_id.set(request_id)
+
+    @app.after_request
+    def _echo_request_id(response):
+        request_id = _request_id.get()
+        if request_id:
+            response.headers[REQUEST_ID_HEADER] = request_id
+        return response
+
+    @app.teardown_request
+    def _unbind_request_id(exc):
+        token = g.pop('request_id_token', None)
+        if token is None:
+            return
+        try:
+            _request_id.reset(token)
+        except ValueError:
+            # Streamed responses can finish in a different context
+            _request_id.set(None)
@@ -0,0 +1,388 @@
+"""
+Metrics Module
+Low-overhead counters, gauges and histograms exposed at /metrics in the
+Prometheus text format
+
+With PROMETHEUS_MULTIPROC_DIR set, a background thread in each process
+writes its values to <dir>/metrics_<pid>.json every FLUSH_INTERVAL, and a
+scrape of any gunicorn worker merges every file, so totals cover the whole
+fleet. Counters and histograms of exited workers are kept; their live
+gauges are dropped. Store gauges are cached for STORE_STATS_INTERVAL, so
+neither flushes nor scrapes count the store each time.
+"""
+
+import json
+import logging
+import os
+import threading
+import time
+from flask import Response, g, request
+
+from utils.histogram import DEFAULT_BUCKETS, LatencyHistogram
+
+logger = logging.getLogger(__name__)
+
+# Seconds between per-process file writes; a scrape always writes first
+FLUSH_INTERVAL = 1.0
+# Seconds a store_stats() result is reused (a full count on SQLite)
+STORE_STATS_INTERVAL = 10.0
+
+def _cached(fn, max_age):
+    """Wrap fn so its result is reused for max_age seconds"""
+    lock = threading.Lock()
+    state = {'at': None, 'value': None}
+
+    def cached():
+        with lock:
+            now = time.monotonic()
+            if state['at'] is None or now - state['at'] >= max_age:
+                state['value'] = fn()
+                state['at'] = now
+            return state['value']
+    return cached
+
+def _label_key(labelnames, labels):
+    return tuple(str(labels.get(name, '')) for name in labelnames)
+
+def _escape(value):
+    return value.replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+def _format_labels(labelnames, key, extra=()):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(labelnames, key)]
+    pairs += [f'{name}="{_escape(value)}"' for name, value in extra]
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+def _format_bound(bound):
+    return '+Inf' if bound == float('inf') else repr(float(bound))
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) and not value.is_integer() else str(int(value))
+
+class Counter:
+    """Monotonically increasing value per label set"""
+
+    type = 'counter'
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        """Add amount to the counter for these labels"""
+        key = _label_key(self.labelnames, labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def samples(self):
+        with self._lock:
+            return [[list(key), value] for key, value in self._values.items()]
+
+class Gauge:
+    """
+    Point-in-time value per label set.
+
+    multiprocess_mode decides how values from several processes combine:
+    'livesum' (sum over live processes), 'max' or 'all' (one series per pid).
+    A function, if given, is called at collection time and may return a
+    number or a {label tuple: number} dict.
+    """
+
+    type = 'gauge'
+
+    def __init__(self, name, documentation, labelnames=(), multiprocess_mode='livesum',
+                 function=None):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.multiprocess_mode = multiprocess_mode
+        self.function = function
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        """Add amount to the gauge for these labels"""
+        key = _label_key(self.labelnames, labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount=1, **labels):
+        """Subtract amount from the gauge for these labels"""
+        self.inc(-amount, **labels)
+
+    def set(self, value, **labels):
+        """Set the gauge for these labels"""
+        with self._lock:
+            self._values[_label_key(self.labelnames, labels)] = value
+
+    def samples(self):
+        if self.function is not None:
+            value = self.function()
+            values = value if isinstance(value, dict) else {(): value}
+            return [[list(key), v] for key, v in values.items()]
+        with self._lock:
+            return [[list(key), value] for key, value in self._values.items()]
+
+class Histogram:
+    """Bucketed latency distribution per label set"""
+
+    type = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self._histograms = {}
+        self._lock = threading.Lock()
+
+    def observe(self, seconds, **labels):
+        """Record one observation for these labels"""
+        key = _label_key(self.labelnames, labels)
+        histogram = self._histograms.get(key)
+        if histogram is None:
+            with self._lock:
+                histogram = self._histograms.setdefault(key, LatencyHistogram(self.buckets))
+        histogram.observe(seconds)
+
+    def samples(self):
+        with self._lock:
+            histograms = list(self._histograms.items())
+        samples = []
+        for key, histogram in histograms:
+            with histogram._lock:
+                samples.append([list(key), {
+                    'counts': list(histogram.counts),
+                    'sum': histogram.sum,
+                    'count': histogram.count
+                }])
+        return samples
+
+class Registry:
+    """Collection of metrics with optional cross-process aggregation"""
+
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+        self._flusher_pid = None
+
+    def register(self, metric):
+        """Add a metric, or return the already registered one of that name"""
+        with self._lock:
+            return self._metrics.setdefault(metric.name, metric)
+
+    def counter(self, name, documentation, labelnames=()):
+        return self.register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name, documentation, labelnames=(), multiprocess_mode='livesum', function=None):
+        return self.register(Gauge(name, documentation, labelnames, multiprocess_mode, function))
+
+    def histogram(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        return self.register(Histogram(name, documentation, labelnames, buckets))
+
+    def collect(self):
+        """This process's metrics as a JSON-serializable dict"""
+        with self._lock:
+            metrics = list(self._metrics.values())
+        collected = {}
+        for metric in metrics:
+            entry = {
+                'type': metric.type,
+                'help': metric.documentation,
+                'labelnames': list(metric.labelnames),
+                'samples': metric.samples()
+            }
+            if metric.type == 'gauge':
+                entry['mode'] = metric.multiprocess_mode
+            if metric.type == 'histogram':
+                entry['buckets'] = list(metric.buckets)
+            collected[metric.name] = entry
+        return collected
+
+    def ensure_flusher(self, directory, interval=FLUSH_INTERVAL):
+        """
+        Write this process's file every interval seconds from a background
+        thread. Threads do not survive a fork (e.g. gunicorn --preload), so
+        each process starts its own on first use.
+        """
+        pid = os.getpid()
+        if self._flusher_pid == pid:
+            return
+        with self._lock:
+            if self._flusher_pid == pid:
+                return
+            self._flusher_pid = pid
+        threading.Thread(target=self._flush_forever, args=(directory, interval),
+                         name='metrics-flush', daemon=True).start()
+
+    def _flush_forever(self, directory, interval):
+        while True:
+            time.sleep(interval)
+            try:
+                self.flush(directory)
+            except Exception as e:
+                logger.warning("Could not write metrics to %s: %s", directory, e)
+
+    def flush(self, directory):
+        """Write this process's metrics to <directory>/metrics_<pid>.json"""
+        path = os.path.join(directory, f"metrics_{os.getpid()}.json")
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump({'pid': os.getpid(), 'metrics': self.collect()}, f)
+        os.replace(tmp_path, path)
+
+    def render(self, directory=None):
+        """Prometheus text exposition of this process, or of every process in directory"""
+        if directory:
+            self.flush(directory)
+            snapshots = _read_snapshots(directory)
+        else:
+            snapshots = [{'pid': os.getpid(), 'metrics': self.collect()}]
+        return _render(_merge(snapshots))
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+        return True
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+
+def _read_snapshots(directory):
+    snapshots = []
+    for filename in sorted(os.listdir(directory)):
+        if not (filename.startswith('metrics_') and filename.endswith('.json')):
+            continue
+        try:
+            with open(os.path.join(directory, filename)) as f:
+                snapshots.append(json.load(f))
+        except (OSError, ValueError):
+            continue
+    return snapshots
+
+def _merge(snapshots):
+    """Combine per-process snapshots into one {name: entry} view"""
+    merged = {}
+    for snapshot in snapshots:
+        pid = snapshot['pid']
+        alive = None
+        for name, entry in snapshot['metrics'].items():
+            target = merged.setdefault(name, dict(entry, samples={}))
+            samples = target['samples']
+            if entry['type'] == 'gauge':
+                mode = entry.get('mode', 'livesum')
+                if mode in ('livesum', 'all'):
+                    if alive is None:
+                        alive = _pid_alive(pid)
+                    if not alive:
+                        continue
+                for labels, value in entry['samples']:
+                    if mode == 'all':
+                        target['labelnames'] = entry['labelnames'] + ['pid']
+                        samples[tuple(labels) + (str(pid),)] = value
+                    elif mode == 'max':
+                        key = tuple(labels)
+                        samples[key] = max(samples.get(key, value), value)
+                    else:
+                        key = tuple(labels)
+                        samples[key] = samples.get(key, 0) + value
+            elif entry['type'] == 'histogram':
+                for labels, value in entry['samples']:
+                    key = tuple(labels)
+                    current = samples.get(key)
+                    if current is None:
+                        samples[key] = dict(value, counts=list(value['counts']))
+                    else:
+                        current['counts'] = [a + b for a, b in zip(current['counts'], value['counts'])]
+                        current['sum'] += value['sum']
+                        current['count'] += value['count']
+            else:
+                for labels, value in entry['samples']:
+                    key = tuple(labels)
+                    samples[key] = samples.get(key, 0) + value
+    return merged
+
+def _render(merged):
+    lines = []
+    for name in sorted(merged):
+        entry = merged[name]
+        labelnames = entry['labelnames']
+        lines.append(f"# HELP {name} {entry['help']}")
+        lines.append(f"# TYPE {name} {entry['type']}")
+        for key, value in sorted(entry['samples'].items()):
+            if entry['type'] != 'histogram':
+                lines.append(f"{name}{_format_labels(labelnames, key)} {_format_value(value)}")
+                continue
+            cumulative = 0
+            for bound, count in zip(entry['buckets'] + [float('inf')], value['counts']):
+                cumulative += count
+                labels = _format_labels(labelnames, key, [('le', _format_bound(bound))])
+                lines.append(f"{name}_bucket{labels} {cumulative}")
+            lines.append(f"{name}_sum{_format_labels(labelnames, key)} {repr(float(value['sum']))}")
+            lines.append(f"{name}_count{_format_labels(labelnames, key)} {value['count']}")
+    return '\n'.join(lines) + '\n'
+
+# Process-wide registry used by the app
+REGISTRY = Registry()
+
+def init_metrics(app, db=None, registry=REGISTRY):
+    """
+    Instrument every request of app and serve /metrics.
+
+    Args:
+        db: DatabaseManager whose store_stats() feed the store gauges
+    """
+    from utils.hashing import queue_depth
+
+    directory = os.environ.get('PROMETHEUS_MULTIPROC_DIR')
+    requests_total = registry.counter(
+        'http_requests_total', 'HTTP requests handled.', ['method', 'route', 'status'])
+    request_duration = registry.histogram(
+        'http_request_duration_seconds', 'Time spent handling HTTP requests.', ['method', 'route'])
+    in_flight = registry.gauge(
+        'http_requests_in_flight', 'HTTP requests currently being handled.', ['route'])
+    registry.gauge('password_hash_queue_depth',
+                   'Password hashes queued or running on the hashing pool.',
+                   function=queue_depth)
+    if db is not None:
+        store_stats = _cached(db.store_stats, STORE_STATS_INTERVAL)
+        # Each worker may hold its own in-memory store, so keep one series per pid
+        registry.gauge('user_store_rows', 'Users held by the store.',
+                       multiprocess_mode='all', function=lambda: store_stats()['rows'])
+        registry.gauge('user_store_index_entries', 'Entries per store index.', ['index'],
+                       multiprocess_mode='all',
+                       function=lambda: {(index,): size
+                                         for index, size in store_stats()['indexes'].items()})
+
+    @app.before_request
+    def _start_request_metrics():
+        if directory:
+            registry.ensure_flusher(directory)
+        g.metrics_route = request.url_rule.rule if request.url_rule else 'unmatched'
+        g.metrics_start = time.perf_counter()
+        in_flight.inc(route=g.metrics_route)
+
+    @app.after_request
+    def _record_request_metrics(response):
+        start = g.get('metrics_start')
+        if start is not None:
+            route = g.metrics_route
+            request_duration.observe(time.perf_counter() - start, method=request.method, route=route)
+            requests_total.inc(method=request.method, route=route, status=response.status_code)
+        return response
+
+    @app.teardown_request
+    def _finish_request_metrics(exc):
+        if g.get('metrics_start') is not None:
+            in_flight.dec(route=g.metrics_route)
+
+    def metrics():
+        """Prometheus scrape endpoint"""
+        return Response(registry.render(directory), mimetype='text/plain; version=0.0.4')
+
+    app.add_url_rule('/metrics', 'metrics', metrics, methods=['GET'])
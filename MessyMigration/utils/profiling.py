@@ -0,0 +1,113 @@
+"""
+Profiling Module
+On-demand cProfile capture of a single request, requested with an
+X-Profile: 1 header (or ?_profile=1) plus a valid X-Profile-Token
+
+Disabled unless PROFILING_DIR and PROFILING_TOKEN are both set. Captures
+are rate-limited per process (PROFILING_MAX_PER_MINUTE), only one request
+is profiled at a time, and at most PROFILING_MAX_FILES captures are kept.
+"""
+
+import cProfile
+import hmac
+import logging
+import os
+import threading
+import time
+import uuid
+from collections import deque
+from flask import g, request
+
+logger = logging.getLogger(__name__)
+
+PROFILE_HEADER = 'X-Profile'
+TOKEN_HEADER = 'X-Profile-Token'
+ID_HEADER = 'X-Profile-Id'
+STATUS_HEADER = 'X-Profile-Status'
+
+class SlidingWindowLimiter:
+    """Allows at most limit events per window seconds"""
+
+    def __init__(self, limit, window=60.0):
+        self.limit = limit
+        self.window = window
+        self._events = deque()
+        self._lock = threading.Lock()
+
+    def allow(self):
+        now = time.monotonic()
+        with self._lock:
+            while self._events and now - self._events[0] >= self.window:
+                self._events.popleft()
+            if len(self._events) >= self.limit:
+                return False
+            self._events.append(now)
+            return True
+
+def _prune(directory, keep):
+    """Delete the oldest captures beyond keep"""
+    captures = sorted(
+        (entry for entry in os.scandir(directory) if entry.name.endswith('.pstats')),
+        key=lambda entry: entry.stat().st_mtime
+    )
+    for entry in captures[:max(0, len(captures) - keep)]:
+        os.unlink(entry.path)
+
+def init_profiling(app):
+    """Enable per-request profiling on app if it is configured"""
+    directory = os.environ.get('PROFILING_DIR')
+    token = os.environ.get('PROFILING_TOKEN')
+    if not directory or not token:
+        return
+    os.makedirs(directory, exist_ok=True)
+    limiter = SlidingWindowLimiter(int(os.environ.get('PROFILING_MAX_PER_MINUTE', '6')))
+    max_files = int(os.environ.get('PROFILING_MAX_FILES', '100'))
+    # cProfile hooks are process-wide on newer Pythons; profile one request at a time
+    busy = threading.Lock()
+
+    def requested():
+        return request.headers.get(PROFILE_HEADER) == '1' or request.args.get('_profile') == '1'
+
+    @app.before_request
+    def _start_profile():
+        if not requested():
+            return
+        supplied = request.headers.get(TOKEN_HEADER, '')
+        if not hmac.compare_digest(supplied.encode(), token.encode()):
+            g.profile_status = 'unauthorized'
+        elif not busy.acquire(blocking=False):
+            g.profile_status = 'busy'
+        elif not limiter.allow():
+            busy.release()
+            g.profile_status = 'rate-limited'
+        else:
+            g.profiler = cProfile.Profile()
+            g.profiler.enable()
+
+    @app.after_request
+    def _finish_profile(response):
+        profiler = g.pop('profiler', None)
+        if profiler is None:
+            status = g.pop('profile_status', None)
+            if status:
+                response.headers[STATUS_HEADER] = status
+            return response
+        try:
+            profiler.disable()
+            profile_id = f"{time.strftime('%Y%m%dT%H%M%S')}-{uuid.uuid4().hex[:8]}"
+            profiler.dump_stats(os.path.join(directory, f"{profile_id}.pstats"))
+            _prune(directory, max_files)
+            response.headers[ID_HEADER] = profile_id
+            response.headers[STATUS_HEADER] = 'captured'
+            logger.info("Profiled %s %s as %s", request.method, request.path, profile_id)
+        finally:
+            busy.release()
+        return response
+
+    @app.teardown_request
+    def _abandon_profile(exc):
+        # Only reached with a live profiler when after_request never ran
+        profiler = g.pop('profiler', None)
+        if profiler is not None:
+            profiler.disable()
+            busy.release()
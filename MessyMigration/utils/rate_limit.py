@@ -0,0 +1,247 @@
+"""
+Rate Limit Module
+Sliding-window login limits per client IP and per target email, shared by
+every worker process through one memory-mapped file
+
+Counters live in a fixed-size hash table (RATE_LIMIT_SLOTS entries of 24
+bytes), so memory is bounded no matter how many keys an attacker sprays.
+Each entry keeps the counts of the current and previous window; the
+sliding-window estimate weights the previous count by how much of it still
+overlaps the window. Entries expire two windows after their last hit and
+their slots are reused; if every probed slot is live, the one expiring
+soonest is evicted.
+
+Configuration:
+    RATE_LIMIT_FILE         shared file (default user-api-ratelimit-<uid>-<checkout>-<slots> in
+                            /dev/shm, or the temp dir), so every worker of a deployment,
+                            forked with --preload or not, counts in the same table
+    RATE_LIMIT_SLOTS        table size (default 65536)
+    RATE_LIMIT_LOGIN_IP     failed logins per client IP, "limit/seconds" (default 20/60)
+    RATE_LIMIT_LOGIN_EMAIL  failed logins per email (default 5/60); "off" disables a rule
+"""
+
+import fcntl
+import hashlib
+import math
+import mmap
+import os
+import struct
+import tempfile
+import threading
+import time
+
+MAGIC = b'RLv1'
+HEADER = struct.Struct('<4sI')
+# key hash, window index, current count, previous count, expires (epoch seconds)
+SLOT = struct.Struct('<QIIII')
+
+# Slots examined per key before evicting
+MAX_PROBES = 8
+
+def default_table_path(slots):
+    """
+    Shared-memory file for this user, checkout and table size, used when
+    RATE_LIMIT_FILE is unset. The size is part of the name because opening a
+    file with another layout resets it under processes still mapping it.
+    """
+    directory = '/dev/shm' if os.path.isdir('/dev/shm') else tempfile.gettempdir()
+    project = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    checkout = hashlib.blake2b(project.encode(), digest_size=4).hexdigest()
+    return os.path.join(directory, f"user-api-ratelimit-{os.getuid()}-{checkout}-{slots}")
+
+def _key_hash(key):
+    value = int.from_bytes(hashlib.blake2b(key.encode(), digest_size=8).digest(), 'little')
+    # 0 marks an empty slot
+    return value or 1
+
+def _retry_after(window, elapsed, current, previous, limit):
+    """Seconds until the sliding estimate drops below limit with no further hits"""
+    if current < limit:
+        wait = window * (1 - (limit - current) / previous) - elapsed if previous else 0
+    else:
+        wait = (window - elapsed) + window * (1 - limit / current)
+    return max(1, math.ceil(wait))
+
+class SharedWindowTable:
+    """
+    Open-addressing table of sliding-window counters in an mmap.
+
+    With a path, processes map the same file and serialize updates with
+    flock. Without one the table is private to the process (for tests and
+    benchmarks).
+    """
+
+    def __init__(self, path=None, slots=65536):
+        self.slots = slots
+        size = HEADER.size + slots * SLOT.size
+        self.path = path
+        self._lock = threading.Lock()
+        self._fd = None
+        self._pid = os.getpid()
+        if path:
+            self._fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o600)
+            fcntl.flock(self._fd, fcntl.LOCK_EX)
+            try:
+                header = os.pread(self._fd, HEADER.size, 0)
+                if os.fstat(self._fd).st_size != size or header != HEADER.pack(MAGIC, slots):
+                    # New file or a different layout: start from an empty table
+                    os.ftruncate(self._fd, 0)
+                    os.ftruncate(self._fd, size)
+                    os.pwrite(self._fd, HEADER.pack(MAGIC, slots), 0)
+            finally:
+                fcntl.flock(self._fd, fcntl.LOCK_UN)
+            self._map = mmap.mmap(self._fd, size)
+        else:
+            self._map = mmap.mmap(-1, size)
+            HEADER.pack_into(self._map, 0, MAGIC, slots)
+
+    def _acquire(self):
+        if self._pid != os.getpid() and self._fd is not None:
+            # Forked (gunicorn --preload): a descriptor shared with the parent
+            # shares its flock too, so this process opens its own
+            self._lock = threading.Lock()
+            self._fd = os.open(self.path, os.O_RDWR)
+            self._pid = os.getpid()
+        lock, fd = self._lock, self._fd
+        lock.acquire()
+        if fd is not None:
+            fcntl.flock(fd, fcntl.LOCK_EX)
+        return lock, fd
+
+    def _release(self, held):
+        lock, fd = held
+        if fd is not None:
+            fcntl.flock(fd, fcntl.LOCK_UN)
+        lock.release()
+
+    def _find(self, key_hash, now):
+        """Offset of key_hash's slot and its values (None when not stored)"""
+        start = key_hash % self.slots
+        reusable = oldest = None
+        oldest_expiry = None
+        for probe in range(MAX_PROBES):
+            offset = HEADER.size + ((start + probe) % self.slots) * SLOT.size
+            values = SLOT.unpack_from(self._map, offset)
+            if values[0] == key_hash:
+                return offset, values
+            if reusable is None and (values[0] == 0 or values[4] <= now):
+                reusable = offset
+            if oldest_expiry is None or values[4] < oldest_expiry:
+                oldest, oldest_expiry = offset, values[4]
+        return (reusable if reusable is not None else oldest), None
+
+    def _window(self, key, window, now):
+        """Slot offset and (current, previous) counts of key in the window containing now"""
+        key_hash = _key_hash(key)
+        index = int(now // window)
+        offset, values = self._find(key_hash, now)
+        current = previous = 0
+        if values is not None:
+            if values[1] == index:
+                current, previous = values[2], values[3]
+            elif values[1] == index - 1:
+                previous = values[2]
+        return offset, key_hash, index, current, previous
+
+    def hit(self, rules, now=None):
+        """
+        Count one attempt against every (key, limit, window) rule, all or nothing.
+
+        Returns:
+            int or None: None when every rule had room (all were counted),
+            otherwise seconds to wait (nothing was counted)
+        """
+        now = time.time() if now is None else now
+        held = self._acquire()
+        try:
+            retry_after = None
+            for key, limit, window in rules:
+                _, _, index, current, previous = self._window(key, window, now)
+                elapsed = now - index * window
+                if previous * (window - elapsed) / window + current >= limit:
+                    wait = _retry_after(window, elapsed, current, previous, limit)
+                    retry_after = max(retry_after or 0, wait)
+            if retry_after is not None:
+                return retry_after
+            # Look each slot up again: an earlier rule may have claimed a free one
+            for key, _, window in rules:
+                offset, key_hash, index, current, previous = self._window(key, window, now)
+                SLOT.pack_into(self._map, offset, key_hash, index, current + 1, previous,
+                               int((index + 2) * window) + 1)
+            return None
+        finally:
+            self._release(held)
+
+    def refund(self, rules, now=None):
+        """Take back one attempt per rule counted in the current window"""
+        now = time.time() if now is None else now
+        held = self._acquire()
+        try:
+            for key, _, window in rules:
+                key_hash = _key_hash(key)
+                offset, values = self._find(key_hash, now)
+                if values is not None and values[1] == int(now // window) and values[2] > 0:
+                    SLOT.pack_into(self._map, offset, key_hash, values[1], values[2] - 1,
+                                   values[3], values[4])
+        finally:
+            self._release(held)
+
+    def live_keys(self, now=None):
+        """Number of unexpired entries"""
+        now = time.time() if now is None else now
+        return sum(
+            1 for slot in range(self.slots)
+            if SLOT.unpack_from(self._map, HEADER.size + slot * SLOT.size)[4] > now
+        )
+
+def parse_rule(spec):
+    """Parse "limit/seconds" into (limit, seconds); None for "off" or empty"""
+    if not spec or spec.strip().lower() == 'off':
+        return None
+    limit, sep, window = spec.partition('/')
+    try:
+        rule = (int(limit), float(window))
+    except ValueError:
+        rule = (0, 0)
+    if not sep or rule[0] < 1 or rule[1] <= 0:
+        raise ValueError(f"Invalid rate limit: {spec!r}")
+    return rule
+
+class LoginRateLimiter:
+    """
+    Limits failed logins per client IP and per email.
+
+    check() counts the attempt up front, so concurrent guesses cannot slip
+    past the limit while they are being hashed; succeeded() refunds it, so
+    clients that log in correctly are never throttled.
+    """
+
+    def __init__(self, table, per_ip=(20, 60.0), per_email=(5, 60.0)):
+        self.table = table
+        self.per_ip = per_ip
+        self.per_email = per_email
+
+    @classmethod
+    def from_env(cls):
+        slots = int(os.environ.get('RATE_LIMIT_SLOTS', '65536'))
+        return cls(
+            SharedWindowTable(os.environ.get('RATE_LIMIT_FILE') or default_table_path(slots), slots),
+            per_ip=parse_rule(os.environ.get('RATE_LIMIT_LOGIN_IP', '20/60')),
+            per_email=parse_rule(os.environ.get('RATE_LIMIT_LOGIN_EMAIL', '5/60'))
+        )
+
+    def _rules(self, ip, email):
+        rules = []
+        if self.per_ip:
+            rules.append((f"ip:{ip}", *self.per_ip))
+        if self.per_email:
+            rules.append((f"email:{email.strip().lower()}", *self.per_email))
+        return rules
+
+    def check(self, ip, email):
+        """Count a login attempt; returns seconds to wait if it must be refused"""
+        return self.table.hit(self._rules(ip, email))
+
+    def succeeded(self, ip, email):
+        """The attempt was a correct login: do not hold it against the client"""
+        self.table.refund(self._rules(ip, email))
@@ -0,0 +1,120 @@
+"""
+Sampling Profiler Module
+Always-on, low-overhead stack sampler writing folded-stack (flamegraph) files
+
+A background thread in each worker reads sys._current_frames() SAMPLER_HZ
+times a second and counts each thread's stack. Every SAMPLER_INTERVAL
+seconds the counts are written to <SAMPLER_DIR>/<pid>-<timestamp>.folded,
+one "frame;frame;frame count" line per distinct stack, ready for
+flamegraph.pl or speedscope. Disabled unless SAMPLER_DIR is set.
+"""
+
+import logging
+import os
+import sys
+import threading
+import time
+from collections import Counter
+
+logger = logging.getLogger(__name__)
+
+# Leaf frames of threads parked waiting for work; sampling them only adds noise
+IDLE_FRAMES = {
+    ('threading.py', 'wait'),
+    ('selectors.py', 'select'),
+    ('queue.py', 'get'),
+    ('socket.py', 'accept'),
+    ('socketserver.py', 'serve_forever')
+}
+
+def _frame_label(code):
+    name = getattr(code, 'co_qualname', code.co_name)
+    return f"{os.path.basename(code.co_filename)}:{name}"
+
+class StackSampler:
+    """Samples every other thread's stack at a fixed rate"""
+
+    def __init__(self, directory, hz=19.0, interval=60.0, max_depth=128):
+        self.directory = directory
+        self.period = 1.0 / hz
+        self.interval = interval
+        self.max_depth = max_depth
+        self.samples = Counter()
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        """Start sampling in a daemon thread"""
+        os.makedirs(self.directory, exist_ok=True)
+        self._thread = threading.Thread(target=self._run, name='stack-sampler', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Stop sampling and write out what has been collected"""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        self.flush()
+
+    def sample(self):
+        """Record one stack per thread (except the sampler itself)"""
+        own_id = threading.get_ident()
+        stacks = []
+        for thread_id, frame in sys._current_frames().items():
+            if thread_id == own_id:
+                continue
+            code = frame.f_code
+            if (os.path.basename(code.co_filename), code.co_name) in IDLE_FRAMES:
+                continue
+            labels = []
+            while frame is not None and len(labels) < self.max_depth:
+                labels.append(_frame_label(frame.f_code))
+                frame = frame.f_back
+            stacks.append(';'.join(reversed(labels)))
+        with self._lock:
+            self.samples.update(stacks)
+
+    def flush(self):
+        """Write and reset the current interval's counts; returns the path or None"""
+        with self._lock:
+            samples, self.samples = self.samples, Counter()
+        if not samples:
+            return None
+        path = os.path.join(self.directory, f"{os.getpid()}-{time.strftime('%Y%m%dT%H%M%S')}.folded")
+        with open(path, 'a') as f:
+            for stack, count in samples.most_common():
+                f.write(f"{stack} {count}\n")
+        return path
+
+    def _run(self):
+        next_flush = time.monotonic() + self.interval
+        while not self._stop.wait(self.period):
+            try:
+                self.sample()
+                if time.monotonic() >= next_flush:
+                    self.flush()
+                    next_flush += self.interval
+            except Exception as e:
+                logger.error("Error in stack sampler: %s", e)
+
+def init_sampler(app):
+    """Run a StackSampler in every worker process if SAMPLER_DIR is set"""
+    directory = os.environ.get('SAMPLER_DIR')
+    if not directory:
+        return
+    hz = float(os.environ.get('SAMPLER_HZ', '19'))
+    interval = float(os.environ.get('SAMPLER_INTERVAL', '60'))
+    state = {'pid': None}
+    lock = threading.Lock()
+
+    # Threads do not survive a fork (e.g. gunicorn --preload), so start the
+    # sampler from the first request each worker process serves
+    @app.before_request
+    def _ensure_sampler():
+        if state['pid'] == os.getpid():
+            return
+        with lock:
+            if state['pid'] != os.getpid():
+                StackSampler(directory, hz=hz, interval=interval).start()
+                state['pid'] = os.getpid()
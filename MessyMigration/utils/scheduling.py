@@ -0,0 +1,184 @@
+"""
+Scheduling Module
+Priority scheduling of user API requests between interactive and bulk traffic
+
+Every user_bp request takes one of SCHEDULER_CAPACITY slots (set it to the
+worker's thread count) before its handler runs. Requests are interactive
+unless their route is marked @priority_class('bulk') (export, import) or the
+client sends "X-Priority: bulk"; the header can only lower a request's
+priority, never raise it.
+
+When slots are free, waiting interactive requests are served first. Bulk
+requests may never hold more than the capacity left over after the
+interactive share (SCHEDULER_INTERACTIVE_SHARE), so interactive traffic
+always has that share available. Interactive requests in turn leave
+SCHEDULER_BULK_MIN slots to bulk, so bulk work keeps making progress.
+Waiting is bounded per class (SCHEDULER_QUEUE, SCHEDULER_QUEUE_TIMEOUT_MS);
+beyond that the request gets 503 with Retry-After.
+"""
+
+import math
+import os
+import threading
+import time
+from collections import deque
+from flask import g, request
+
+from utils.admission import ADMITTED, QUEUE_FULL, TIMED_OUT, overloaded_response, parse_routes
+from utils.metrics import REGISTRY
+
+INTERACTIVE = 'interactive'
+BULK = 'bulk'
+PRIORITY_HEADER = 'X-Priority'
+
+def priority_class(name):
+    """Decorator assigning a view to a priority class"""
+    def decorator(fn):
+        fn.priority_class = name
+        return fn
+    return decorator
+
+class PriorityScheduler:
+    """
+    Shared pool of slots handed out by strict priority, with per-class caps.
+
+    Args:
+        capacity: total slots
+        limits: {class: most slots the class may hold at once}
+        priorities: class names, highest priority first
+    """
+
+    def __init__(self, capacity, limits, priorities=(INTERACTIVE, BULK), max_queue=32, timeout=10.0):
+        self.capacity = capacity
+        self.limits = dict(limits)
+        self.priorities = tuple(priorities)
+        self.max_queue = max_queue
+        self.timeout = timeout
+        self.active = {name: 0 for name in self.priorities}
+        self._waiters = {name: deque() for name in self.priorities}
+        self._lock = threading.Lock()
+
+    def waiting(self, name):
+        return len(self._waiters[name])
+
+    def _can_start(self, name):
+        return (sum(self.active.values()) < self.capacity
+                and self.active[name] < self.limits[name])
+
+    def acquire(self, name):
+        """
+        Take a slot for a request of class name, waiting in line if needed.
+
+        Returns:
+            str: ADMITTED, QUEUE_FULL or TIMED_OUT
+        """
+        with self._lock:
+            # Anyone already queued in this class goes first
+            if self._can_start(name) and not self._waiters[name]:
+                self.active[name] += 1
+                return ADMITTED
+            if len(self._waiters[name]) >= self.max_queue:
+                return QUEUE_FULL
+            waiter = threading.Event()
+            self._waiters[name].append(waiter)
+        if waiter.wait(self.timeout):
+            return ADMITTED
+        with self._lock:
+            if waiter.is_set():
+                return ADMITTED
+            self._waiters[name].remove(waiter)
+            return TIMED_OUT
+
+    def release(self, name):
+        """Free a slot and start as many queued requests as now fit"""
+        with self._lock:
+            self.active[name] -= 1
+            self._dispatch()
+
+    def _dispatch(self):
+        for name in self.priorities:
+            waiters = self._waiters[name]
+            while waiters and self._can_start(name):
+                self.active[name] += 1
+                waiters.popleft().set()
+
+    def retry_after(self, name):
+        """Rough seconds until a queued request of this class would start (at least 1)"""
+        with self._lock:
+            backlog = len(self._waiters[name]) + 1
+        return max(1, math.ceil(backlog / max(self.limits[name], 1)))
+
+def scheduler_limits(capacity, interactive_share, bulk_min):
+    """
+    Per-class caps: bulk is kept out of the interactive share, interactive
+    out of the bulk minimum.
+    """
+    reserved = min(capacity - bulk_min, math.ceil(capacity * interactive_share))
+    return {INTERACTIVE: capacity - bulk_min, BULK: capacity - reserved}
+
+def init_scheduling(app, scheduler=None, blueprint='users', routes=None, registry=REGISTRY):
+    """
+    Schedule every request to blueprint through a PriorityScheduler.
+
+    Returns:
+        PriorityScheduler
+    """
+    if scheduler is None:
+        capacity = int(os.environ.get('SCHEDULER_CAPACITY', '8'))
+        bulk_min = min(int(os.environ.get('SCHEDULER_BULK_MIN', '1')), capacity - 1)
+        share = float(os.environ.get('SCHEDULER_INTERACTIVE_SHARE', '0.75'))
+        scheduler = PriorityScheduler(
+            capacity, scheduler_limits(capacity, share, bulk_min),
+            max_queue=int(os.environ.get('SCHEDULER_QUEUE', '32')),
+            timeout=float(os.environ.get('SCHEDULER_QUEUE_TIMEOUT_MS', '10000')) / 1000
+        )
+    if routes is None:
+        routes = parse_routes(os.environ.get('PRIORITY_ROUTES'))
+
+    rejections = registry.counter(
+        'scheduler_rejections_total', 'Requests refused by the priority scheduler.',
+        ['priority', 'reason'])
+    queue_time = registry.histogram(
+        'scheduler_queue_seconds', 'Time requests waited for a scheduler slot.', ['priority'])
+    registry.gauge('scheduler_active_requests', 'Requests holding a scheduler slot.', ['priority'],
+                   function=lambda: {(name,): count for name, count in scheduler.active.items()})
+
+    def priority_for_request():
+        if request.headers.get(PRIORITY_HEADER, '').lower() == BULK:
+            return BULK
+        name = routes.get(request.endpoint)
+        if name is None:
+            view = app.view_functions.get(request.endpoint)
+            name = getattr(view, 'priority_class', INTERACTIVE)
+        return name if name in scheduler.active else INTERACTIVE
+
+    @app.before_request
+    def _schedule():
+        if request.blueprint != blueprint:
+            return None
+        name = priority_for_request()
+        start = time.perf_counter()
+        outcome = scheduler.acquire(name)
+        queue_time.observe(time.perf_counter() - start, priority=name)
+        if outcome != ADMITTED:
+            rejections.inc(priority=name, reason=outcome)
+            return overloaded_response(scheduler.retry_after(name))
+        g.scheduler_slot = name
+        return None
+
+    @app.after_request
+    def _hold_while_streaming(response):
+        # As with admission: a streamed body keeps its slot until it is sent
+        if response.is_streamed:
+            name = g.pop('scheduler_slot', None)
+            if name is not None:
+                response.call_on_close(lambda: scheduler.release(name))
+        return response
+
+    @app.teardown_request
+    def _unschedule(exc):
+        name = g.pop('scheduler_slot', None)
+        if name is not None:
+            scheduler.release(name)
+
+    return scheduler
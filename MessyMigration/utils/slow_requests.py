@@ -0,0 +1,252 @@
+"""
+Slow Request Log Module
+Records user API requests that exceed a latency threshold, with a stack
+sample taken while they were still running
+
+Enabled with SLOW_REQUEST_LOG=<path>. Each request slower than
+SLOW_REQUEST_THRESHOLD_MS becomes one JSON line holding its route,
+parameters (passwords redacted), status, duration, per-layer timings (when
+TRACING_ENABLED is set) and the stack the request thread was executing when
+it crossed the threshold. The file rotates at SLOW_REQUEST_LOG_MAX_BYTES,
+keeping SLOW_REQUEST_LOG_BACKUPS old files, and is written off the request
+path like the rest of the logs. The watchdog and writer threads start in
+each process on first use, so workers forked by gunicorn --preload have
+their own.
+"""
+
+import heapq
+import itertools
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import sys
+import threading
+import time
+import traceback
+from datetime import datetime, timezone
+
+from utils.logging_config import AsyncQueueHandler, DrainingQueueListener, current_request_id
+from utils.tracing import current_trace
+
+logger = logging.getLogger(__name__)
+
+REDACTED = '[redacted]'
+
+# JSON bodies larger than this are not copied into the log
+MAX_LOGGED_BODY_BYTES = 64 * 1024
+
+def redact(value):
+    """Copy of value with every field whose name mentions a password masked"""
+    if isinstance(value, dict):
+        return {
+            key: REDACTED if 'password' in str(key).lower() else redact(item)
+            for key, item in value.items()
+        }
+    if isinstance(value, list):
+        return [redact(item) for item in value]
+    return value
+
+class StackWatchdog:
+    """
+    Samples a request thread's stack once it has run for threshold seconds.
+
+    A single thread sleeps until the earliest pending deadline, so requests
+    that finish in time cost one heap push and one dict pop.
+    """
+
+    def __init__(self, threshold):
+        self.threshold = threshold
+        self._keys = itertools.count()
+        self._start_lock = threading.Lock()
+        self._pid = None
+
+    def _ensure_running(self):
+        # Threads do not survive a fork, so each process starts its own
+        pid = os.getpid()
+        if self._pid == pid:
+            return
+        with self._start_lock:
+            if self._pid == pid:
+                return
+            self._cond = threading.Condition()
+            self._deadlines = []
+            self._active = {}
+            threading.Thread(target=self._run, name='slow-request-watchdog', daemon=True).start()
+            self._pid = pid
+
+    def watch(self):
+        """Start watching the calling thread; returns a key for unwatch()"""
+        self._ensure_running()
+        key = next(self._keys)
+        deadline = time.monotonic() + self.threshold
+        with self._cond:
+            self._active[key] = {'thread': threading.get_ident(), 'stack': None}
+            heapq.heappush(self._deadlines, (deadline, key))
+            if self._deadlines[0][1] == key:
+                self._cond.notify()
+        return key
+
+    def unwatch(self, key):
+        """Stop watching; returns the stack sample if one was taken"""
+        with self._cond:
+            entry = self._active.pop(key, None)
+        return entry['stack'] if entry else None
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._deadlines:
+                    self._cond.wait()
+                deadline, key = self._deadlines[0]
+                delay = deadline - time.monotonic()
+                if delay > 0:
+                    self._cond.wait(delay)
+                    continue
+                heapq.heappop(self._deadlines)
+                entry = self._active.get(key)
+                if entry is None:
+                    continue
+                frame = sys._current_frames().get(entry['thread'])
+            if frame is not None:
+                # Reading source lines happens outside the lock
+                entry['stack'] = [
+                    f"{summary.filename}:{summary.lineno} in {summary.name}"
+                    for summary in traceback.extract_stack(frame)
+                ]
+
+class SlowRequestLog:
+    """Rotating JSON-lines file of slow requests"""
+
+    def __init__(self, path, threshold_ms, max_bytes=10 * 1024 * 1024, backups=5):
+        self.threshold_ms = threshold_ms
+        self.watchdog = StackWatchdog(threshold_ms / 1000)
+        self._writer = logging.handlers.RotatingFileHandler(path, maxBytes=max_bytes,
+                                                            backupCount=backups)
+        self._handler = AsyncQueueHandler(queue.Queue(maxsize=1000))
+        self._listener = None
+        self._start_lock = threading.Lock()
+        self._pid = None
+        # Dedicated logger so slow-request records never reach the main log
+        self._logger = logging.Logger('slow_requests')
+        self._logger.addHandler(self._handler)
+
+    def _ensure_writer(self):
+        # The writer thread does not survive a fork either
+        pid = os.getpid()
+        if self._pid == pid:
+            return
+        with self._start_lock:
+            if self._pid == pid:
+                return
+            self._handler.queue = queue.Queue(maxsize=1000)
+            self._listener = DrainingQueueListener(self._handler.queue, self._writer)
+            self._listener.start()
+            self._pid = pid
+
+    def record(self, entry):
+        """Queue one slow-request entry for writing"""
+        self._ensure_writer()
+        self._logger.warning('%s', json.dumps(entry, default=str))
+
+    def close(self):
+        """Write out queued entries and stop the writer thread"""
+        self._logger.removeHandler(self._handler)
+        if self._listener is not None and self._pid == os.getpid():
+            self._listener.stop()
+        self._writer.close()
+
+def _request_params(request):
+    params = {'view_args': dict(request.view_args or {}), 'query': request.args.to_dict(flat=False)}
+    if request.is_json and (request.content_length or 0) <= MAX_LOGGED_BODY_BYTES:
+        body = request.get_json(silent=True)
+        if body is not None:
+            params['body'] = body
+    return redact(params)
+
+def init_slow_request_log(app, blueprint='users'):
+    """
+    Log requests to blueprint slower than the configured threshold.
+
+    Register after init_tracing so the trace is still open when the
+    per-layer timings are read.
+
+    Returns:
+        SlowRequestLog or None when SLOW_REQUEST_LOG is unset
+    """
+    path = os.environ.get('SLOW_REQUEST_LOG')
+    if not path:
+        return None
+    from flask import g, request
+
+    slow_log = SlowRequestLog(
+        path,
+        float(os.environ.get('SLOW_REQUEST_THRESHOLD_MS', '500')),
+        max_bytes=int(os.environ.get('SLOW_REQUEST_LOG_MAX_BYTES', str(10 * 1024 * 1024))),
+        backups=int(os.environ.get('SLOW_REQUEST_LOG_BACKUPS', '5'))
+    )
+
+    @app.before_request
+    def _watch_request():
+        if request.blueprint == blueprint:
+            g.slow_request_start = time.perf_counter()
+            g.slow_request_key = slow_log.watchdog.watch()
+
+    def describe(status, exc=None):
+        """Request details, read while the request context is still there"""
+        return {
+            'request_id': current_request_id(),
+            'method': request.method,
+            'route': request.url_rule.rule if request.url_rule else None,
+            'path': request.path,
+            'params': _request_params(request),
+            'status': status,
+            'layers_ms': {layer: round(ms, 3) for layer, ms in g.get('slow_request_layers', {}).items()},
+            'error': repr(exc) if exc else None
+        }
+
+    def finish(key, start, details):
+        """Stop watching the request and log it if it crossed the threshold"""
+        duration_ms = (time.perf_counter() - start) * 1000
+        stack = slow_log.watchdog.unwatch(key)
+        if duration_ms < slow_log.threshold_ms:
+            return
+        try:
+            slow_log.record(dict(
+                details(),
+                ts=datetime.now(timezone.utc).isoformat(timespec='milliseconds'),
+                duration_ms=round(duration_ms, 3),
+                threshold_ms=slow_log.threshold_ms,
+                stack=stack
+            ))
+        except Exception as e:
+            logger.error("Error recording slow request: %s", e)
+
+    @app.after_request
+    def _note_response(response):
+        if g.get('slow_request_key') is None:
+            return response
+        trace = current_trace()
+        if trace is not None:
+            g.slow_request_layers = trace.layer_durations()
+        if response.is_streamed:
+            # Teardown runs as soon as the view returns, before a streamed
+            # body (export, import) is produced; time it until the server
+            # closes the response instead
+            key, start = g.pop('slow_request_key'), g.pop('slow_request_start')
+            details = describe(response.status_code)
+            response.call_on_close(lambda: finish(key, start, lambda: details))
+        else:
+            g.slow_request_status = response.status_code
+        return response
+
+    @app.teardown_request
+    def _log_if_slow(exc):
+        key = g.pop('slow_request_key', None)
+        if key is None:
+            return
+        status = g.get('slow_request_status', 500)
+        finish(key, g.pop('slow_request_start'), lambda: describe(status, exc))
+
+    return slow_log
@@ -0,0 +1,244 @@
+"""
+Tracing Module
+Per-layer timing spans for each request, exported as OpenTelemetry JSON
+and summarized in a Server-Timing response header
+
+Tracing is switched on with TRACING_ENABLED=1 and must be set before the
+application modules are imported: when it is off, @traced returns the
+function unchanged, so disabled tracing costs nothing at call time.
+TRACE_SPANS_FILE names the file that receives one OTLP/JSON document per
+request; without it only the Server-Timing header is produced.
+"""
+
+import functools
+import json
+import logging
+import os
+import queue
+import threading
+import time
+from contextvars import ContextVar
+
+logger = logging.getLogger(__name__)
+
+TRACING_ENABLED = os.environ.get('TRACING_ENABLED', '').lower() in ('1', 'true', 'yes')
+TRACE_SPANS_FILE = os.environ.get('TRACE_SPANS_FILE')
+SERVICE_NAME = os.environ.get('TRACE_SERVICE_NAME', 'user-management-api')
+
+# Layers reported in Server-Timing, in request order
+LAYERS = ('route', 'validation', 'service', 'hashing', 'store')
+
+# OTLP span kinds
+SPAN_KIND_INTERNAL = 1
+SPAN_KIND_SERVER = 2
+
+_current_trace = ContextVar('current_trace', default=None)
+
+class Span:
+    """One timed call"""
+
+    __slots__ = ('span_id', 'parent_id', 'name', 'layer', 'start_ns', 'end_ns', 'nested')
+
+    def __init__(self, name, layer, parent, nested):
+        self.span_id = os.urandom(8).hex()
+        self.parent_id = parent.span_id if parent else None
+        self.name = name
+        self.layer = layer
+        self.nested = nested
+        self.start_ns = time.time_ns()
+        self.end_ns = None
+
+    @property
+    def duration_ms(self):
+        return (self.end_ns - self.start_ns) / 1e6
+
+class Trace:
+    """Spans collected for one request"""
+
+    def __init__(self, name):
+        self.trace_id = os.urandom(16).hex()
+        self.spans = []
+        self._stack = []
+        self.root = self.start(name, 'request')
+
+    def start(self, name, layer):
+        parent = self._stack[-1] if self._stack else None
+        # A span inside another span of the same layer would be counted twice
+        nested = any(span.layer == layer for span in self._stack)
+        span = Span(name, layer, parent, nested)
+        self.spans.append(span)
+        self._stack.append(span)
+        return span
+
+    def end(self, span):
+        span.end_ns = time.time_ns()
+        if self._stack and self._stack[-1] is span:
+            self._stack.pop()
+        elif span in self._stack:
+            self._stack.remove(span)
+
+    def layer_durations(self):
+        """Total milliseconds per layer, counting only outermost spans of each layer"""
+        totals = {}
+        for span in self.spans:
+            if span.end_ns is not None and not span.nested and span.layer != 'request':
+                totals[span.layer] = totals.get(span.layer, 0.0) + span.duration_ms
+        return totals
+
+def traced(layer, name=None):
+    """
+    Decorator recording a span in layer for each call made during a traced
+    request. Returns fn untouched when tracing is disabled.
+    """
+    def decorator(fn):
+        if not TRACING_ENABLED:
+            return fn
+        span_name = name or fn.__qualname__
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            trace = _current_trace.get()
+            if trace is None:
+                return fn(*args, **kwargs)
+            span = trace.start(span_name, layer)
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                trace.end(span)
+        return wrapper
+    return decorator
+
+def start_trace(name):
+    """Begin a trace for the current request"""
+    trace = Trace(name)
+    _current_trace.set(trace)
+    return trace
+
+def finish_trace():
+    """End the current trace and return it (None if none was started)"""
+    trace = _current_trace.get()
+    if trace is not None:
+        trace.end(trace.root)
+        _current_trace.set(None)
+    return trace
+
+def current_trace():
+    """The trace of the request being handled, if any"""
+    return _current_trace.get()
+
+def server_timing(trace):
+    """Server-Timing header value: one entry per layer plus the total"""
+    durations = trace.layer_durations()
+    entries = [f"{layer};dur={durations[layer]:.3f}" for layer in LAYERS if layer in durations]
+    entries += [f"{layer};dur={ms:.3f}" for layer, ms in durations.items() if layer not in LAYERS]
+    entries.append(f"total;dur={trace.root.duration_ms:.3f}")
+    return ', '.join(entries)
+
+def to_otlp(trace, attributes=None):
+    """Render a trace as an OTLP/JSON ExportTraceServiceRequest"""
+    def attribute_list(values):
+        return [{'key': key, 'value': {'stringValue': str(value)}} for key, value in values.items()]
+
+    spans = []
+    for span in trace.spans:
+        if span.end_ns is None:
+            continue
+        entry = {
+            'traceId': trace.trace_id,
+            'spanId': span.span_id,
+            'name': span.name,
+            'kind': SPAN_KIND_SERVER if span is trace.root else SPAN_KIND_INTERNAL,
+            'startTimeUnixNano': str(span.start_ns),
+            'endTimeUnixNano': str(span.end_ns),
+            'attributes': attribute_list(
+                dict(attributes or {}, layer=span.layer) if span is trace.root
+                else {'layer': span.layer}
+            )
+        }
+        if span.parent_id:
+            entry['parentSpanId'] = span.parent_id
+        spans.append(entry)
+    return {
+        'resourceSpans': [{
+            'resource': {'attributes': attribute_list({'service.name': SERVICE_NAME})},
+            'scopeSpans': [{'scope': {'name': __name__}, 'spans': spans}]
+        }]
+    }
+
+class SpanFileExporter:
+    """
+    Appends OTLP/JSON lines to a file from a background thread.
+
+    The thread starts with the first export in each process: one started
+    before a fork (gunicorn --preload) would not exist in the workers.
+    """
+
+    def __init__(self, path, max_queue=10000):
+        self.path = path
+        self.max_queue = max_queue
+        self.dropped = 0
+        self._start_lock = threading.Lock()
+        self._pid = None
+
+    def _ensure_running(self):
+        pid = os.getpid()
+        if self._pid == pid:
+            return
+        with self._start_lock:
+            if self._pid == pid:
+                return
+            self._queue = queue.Queue(maxsize=self.max_queue)
+            threading.Thread(target=self._run, args=(self._queue,), name='span-exporter',
+                             daemon=True).start()
+            self._pid = pid
+
+    def export(self, document):
+        """Queue a document; dropped (and counted) if the writer is behind"""
+        self._ensure_running()
+        try:
+            self._queue.put_nowait(document)
+        except queue.Full:
+            self.dropped += 1
+
+    def _run(self, documents):
+        with open(self.path, 'a') as f:
+            while True:
+                document = documents.get()
+                try:
+                    f.write(json.dumps(document) + '\n')
+                    if documents.empty():
+                        f.flush()
+                except Exception as e:
+                    logger.error("Error exporting spans: %s", e)
+
+def init_tracing(app, exporter=None):
+    """Trace every request of app when tracing is enabled"""
+    if not TRACING_ENABLED:
+        return
+    from flask import request
+
+    if exporter is None and TRACE_SPANS_FILE:
+        exporter = SpanFileExporter(TRACE_SPANS_FILE)
+
+    @app.before_request
+    def _start_request_trace():
+        rule = request.url_rule.rule if request.url_rule else 'unmatched'
+        start_trace(f"{request.method} {rule}")
+
+    @app.after_request
+    def _finish_request_trace(response):
+        trace = finish_trace()
+        if trace is not None:
+            response.headers['Server-Timing'] = server_timing(trace)
+            if exporter is not None:
+                exporter.export(to_otlp(trace, {
+                    'http.method': request.method,
+                    'http.route': request.url_rule.rule if request.url_rule else 'unmatched',
+                    'http.status_code': response.status_code
+                }))
+        return response
+
+    @app.teardown_request
+    def _discard_request_trace(exc):
+        # after_request does not run when the request errors out of Flask
+        _current_trace.set(None)
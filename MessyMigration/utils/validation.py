@@ -1,4 +1,5 @@
 import re
+from utils.tracing import traced
 
 def sanitize_input(data):
     """Sanitize input data to prevent injection attacks"""
@@ -41,6 +42,7 @@ def validate_name(name):
         return False, "Name contains invalid characters"
     return True, "Name is valid"
 
+@traced('validation')
 def validate_user_data(data, partial=False):
     """
     Validates user data for creation or update.
@@ -101,6 +103,8 @@ def validate_user_data(data, partial=False):
         return {"valid": False, "message": "; ".join(errors)}
 
     return {"valid": True, "message": "Validation passed"}
+
+@traced('validation')
 def validate_login_data(data):
     """Validate login request payload"""
     if not data: